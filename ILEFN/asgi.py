@@ -5,6 +5,18 @@ It exposes the ASGI callable as a module-level variable named ``application``.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
+
+To serve the candidate flow with async views, run gunicorn with uvicorn
+workers and ASYNC_VIEWS=True:
+
+    ASYNC_VIEWS=True gunicorn ILEFN.asgi -k uvicorn.workers.UvicornWorker \
+        --bind 0.0.0.0:$PORT --workers 2 --log-file -
+
+In this mode database connections come from a psycopg 3 pool of up to
+DB_POOL_SIZE connections per worker (CONN_MAX_AGE is not used), and
+certificates are rendered on the CERTIFICATE_WORKERS thread pool.
+On CPU-bound hosts the sync WSGI setup in the Procfile is still faster per
+worker; the async mode pays off when requests wait on slow clients or I/O.
 """
 
 import os
@@ -14,3 +26,9 @@ from django.core.asgi import get_asgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'ILEFN.settings')
 
 application = get_asgi_application()
+
+
+# Load certificate templates and fonts once per worker process
+from main.utils import warm_certificate_renderers  # noqa: E402
+
+warm_certificate_renderers()
@@ -12,6 +12,7 @@ https://docs.djangoproject.com/en/5.2/ref/settings/
 
 from pathlib import Path
 import os
+import tempfile
 import dj_database_url
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -48,7 +49,8 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
-    'whitenoise.middleware.WhiteNoiseMiddleware',
+    'main.middleware.AsyncWhiteNoiseMiddleware',
+    'main.middleware.RequestInstrumentationMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -81,21 +83,43 @@ WSGI_APPLICATION = 'ILEFN.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
+# Serve the candidate flow with the async views in main/async_views.py;
+# enable when running under ASGI (uvicorn workers, see the ILEFN/asgi.py docstring)
+ASYNC_VIEWS = os.environ.get('ASYNC_VIEWS', 'False') == 'True'
+
 if os.environ.get('DATABASE_URL'):
     # Production database (Railway PostgreSQL)
     DATABASES = {
         'default': dj_database_url.config(
             default=os.environ.get('DATABASE_URL'),
-            conn_max_age=600,
+            # Async views run ORM calls in per-request threads, so persistent
+            # connections would pile up; under ASGI connections come from a pool
+            conn_max_age=0 if ASYNC_VIEWS else 600,
             conn_health_checks=True,
         )
     }
+    if ASYNC_VIEWS and DATABASES['default']['ENGINE'] == 'django.db.backends.postgresql':
+        # psycopg 3 pool (Django 5.1+): a per-request connection would otherwise
+        # start a new PostgreSQL backend, with cold caches, on every request
+        DATABASES['default']['OPTIONS'] = {
+            'pool': {
+                'min_size': 2,
+                'max_size': int(os.environ.get('DB_POOL_SIZE', 10)),
+                'timeout': 10,
+            },
+        }
 else:
     # Development database (SQLite)
     DATABASES = {
         'default': {
             'ENGINE': 'django.db.backends.sqlite3',
             'NAME': BASE_DIR / 'db.sqlite3',
+            # Take the write lock when a transaction starts, so concurrent writers
+            # wait for it instead of failing with "database is locked"
+            'OPTIONS': {
+                'transaction_mode': 'IMMEDIATE',
+                'timeout': 20,
+            },
         }
     }
 
@@ -150,6 +174,29 @@ MEDIA_URL = '/media/'
 # Default primary key field type
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
+# Certificates are rendered by a background thread pool after submission;
+# set CERTIFICATE_ASYNC=False to render inline (e.g. for debugging)
+CERTIFICATE_ASYNC = os.environ.get('CERTIFICATE_ASYNC', 'True') == 'True'
+CERTIFICATE_WORKERS = int(os.environ.get('CERTIFICATE_WORKERS', 2))
+
+# Certificate file encoding per test type: png (default), png-fast, png-small,
+# webp or jpeg; see benchmark_certificates for encode time and size of each.
+# Run regenerate_certificates after changing it to convert existing files.
+CERTIFICATE_ENCODING = {
+    'adult': os.environ.get('CERTIFICATE_ENCODING_ADULT', 'png'),
+    'junior': os.environ.get('CERTIFICATE_ENCODING_JUNIOR', 'png'),
+}
+
+# Requests slower than this are logged as JSON with their slowest queries
+SLOW_REQUEST_MS = int(os.environ.get('SLOW_REQUEST_MS', 500))
+
+# Prometheus metrics: every worker writes its counters to this SQLite file,
+# /metrics sums them and is only served to staff users, or to scrapers sending
+# "Authorization: Bearer <METRICS_TOKEN>" when a token is set
+METRICS_DB = os.environ.get('METRICS_DB', os.path.join(tempfile.gettempdir(), 'ilefn-metrics.sqlite3'))
+METRICS_FLUSH_INTERVAL = float(os.environ.get('METRICS_FLUSH_INTERVAL', 5))
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN', '')
+
 
 import os
 if not os.path.exists(STATIC_ROOT):
@@ -14,3 +14,9 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'ILEFN.settings')
 
 application = get_wsgi_application()
+
+
+# Load certificate templates and fonts once per worker process
+from main.utils import warm_certificate_renderers  # noqa: E402
+
+warm_certificate_renderers()
@@ -0,0 +1,347 @@
+"""
+Async variants of the candidate-facing views, used when the project is served
+over ASGI (uvicorn workers) with ASYNC_VIEWS=True. They behave exactly like the
+sync views in views.py, but database reads use the async ORM, transactional
+writes (submission, session clock) run via sync_to_async, certificate files
+are checked and streamed in a thread and only missing ones are rendered on the
+certificate thread pool, so a worker can keep many slow candidates in flight
+at once.
+"""
+from asgiref.sync import sync_to_async
+from django.http import HttpResponse
+from django.shortcuts import render, redirect
+
+from .certificates import acertificate_response, athumbnail_response, certificate_thumbnail_url
+from .forms import TestRegistrationForm, JuniorTestRegistrationForm
+from .models import TestRegistration, Question, TestSession, TestResult
+from .models import JuniorTestRegistration, JuniorQuestion, JuniorTestSession, JuniorTestResult
+from .scoring import get_scoring_plan
+from .services import InvalidAnswer, SessionAlreadySubmitted, start_session_clock, submit_test
+from . import views
+
+
+async def get_session(session_model, session_id, **filters):
+    """Session of the cookie with its registration, or None"""
+    try:
+        return await session_model.objects.select_related('registration').aget(id=session_id, **filters)
+    except (session_model.DoesNotExist, ValueError):
+        return None
+
+
+async def get_result(result_model, session_id):
+    """Result of a completed session with session and registration, or None"""
+    try:
+        return await result_model.objects.select_related('session__registration').aget(
+            session_id=session_id, session__is_completed=True
+        )
+    except (result_model.DoesNotExist, ValueError):
+        return None
+
+
+class TestRegistrationView(views.TestRegistrationView):
+    """View for test registration"""
+
+    async def get(self, request):
+        return super().get(request)
+
+    async def post(self, request):
+        form = self.form_class(request.POST)
+
+        # clean_email queries the registrations table
+        if await sync_to_async(form.is_valid)():
+            email = form.cleaned_data['email']
+            name = form.cleaned_data['name']
+
+            # Check if registration exists
+            registration, created = await TestRegistration.objects.aget_or_create(
+                email=email,
+                defaults={'name': name, 'has_taken_test': False}
+            )
+
+            if not created and registration.has_taken_test:
+                # User already took the test
+                context = {
+                    'form': self.form_class(),
+                    'page_title': 'التسجيل بالاختبار - ILEFN',
+                    'error_message': 'هذا البريد الإلكتروني قد قام بالاختبار من قبل. كل بريد إلكتروني يمكنه إجراء الاختبار مرة واحدة فقط.'
+                }
+                return render(request, self.template_name, context)
+
+            # Update name if it changed
+            if not created:
+                registration.name = name
+                await registration.asave()
+
+            # Create or get test session
+            session, _ = await TestSession.objects.aget_or_create(
+                registration=registration,
+                defaults={'is_completed': False}
+            )
+
+            # Store session ID in cookie and redirect to test
+            response = redirect('take_test')
+            response.set_cookie('test_session_id', session.id, max_age=86400)  # 24 hours
+            return response
+
+        context = {
+            'form': form,
+            'page_title': 'التسجيل بالاختبار - ILEFN',
+        }
+        return render(request, self.template_name, context)
+
+
+async def take_test(request):
+    """View for taking the test"""
+    session_id = request.COOKIES.get('test_session_id')
+    if not session_id:
+        return redirect('test_registration')
+
+    session = await get_session(TestSession, session_id, is_completed=False)
+    if session is None:
+        return redirect('test_registration')
+
+    if request.method == 'POST' or session.is_expired():
+        # Score and save the submission in one transaction (unanswered questions get 0);
+        # past the deadline only the autosaved answers count
+        try:
+            await sync_to_async(submit_test)('adult', session, request.POST)
+        except InvalidAnswer:
+            return HttpResponse('إجابات غير صالحة', status=400)
+        except SessionAlreadySubmitted:
+            pass
+        return redirect('test_result')
+
+    # The clock starts the first time the test page is served
+    await sync_to_async(start_session_clock)('adult', session)
+
+    plan = await sync_to_async(get_scoring_plan)('adult')
+    context = {
+        'page_title': 'اختبار ILFEN - تقييم السمات الريادية',
+        # Only evaluated when the cached question markup is missing
+        'questions': Question.objects.filter(is_active=True).select_related('trait').order_by('order', 'id'),
+        'total_questions': len(plan),
+        'bank_version': plan.version,
+        'seconds_left': int(session.time_left().total_seconds()),
+        'current_answers': plan.form_answers(session.get_answers()),
+        'session': session,
+        'answer_choices': views.ANSWER_CHOICES,
+    }
+    # Rendering may run the questions query, which is sync-only
+    return await sync_to_async(render)(request, 'main/take_test.html', context)
+
+
+async def test_result(request):
+    """View for displaying test results"""
+    session_id = request.COOKIES.get('test_session_id')
+    if not session_id:
+        return redirect('test_registration')
+
+    result = await get_result(TestResult, session_id)
+    if result is None:
+        return redirect('test_registration')
+    session = result.session
+
+    # Calculate time taken in minutes and seconds
+    time_taken_seconds = (session.completed_at - session.started_at).total_seconds()
+    time_taken_minutes = int(time_taken_seconds // 60)
+    time_taken_remaining_seconds = int(time_taken_seconds % 60)
+
+    context = {
+        'page_title': 'نتيجة المقياس - ILEFN',
+        'registration': session.registration,
+        'result': result,
+        'trait_scores': result.get_trait_scores(),
+        'time_taken': f"{time_taken_minutes} د {time_taken_remaining_seconds} ث",
+        'time_taken_minutes': time_taken_minutes,
+        'time_taken_seconds': time_taken_remaining_seconds,
+        'date': session.completed_at.strftime('%Y-%m-%d'),
+        'certificate_thumbnail_url': certificate_thumbnail_url('adult', result),
+    }
+    return render(request, 'main/test_result.html', context)
+
+
+async def download_certificate(request):
+    """View for downloading certificate"""
+    session_id = request.COOKIES.get('test_session_id')
+    if not session_id:
+        return HttpResponse('غير مصرح', status=403)
+
+    result = await get_result(TestResult, session_id)
+    if result is None:
+        return HttpResponse('لم يتم العثور على النتيجة', status=404)
+
+    try:
+        return await acertificate_response(
+            request, 'adult', result, f'ILEFN_Certificate_{result.session.registration.name}.png',
+            pdf=request.GET.get('format') == 'pdf'
+        )
+    except FileNotFoundError:
+        return HttpResponse('الشهادة غير متوفرة', status=404)
+
+
+async def certificate_thumbnail(request):
+    """Small preview of the certificate shown on the result page"""
+    session_id = request.COOKIES.get('test_session_id')
+    if not session_id:
+        return HttpResponse('غير مصرح', status=403)
+
+    result = await get_result(TestResult, session_id)
+    if result is None:
+        return HttpResponse('لم يتم العثور على النتيجة', status=404)
+
+    try:
+        return await athumbnail_response(request, 'adult', result)
+    except FileNotFoundError:
+        return HttpResponse('الشهادة غير متوفرة', status=404)
+
+
+class JuniorTestRegistrationView(views.JuniorTestRegistrationView):
+    """View for junior test registration"""
+
+    async def get(self, request):
+        return super().get(request)
+
+    async def post(self, request):
+        form = self.form_class(request.POST)
+
+        # clean_email queries the registrations table
+        if await sync_to_async(form.is_valid)():
+            email = form.cleaned_data['email']
+            name = form.cleaned_data['name']
+
+            # Check if registration exists
+            registration, created = await JuniorTestRegistration.objects.aget_or_create(
+                email=email,
+                defaults={'name': name, 'has_taken_test': False}
+            )
+
+            if not created and registration.has_taken_test:
+                # User already took the test
+                context = {
+                    'form': self.form_class(),
+                    'page_title': 'التسجيل باختبار الناشئين - ILFEN',
+                    'error_message': 'هذا البريد الإلكتروني قد قام بالاختبار من قبل. كل بريد إلكتروني يمكنه إجراء الاختبار مرة واحدة فقط.'
+                }
+                return render(request, self.template_name, context)
+
+            # Update name if it changed
+            if not created:
+                registration.name = name
+                await registration.asave()
+
+            # Create test session
+            session = await JuniorTestSession.objects.acreate(
+                registration=registration,
+                is_completed=False
+            )
+
+            # Store session ID in cookie and redirect to test
+            response = redirect('junior_take_test')
+            response.set_cookie('junior_test_session_id', session.id, max_age=86400)  # 24 hours
+            return response
+
+        context = {
+            'form': form,
+            'page_title': 'التسجيل باختبار الناشئين - ILFEN',
+        }
+        return render(request, self.template_name, context)
+
+
+async def junior_take_test(request):
+    """View for taking the junior test"""
+    session_id = request.COOKIES.get('junior_test_session_id')
+    if not session_id:
+        return redirect('junior_test_registration')
+
+    session = await get_session(JuniorTestSession, session_id, is_completed=False)
+    if session is None:
+        return redirect('junior_test_registration')
+
+    if request.method == 'POST' or session.is_expired():
+        try:
+            await sync_to_async(submit_test)('junior', session, request.POST)
+        except InvalidAnswer:
+            return HttpResponse('إجابات غير صالحة', status=400)
+        except SessionAlreadySubmitted:
+            pass
+        return redirect('junior_test_result')
+
+    await sync_to_async(start_session_clock)('junior', session)
+
+    plan = await sync_to_async(get_scoring_plan)('junior')
+    context = {
+        'page_title': 'اختبار ILFEN للناشئين - تقييم السمات الريادية',
+        'questions': JuniorQuestion.objects.filter(is_active=True).select_related('trait').order_by('order', 'id'),
+        'total_questions': len(plan),
+        'bank_version': plan.version,
+        'seconds_left': int(session.time_left().total_seconds()),
+        'current_answers': plan.form_answers(session.get_answers()),
+        'session': session,
+        'answer_choices': views.ANSWER_CHOICES,
+    }
+    return await sync_to_async(render)(request, 'main/junior_take_test.html', context)
+
+
+async def junior_test_result(request):
+    """View for displaying junior test results"""
+    session_id = request.COOKIES.get('junior_test_session_id')
+    if not session_id:
+        return redirect('junior_test_registration')
+
+    result = await get_result(JuniorTestResult, session_id)
+    if result is None:
+        return redirect('junior_test_registration')
+    session = result.session
+
+    # Format time as MM:SS
+    time_diff = (session.completed_at - session.started_at).total_seconds()
+    minutes = int(time_diff // 60)
+    seconds = int(time_diff % 60)
+
+    context = {
+        'page_title': 'نتيجة مقياس الناشئين - ILFEN',
+        'registration': session.registration,
+        'result': result,
+        'trait_scores': result.get_trait_scores(),
+        'time_taken': f"{minutes}:{seconds:02d}",
+        'time_taken_minutes': minutes,
+        'time_taken_seconds': seconds,
+        'date': session.completed_at.strftime('%Y-%m-%d'),
+        'certificate_thumbnail_url': certificate_thumbnail_url('junior', result),
+    }
+    return render(request, 'main/junior_test_result.html', context)
+
+
+async def junior_download_certificate(request):
+    """View for downloading junior certificate"""
+    session_id = request.COOKIES.get('junior_test_session_id')
+    if not session_id:
+        return HttpResponse('غير مصرح', status=403)
+
+    result = await get_result(JuniorTestResult, session_id)
+    if result is None:
+        return HttpResponse('لم يتم العثور على النتيجة', status=404)
+
+    try:
+        return await acertificate_response(
+            request, 'junior', result, f'ILEFN_Junior_Certificate_{result.session.registration.name}.png',
+            pdf=request.GET.get('format') == 'pdf'
+        )
+    except FileNotFoundError:
+        return HttpResponse('الشهادة غير متوفرة', status=404)
+
+
+async def junior_certificate_thumbnail(request):
+    """Small preview of the junior certificate shown on the result page"""
+    session_id = request.COOKIES.get('junior_test_session_id')
+    if not session_id:
+        return HttpResponse('غير مصرح', status=403)
+
+    result = await get_result(JuniorTestResult, session_id)
+    if result is None:
+        return HttpResponse('لم يتم العثور على النتيجة', status=404)
+
+    try:
+        return await athumbnail_response(request, 'junior', result)
+    except FileNotFoundError:
+        return HttpResponse('الشهادة غير متوفرة', status=404)
@@ -0,0 +1,332 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+import hashlib
+import logging
+import os
+import threading
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.db.models import F
+from django.http import FileResponse, HttpResponse
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.cache import get_conditional_response, patch_cache_control
+
+from .metrics import CERTIFICATE_DOWNLOADS, record_cache
+from .models import CertificateJob, TestResult, JuniorTestResult
+from .pdf import SubsetTooLarge
+from .utils import (
+    CERTIFICATE_CONTENT_TYPES, certificate_fields, certificate_pdf_relative_path, certificate_placeholder_thumbnail,
+    certificate_thumbnail_file, generate_certificate, generate_certificate_pdf, generate_junior_certificate,
+    generate_junior_certificate_pdf
+)
+
+
+logger = logging.getLogger(__name__)
+
+RENDERERS = {
+    'adult': (TestResult, generate_certificate),
+    'junior': (JuniorTestResult, generate_junior_certificate),
+}
+
+PDF_RENDERERS = {
+    'adult': generate_certificate_pdf,
+    'junior': generate_junior_certificate_pdf,
+}
+
+THUMBNAIL_URLS = {
+    'adult': 'certificate_thumbnail',
+    'junior': 'junior_certificate_thumbnail',
+}
+
+# Thumbnail URLs carry the certificate's content key, so a response never goes stale
+THUMBNAIL_MAX_AGE = 365 * 24 * 60 * 60
+
+# Seconds after which the browser may ask again for a thumbnail that is still being rendered
+THUMBNAIL_RETRY_AFTER = 5
+
+MAX_ATTEMPTS = 3
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    """Process-wide thread pool that renders certificates off the request path"""
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    max_workers=getattr(settings, 'CERTIFICATE_WORKERS', 2),
+                    thread_name_prefix='certificate'
+                )
+    return _executor
+
+
+def render_certificate(kind, result):
+    """
+    Render the certificate for a result now, store certificate_path and
+    mark its job as done. Returns the path relative to MEDIA_ROOT.
+    """
+    model, generate = RENDERERS[kind]
+    certificate_path = generate(result.session.registration, result)
+
+    model.objects.filter(pk=result.pk).update(certificate_path=certificate_path)
+    result.certificate_path = certificate_path
+
+    CertificateJob.objects.filter(test_type=kind, result_id=result.pk).exclude(
+        status=CertificateJob.STATUS_DONE
+    ).update(status=CertificateJob.STATUS_DONE, error='', finished_at=timezone.now())
+    return certificate_path
+
+
+def enqueue_certificate(kind, result):
+    """
+    Record a certificate job for a new result and hand it to the thread pool once
+    the surrounding transaction commits. With CERTIFICATE_ASYNC disabled the
+    job runs inline instead.
+    """
+    job = CertificateJob.objects.create(test_type=kind, result_id=result.pk)
+
+    if getattr(settings, 'CERTIFICATE_ASYNC', True):
+        transaction.on_commit(lambda: get_executor().submit(_run_job_in_thread, job.pk))
+    else:
+        transaction.on_commit(lambda: run_job(job.pk))
+    return job
+
+
+def claim_job(job_id):
+    """Atomically move a pending job to running; False if someone else took it"""
+    return CertificateJob.objects.filter(
+        pk=job_id, status=CertificateJob.STATUS_PENDING
+    ).update(
+        status=CertificateJob.STATUS_RUNNING,
+        attempts=F('attempts') + 1,
+        started_at=timezone.now()
+    ) == 1
+
+
+def run_job(job_id):
+    """Claim and run a single job. Returns True if a certificate was rendered."""
+    if not claim_job(job_id):
+        return False
+
+    job = CertificateJob.objects.get(pk=job_id)
+    model, _ = RENDERERS[job.test_type]
+    try:
+        result = model.objects.select_related('session__registration').get(pk=job.result_id)
+        render_certificate(job.test_type, result)
+    except Exception as e:
+        logger.exception('Certificate job %s failed', job_id)
+        status = CertificateJob.STATUS_FAILED if job.attempts >= MAX_ATTEMPTS else CertificateJob.STATUS_PENDING
+        CertificateJob.objects.filter(pk=job_id).update(
+            status=status, error=str(e), finished_at=timezone.now()
+        )
+        return False
+    return True
+
+
+def _run_job_in_thread(job_id):
+    # Worker threads own their connections; drop stale ones around each job
+    close_old_connections()
+    try:
+        return run_job(job_id)
+    finally:
+        close_old_connections()
+
+
+def process_pending_jobs(limit=None, stale_after=timedelta(minutes=10)):
+    """
+    Run queued jobs in creation order, e.g. those left behind by a restarted worker.
+    Jobs stuck in 'running' for longer than stale_after are retried.
+    """
+    CertificateJob.objects.filter(
+        status=CertificateJob.STATUS_RUNNING,
+        started_at__lt=timezone.now() - stale_after
+    ).update(status=CertificateJob.STATUS_PENDING)
+
+    job_ids = CertificateJob.objects.filter(
+        status=CertificateJob.STATUS_PENDING
+    ).order_by('created_at').values_list('pk', flat=True)
+    if limit:
+        job_ids = job_ids[:limit]
+
+    return sum(1 for job_id in list(job_ids) if run_job(job_id))
+
+
+def existing_certificate(result):
+    """Absolute path of the result's rendered certificate file, or None if there is none yet"""
+    if result.certificate_path:
+        certificate_full_path = os.path.join(settings.MEDIA_ROOT, result.certificate_path)
+        if os.path.exists(certificate_full_path):
+            return certificate_full_path
+    return None
+
+
+def ensure_certificate(kind, result):
+    """
+    Absolute path of the result's certificate file. If the background job has
+    not finished yet (or the file went missing) it is rendered on demand.
+    """
+    certificate_full_path = existing_certificate(result)
+    if certificate_full_path:
+        return certificate_full_path
+
+    certificate_path = render_certificate(kind, result)
+    return os.path.join(settings.MEDIA_ROOT, certificate_path)
+
+
+def existing_certificate_pdf(kind, result):
+    """Absolute path of the result's PDF certificate if it has been written, else None"""
+    fields = certificate_fields(kind, result.session.registration, result)
+    certificate_full_path = os.path.join(settings.MEDIA_ROOT, certificate_pdf_relative_path(kind, *fields))
+    if os.path.exists(certificate_full_path):
+        record_cache('certificate_pdf', True)
+        return certificate_full_path
+    return None
+
+
+def ensure_certificate_pdf(kind, result):
+    """
+    Absolute path of the result's PDF certificate. PDFs are cheap to write, so
+    the first download writes the file instead of the background job and later
+    downloads reuse it. Names with more different characters than the font
+    subset holds get the image certificate instead.
+    """
+    certificate_full_path = existing_certificate_pdf(kind, result)
+    if certificate_full_path:
+        return certificate_full_path
+
+    try:
+        certificate_path = PDF_RENDERERS[kind](result.session.registration, result)
+    except SubsetTooLarge:
+        logger.warning('PDF certificate of %s result %s falls back to the image', kind, result.pk, exc_info=True)
+        return ensure_certificate(kind, result)
+    return os.path.join(settings.MEDIA_ROOT, certificate_path)
+
+
+def existing_certificate_file(kind, result, pdf=False):
+    """Absolute path of the certificate file to serve if it is already written, else None"""
+    if pdf:
+        return existing_certificate_pdf(kind, result)
+    return existing_certificate(result)
+
+
+def certificate_file(kind, result, pdf=False):
+    """Absolute path of the certificate file to serve (the image, or the PDF with `pdf`), rendered if missing"""
+    if pdf:
+        return ensure_certificate_pdf(kind, result)
+    return ensure_certificate(kind, result)
+
+
+def certificate_file_response(request, kind, certificate_full_path, download_name):
+    """
+    Stream a certificate file with an ETag and Cache-Control header, answering
+    304 Not Modified when the browser already has this version.
+    """
+    stat = os.stat(certificate_full_path)
+    etag = '"%s"' % hashlib.sha1(
+        f'{os.path.relpath(certificate_full_path, settings.MEDIA_ROOT)}:{stat.st_size}:{stat.st_mtime_ns}'.encode()
+    ).hexdigest()
+
+    # The download gets the extension of the file: PDF or the configured image encoding
+    extension = os.path.splitext(certificate_full_path)[1].lstrip('.')
+    download_name = f'{os.path.splitext(download_name)[0]}.{extension}'
+
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        response = FileResponse(
+            open(certificate_full_path, 'rb'),
+            as_attachment=True,
+            filename=download_name,
+            content_type=CERTIFICATE_CONTENT_TYPES.get(extension, 'application/octet-stream')
+        )
+    response['ETag'] = etag
+    CERTIFICATE_DOWNLOADS.inc(test_type=kind, status=response.status_code)
+    # Certificates are personal (cookie-scoped), so only the browser may cache them
+    patch_cache_control(response, private=True, max_age=86400)
+    return response
+
+
+def certificate_response(request, kind, result, download_name, pdf=False):
+    """Serve the certificate (the image, or the PDF with `pdf`), rendering it first if it is missing"""
+    return certificate_file_response(request, kind, certificate_file(kind, result, pdf), download_name)
+
+
+def _certificate_key(certificate_path):
+    return os.path.splitext(os.path.basename(certificate_path))[0]
+
+
+def certificate_thumbnail_url(kind, result):
+    """
+    URL of the preview on the result page, versioned by the certificate's
+    content key so the browser may keep it for good. Before the background
+    job has run it is the bare endpoint, which shows a placeholder meanwhile.
+    """
+    if not result.certificate_path:
+        return reverse(THUMBNAIL_URLS[kind])
+    return f'{reverse(THUMBNAIL_URLS[kind])}?v={_certificate_key(result.certificate_path)}'
+
+
+def thumbnail_response(request, kind, result):
+    """
+    Serve the small WebP preview of the result's certificate, with long-lived
+    cache headers when the URL carries the version of the file served.
+
+    Nothing is rendered here: until the queued job has written the certificate
+    and its thumbnail, the empty template is served with 202 Accepted.
+    """
+    certificate_full_path = existing_certificate(result)
+    if certificate_full_path is None:
+        response = HttpResponse(certificate_placeholder_thumbnail(kind), status=202, content_type='image/webp')
+        response['Retry-After'] = THUMBNAIL_RETRY_AFTER
+        patch_cache_control(response, private=True, no_cache=True)
+        return response
+
+    certificate_path = os.path.relpath(certificate_full_path, settings.MEDIA_ROOT)
+    thumbnail_path = certificate_thumbnail_file(certificate_path)
+
+    response = FileResponse(open(os.path.join(settings.MEDIA_ROOT, thumbnail_path), 'rb'), content_type='image/webp')
+    # Personal like the certificate itself, so only the browser may cache it
+    if request.GET.get('v') == _certificate_key(certificate_path):
+        patch_cache_control(response, private=True, max_age=THUMBNAIL_MAX_AGE, immutable=True)
+    else:
+        patch_cache_control(response, private=True, no_cache=True)
+    return response
+
+
+def _render_in_thread(kind, result, pdf):
+    close_old_connections()
+    try:
+        return certificate_file(kind, result, pdf)
+    finally:
+        close_old_connections()
+
+
+async def acertificate_response(request, kind, result, download_name, pdf=False):
+    """
+    certificate_response for async views. Checking and streaming an existing
+    file run in a plain thread, so cached downloads never wait for renders;
+    only a missing file is rendered on the certificate thread pool (inline
+    with CERTIFICATE_ASYNC disabled).
+    """
+    certificate_full_path = await sync_to_async(existing_certificate_file, thread_sensitive=False)(kind, result, pdf)
+    if certificate_full_path is None:
+        if getattr(settings, 'CERTIFICATE_ASYNC', True):
+            certificate_full_path = await asyncio.wrap_future(
+                get_executor().submit(_render_in_thread, kind, result, pdf)
+            )
+        else:
+            certificate_full_path = await sync_to_async(certificate_file)(kind, result, pdf)
+    return await sync_to_async(certificate_file_response, thread_sensitive=False)(
+        request, kind, certificate_full_path, download_name
+    )
+
+
+async def athumbnail_response(request, kind, result):
+    """thumbnail_response for async views; it never renders, so it runs in a plain thread"""
+    return await sync_to_async(thumbnail_response, thread_sensitive=False)(request, kind, result)
@@ -0,0 +1,85 @@
+import csv
+
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+
+from .models import TestResult, Trait, JuniorTestResult, JuniorTrait
+
+
+EXPORT_MODELS = {
+    'adult': (TestResult, Trait),
+    'junior': (JuniorTestResult, JuniorTrait),
+}
+
+EXPORT_CHUNK_SIZE = 2000
+
+# Spreadsheets evaluate cells starting with these characters as formulas
+FORMULA_PREFIXES = ('=', '+', '-', '@', '\t', '\r')
+
+BASE_COLUMNS = ['#', 'الاسم', 'البريد الإلكتروني', 'الدرجة النهائية', 'الوقت المستغرق (دقائق)', 'تاريخ الاختبار']
+
+
+class Echo:
+    """File-like object whose write() hands the line back to the csv writer's caller"""
+    def write(self, value):
+        return value
+
+
+def spreadsheet_safe(value):
+    """Text cells that a spreadsheet would run as a formula are prefixed with ' (CSV injection)"""
+    if isinstance(value, str) and value.startswith(FORMULA_PREFIXES):
+        return "'" + value
+    return value
+
+
+def export_queryset(kind, queryset=None):
+    """Only the columns the export needs, in a stable order"""
+    model, _ = EXPORT_MODELS[kind]
+    if queryset is None:
+        queryset = model.objects.all()
+    return queryset.order_by('created_at', 'id').values_list(
+        'id',
+        'session__registration__name',
+        'session__registration__email',
+        'total_score',
+        'time_taken_minutes',
+        'created_at',
+        'trait_scores_json',
+    )
+
+
+def export_rows(kind, queryset=None, chunk_size=EXPORT_CHUNK_SIZE):
+    """
+    Yield the header and then one list per result, with one percentage column per
+    trait flattened from trait_scores_json. Rows are fetched with a server-side
+    iterator so memory use does not grow with the number of results.
+    """
+    _, trait_model = EXPORT_MODELS[kind]
+    trait_names = list(trait_model.objects.order_by('order', 'id').values_list('name', flat=True))
+
+    yield BASE_COLUMNS + [f'{name} (%)' for name in trait_names]
+
+    rows = export_queryset(kind, queryset).iterator(chunk_size=chunk_size)
+    for pk, name, email, total_score, minutes, created_at, trait_scores in rows:
+        trait_scores = trait_scores or {}
+        row = [pk, name, email, total_score, minutes, timezone.localtime(created_at).strftime('%Y-%m-%d %H:%M')]
+        for trait_name in trait_names:
+            percentage = trait_scores.get(trait_name, {}).get('percentage')
+            row.append('' if percentage is None else round(percentage, 2))
+        yield row
+
+
+def export_csv_response(kind, queryset=None):
+    """Stream the results of a test type as a CSV download that Excel opens with Arabic intact"""
+    writer = csv.writer(Echo())
+
+    def lines():
+        # UTF-8 BOM so Excel detects the encoding
+        yield '\ufeff'
+        for row in export_rows(kind, queryset):
+            yield writer.writerow([spreadsheet_safe(value) for value in row])
+
+    filename = f'{kind}_results_{timezone.localdate():%Y%m%d}.csv'
+    response = StreamingHttpResponse(lines(), content_type='text/csv; charset=utf-8')
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
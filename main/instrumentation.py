@@ -0,0 +1,182 @@
+from contextvars import ContextVar
+import json
+import logging
+import time
+
+from django.conf import settings
+from django.db.backends.signals import connection_created
+
+from .metrics import REQUESTS, WORKER_BUSY, collect_totals, parse_labels
+from .metrics import ROUTE_DB_TIME, ROUTE_DURATION, ROUTE_ERRORS, ROUTE_MAX_DURATION, ROUTE_MAX_QUERIES
+from .metrics import ROUTE_QUERIES, ROUTE_REQUESTS
+
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds (ms) of the latency histogram buckets; the last bucket is open-ended
+LATENCY_BUCKETS_MS = tuple(round(bound * 1000) for bound in ROUTE_DURATION.buckets[:-1])
+
+SLOW_REQUEST_TOP_QUERIES = 5
+
+_current_queries = ContextVar('current_queries', default=None)
+
+
+class QueryLog:
+    """Queries run while handling one request: count, total DB time and the SQL of each"""
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.queries = []
+
+    def add(self, sql, duration):
+        self.count += 1
+        self.duration += duration
+        self.queries.append((duration, sql))
+
+    def top(self, limit=SLOW_REQUEST_TOP_QUERIES):
+        return [
+            {'ms': round(duration * 1000, 2), 'sql': sql}
+            for duration, sql in sorted(self.queries, key=lambda query: query[0], reverse=True)[:limit]
+        ]
+
+
+def record_query(execute, sql, params, many, context):
+    """
+    execute_wrapper installed on every connection. It only measures while a
+    request is being instrumented; the context variable follows the request
+    into sync_to_async threads, so async views are counted too.
+    """
+    query_log = _current_queries.get()
+    if query_log is None:
+        return execute(sql, params, many, context)
+
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        query_log.add(sql, time.perf_counter() - started)
+
+
+def install_query_recorder(sender, connection, **kwargs):
+    # Outermost, since connection.execute_wrapper() pops the last wrapper on exit and
+    # the connection may be opened inside one
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, record_query)
+
+
+connection_created.connect(install_query_recorder, dispatch_uid='install_query_recorder')
+
+
+def start_query_log():
+    """Start collecting the queries of the current request; returns (log, reset token)"""
+    query_log = QueryLog()
+    return query_log, _current_queries.set(query_log)
+
+
+def stop_query_log(token):
+    _current_queries.reset(token)
+
+
+class RouteStats:
+    """
+    Per-route request counts, latency histogram, query counts and DB time.
+    They are recorded as metrics, so the snapshot covers every worker process
+    (each flushes to the shared metrics store every METRICS_FLUSH_INTERVAL seconds).
+    """
+    def record(self, route, status, duration_ms, queries, db_ms):
+        ROUTE_REQUESTS.inc(route=route)
+        if status >= 500:
+            ROUTE_ERRORS.inc(route=route)
+        ROUTE_DURATION.observe(duration_ms / 1000, route=route)
+        ROUTE_MAX_DURATION.observe(duration_ms / 1000, route=route)
+        ROUTE_QUERIES.inc(queries, route=route)
+        ROUTE_MAX_QUERIES.observe(queries, route=route)
+        ROUTE_DB_TIME.inc(db_ms / 1000, route=route)
+
+    def snapshot(self):
+        totals = collect_totals()
+        routes = {}
+        for (name, labels), count in totals.items():
+            if name != ROUTE_REQUESTS.name:
+                continue
+            routes[parse_labels(labels)['route']] = {
+                'count': int(count),
+                'errors': int(totals.get((ROUTE_ERRORS.name, labels), 0)),
+                'total_ms': totals.get((f'{ROUTE_DURATION.name}_sum', labels), 0.0) * 1000,
+                'max_ms': totals.get((ROUTE_MAX_DURATION.name, labels), 0.0) * 1000,
+                'queries': int(totals.get((ROUTE_QUERIES.name, labels), 0)),
+                'max_queries': int(totals.get((ROUTE_MAX_QUERIES.name, labels), 0)),
+                'db_ms': totals.get((ROUTE_DB_TIME.name, labels), 0.0) * 1000,
+                'buckets': ROUTE_DURATION.bucket_counts(totals, labels),
+            }
+        return routes
+
+
+route_stats = RouteStats()
+
+
+def bucket_percentile(buckets, fraction):
+    """Upper bound (ms) of the bucket holding the given percentile; None if open-ended or empty"""
+    total = sum(buckets)
+    if not total:
+        return None
+    needed = total * fraction
+    seen = 0
+    for index, count in enumerate(buckets):
+        seen += count
+        if seen >= needed:
+            return LATENCY_BUCKETS_MS[index] if index < len(LATENCY_BUCKETS_MS) else None
+    return None
+
+
+def route_report(snapshot):
+    """Routes ordered by the total time they took, with averages and histogram percentiles"""
+    routes = []
+    for route, stats in snapshot.items():
+        count = stats['count']
+        routes.append({
+            'route': route,
+            'count': count,
+            'errors': stats['errors'],
+            'mean_ms': round(stats['total_ms'] / count, 2),
+            'p50_ms': bucket_percentile(stats['buckets'], 0.5),
+            'p95_ms': bucket_percentile(stats['buckets'], 0.95),
+            'p99_ms': bucket_percentile(stats['buckets'], 0.99),
+            'max_ms': round(stats['max_ms'], 2),
+            'total_ms': round(stats['total_ms'], 2),
+            'mean_queries': round(stats['queries'] / count, 2),
+            'max_queries': stats['max_queries'],
+            'mean_db_ms': round(stats['db_ms'] / count, 2),
+            'histogram': dict(zip([f'le_{bound}' for bound in LATENCY_BUCKETS_MS] + ['inf'], stats['buckets'])),
+        })
+    routes.sort(key=lambda route: route['total_ms'], reverse=True)
+    return {'routes': routes}
+
+
+def route_name(request):
+    """Method and URL pattern of the request, so /director/questions/3/edit/ and /5/edit/ share a route"""
+    match = getattr(request, 'resolver_match', None)
+    route = match.route if match is not None else '<unmatched>'
+    return f'{request.method} /{route}'
+
+
+def finish_request(request, response, started, query_log):
+    """Record a finished request and log it as JSON when it exceeded SLOW_REQUEST_MS"""
+    duration_ms = (time.perf_counter() - started) * 1000
+    db_ms = query_log.duration * 1000
+    route = route_name(request)
+    route_stats.record(route, response.status_code, duration_ms, query_log.count, db_ms)
+    REQUESTS.inc()
+    WORKER_BUSY.inc(duration_ms / 1000)
+
+    if duration_ms >= settings.SLOW_REQUEST_MS:
+        logger.warning(json.dumps({
+            'event': 'slow_request',
+            'route': route,
+            'path': request.path,
+            'status': response.status_code,
+            'duration_ms': round(duration_ms, 2),
+            'queries': query_log.count,
+            'db_ms': round(db_ms, 2),
+            'top_queries': query_log.top(),
+        }, ensure_ascii=False))
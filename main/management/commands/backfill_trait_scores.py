@@ -0,0 +1,60 @@
+from django.core.management.base import BaseCommand
+
+from main.models import Trait, TestResult, TraitScore
+from main.models import JuniorTrait, JuniorTestResult, JuniorTraitScore
+
+
+BACKFILL_MODELS = {
+    'adult': (Trait, TestResult, TraitScore),
+    'junior': (JuniorTrait, JuniorTestResult, JuniorTraitScore),
+}
+
+
+class Command(BaseCommand):
+    help = 'Create TraitScore/JuniorTraitScore rows from the trait scores JSON of existing results'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--type', choices=['adult', 'junior', 'all'], default='all',
+                            help='Which test results to backfill')
+        parser.add_argument('--batch-size', type=int, default=2000, help='Results per batch')
+
+    def handle(self, *args, **options):
+        kinds = ['adult', 'junior'] if options['type'] == 'all' else [options['type']]
+
+        for kind in kinds:
+            trait_model, result_model, score_model = BACKFILL_MODELS[kind]
+
+            # Trait scores JSON is keyed by the trait's name
+            trait_ids = {}
+            for trait_id, name in trait_model.objects.order_by('-is_active', 'id').values_list('id', 'name'):
+                trait_ids.setdefault(name, trait_id)
+
+            created = skipped = 0
+            last_pk = 0
+            while True:
+                batch = list(
+                    result_model.objects.filter(pk__gt=last_pk, trait_score_rows__isnull=True)
+                    .order_by('pk').values_list('pk', 'trait_scores_json')[:options['batch_size']]
+                )
+                if not batch:
+                    break
+
+                rows = []
+                for result_id, trait_scores in batch:
+                    for name, values in (trait_scores or {}).items():
+                        if name not in trait_ids:
+                            skipped += 1
+                            continue
+                        rows.append(score_model(
+                            result_id=result_id,
+                            trait_id=trait_ids[name],
+                            percentage=values.get('percentage', 0),
+                            weighted_score=values.get('weighted_score', 0)
+                        ))
+                score_model.objects.bulk_create(rows, ignore_conflicts=True)
+                created += len(rows)
+                last_pk = batch[-1][0]
+
+            self.stdout.write(f'{kind}: {created} trait score row(s) created, {skipped} unknown trait name(s) skipped')
+
+        self.stdout.write(self.style.SUCCESS('Backfill complete'))
@@ -0,0 +1,120 @@
+import io
+import os
+import statistics
+import tempfile
+import time
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.test import override_settings
+from django.utils import timezone
+
+from main.models import TestRegistration, TestSession, TestResult
+from main.models import JuniorTestRegistration, JuniorTestSession, JuniorTestResult
+from main.utils import (
+    ADULT_CERTIFICATE, CERTIFICATE_ENCODINGS, CERTIFICATE_LAYOUTS, JUNIOR_CERTIFICATE, certificate_fields,
+    draw_certificate, generate_certificate, generate_junior_certificate
+)
+
+
+def sample_results():
+    """Unsaved adult and junior results, so the benchmark needs no database rows"""
+    now = timezone.now()
+
+    registration = TestRegistration(name='Mohammed Ahmed', email='bench@example.com')
+    session = TestSession(registration=registration, started_at=now, completed_at=now, is_completed=True)
+    result = TestResult(session=session, total_score=Decimal('76.50'), created_at=now)
+
+    junior_registration = JuniorTestRegistration(name='محمد أحمد', email='bench@example.com')
+    junior_session = JuniorTestSession(
+        registration=junior_registration, started_at=now, completed_at=now, is_completed=True
+    )
+    junior_result = JuniorTestResult(session=junior_session, total_score=Decimal('64.25'), created_at=now)
+
+    return [
+        ('adult', ADULT_CERTIFICATE, generate_certificate, registration, result),
+        ('junior', JUNIOR_CERTIFICATE, generate_junior_certificate, junior_registration, junior_result),
+    ]
+
+
+def time_renders(generate, registration, result, iterations, before_each=None):
+    """Per-certificate wall times in milliseconds"""
+    timings = []
+    for _ in range(iterations):
+        if before_each:
+            before_each()
+        started = time.perf_counter()
+        certificate_path = generate(registration, result)
+        timings.append((time.perf_counter() - started) * 1000)
+        # Certificates are content-addressed; remove the file so the next render is not a reuse
+        os.remove(os.path.join(settings.MEDIA_ROOT, certificate_path))
+    return timings
+
+
+def time_encodings(kind, registration, result, iterations):
+    """Per encoding mode: (encode times in milliseconds, file size in bytes) of one certificate"""
+    img = draw_certificate(kind, *certificate_fields(kind, registration, result))
+    measurements = {}
+    for mode, (_, _, encode) in CERTIFICATE_ENCODINGS.items():
+        timings = []
+        for _ in range(iterations):
+            buffer = io.BytesIO()
+            started = time.perf_counter()
+            encode(img, buffer)
+            timings.append((time.perf_counter() - started) * 1000)
+        measurements[mode] = (timings, buffer.tell())
+    return measurements
+
+
+def time_pdfs(kind, registration, result, iterations):
+    """PDF build times in milliseconds (template image already embedded) and the file size in bytes"""
+    renderer, _, _, date_position = CERTIFICATE_LAYOUTS[kind]
+    name, score, date_text = certificate_fields(kind, registration, result)
+    dated = (date_text, date_position) if date_text else None
+    renderer.pdf(name, score, dated)
+
+    timings = []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        data = renderer.pdf(name, score, dated)
+        timings.append((time.perf_counter() - started) * 1000)
+    return timings, len(data)
+
+
+def summarize(timings):
+    timings = sorted(timings)
+    p95 = timings[min(len(timings) - 1, int(len(timings) * 0.95))]
+    return f'mean {statistics.mean(timings):7.1f} ms  p50 {statistics.median(timings):7.1f} ms  p95 {p95:7.1f} ms'
+
+
+class Command(BaseCommand):
+    help = (
+        'Benchmark per-certificate render latency with a cold and a preloaded template/font cache, '
+        'the encode time and file size of each output encoding, and the PDF output'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=20, help='Renders per measurement')
+
+    def handle(self, *args, **options):
+        iterations = options['iterations']
+
+        with tempfile.TemporaryDirectory() as media_root, override_settings(MEDIA_ROOT=media_root):
+            for kind, renderer, generate, registration, result in sample_results():
+                # Cold: template and fonts reloaded on every render (the old behaviour)
+                cold = time_renders(generate, registration, result, iterations, before_each=renderer.reset)
+
+                renderer.load()
+                warm = time_renders(generate, registration, result, iterations)
+
+                self.stdout.write(f'{kind} certificate ({iterations} renders)')
+                self.stdout.write(f'  cold template/fonts: {summarize(cold)}')
+                self.stdout.write(f'  preloaded renderer:  {summarize(warm)}')
+
+                self.stdout.write(f'  encodings ({iterations} encodes each):')
+                for mode, (timings, size) in time_encodings(kind, registration, result, iterations).items():
+                    self.stdout.write(f'    {mode:<10} {summarize(timings)}  {size / 1024:7.1f} KiB')
+
+                timings, size = time_pdfs(kind, registration, result, iterations)
+                self.stdout.write(f'  pdf (text and template): {summarize(timings)}  {size / 1024:7.1f} KiB')
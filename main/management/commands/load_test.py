@@ -0,0 +1,306 @@
+from collections import defaultdict
+import http.client
+import os
+import random
+import re
+import threading
+import time
+import urllib.parse
+import uuid
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections
+from django.test import Client
+from django.urls import reverse
+from django.utils import timezone
+
+from main.models import CertificateJob, TestRegistration, TestResult, JuniorTestRegistration, JuniorTestResult
+from main.stats import percentile, refresh_daily_stats
+from main.utils import certificate_thumbnail_path, warm_certificate_renderers
+
+
+LOAD_TEST_EMAIL_DOMAIN = 'loadtest.invalid'
+
+ANSWER_VALUES = ['0', '0.5', '1', '1.5', '2']
+
+QUESTION_FIELD = re.compile(rb'name="(question_\d+)"')
+CSRF_FIELD = re.compile(rb'name="csrfmiddlewaretoken" value="([^"]+)"')
+
+# URL names of each candidate flow: registration, take test, result, certificate
+FLOW_URLS = {
+    'adult': ('test_registration', 'take_test', 'test_result', 'download_certificate'),
+    'junior': ('junior_test_registration', 'junior_take_test', 'junior_test_result', 'junior_download_certificate'),
+}
+
+LOAD_TEST_MODELS = {
+    'adult': (TestRegistration, TestResult),
+    'junior': (JuniorTestRegistration, JuniorTestResult),
+}
+
+
+class QueryCounter:
+    """execute_wrapper that counts the queries run on this thread's connection"""
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+class InProcessCandidate:
+    """Candidate driven through the Django test client, in this process"""
+
+    def __init__(self):
+        self.client = Client(raise_request_exception=False)
+
+    def request(self, method, path, data=None):
+        counter = QueryCounter()
+        with connection.execute_wrapper(counter):
+            if method == 'POST':
+                response = self.client.post(path, data)
+            else:
+                response = self.client.get(path)
+            if response.streaming:
+                body = b''.join(response.streaming_content)
+                response.close()
+            else:
+                body = response.content
+        return response.status_code, body, counter.count
+
+    def reset(self):
+        self.client.cookies.clear()
+
+    def close(self):
+        # Each candidate thread has its own database connection
+        connections.close_all()
+
+
+class HttpCandidate:
+    """Candidate driven over HTTP against a running server, with its own cookies"""
+
+    def __init__(self, base_url):
+        parsed = urllib.parse.urlsplit(base_url)
+        self.host, self.port = parsed.hostname, parsed.port or 80
+        self.prefix = parsed.path.rstrip('/')
+        self.cookies = {}
+        self.connection = http.client.HTTPConnection(self.host, self.port, timeout=120)
+
+    def request(self, method, path, data=None):
+        headers = {'Cookie': '; '.join(f'{name}={value}' for name, value in self.cookies.items())}
+        body = None
+        if data is not None:
+            body = urllib.parse.urlencode(data)
+            headers['Content-Type'] = 'application/x-www-form-urlencoded'
+        try:
+            self.connection.request(method, self.prefix + path, body=body, headers=headers)
+            response = self.connection.getresponse()
+            content = response.read()
+        except (OSError, http.client.HTTPException):
+            # Reconnect so the next request starts from a clean connection
+            self.connection.close()
+            self.connection = http.client.HTTPConnection(self.host, self.port, timeout=120)
+            raise
+
+        for name, value in response.getheaders():
+            if name.lower() == 'set-cookie':
+                cookie_name, cookie_value = value.split(';', 1)[0].split('=', 1)
+                self.cookies[cookie_name] = cookie_value
+        return response.status, content, None
+
+    def reset(self):
+        self.cookies = {}
+
+    def close(self):
+        self.connection.close()
+
+
+class StepStats:
+    """Latencies, query counts and errors of one flow step across all candidates"""
+    def __init__(self):
+        self.latencies = []
+        self.queries = []
+        self.errors = 0
+
+
+def csrf_data(body):
+    """Hidden CSRF token of a rendered form, for the POST that follows it"""
+    match = CSRF_FIELD.search(body)
+    return {'csrfmiddlewaretoken': match.group(1).decode()} if match else {}
+
+
+def run_flow(candidate, kind, record, rng):
+    """
+    One candidate's exam: register, load the test, submit random answers and
+    fetch the result and certificate. Raises on the first failed step.
+    """
+    registration_url, take_url, result_url, certificate_url = [reverse(name) for name in FLOW_URLS[kind]]
+
+    def step(name, method, path, data=None):
+        started = time.perf_counter()
+        try:
+            status, body, queries = candidate.request(method, path, data)
+        except Exception:
+            record(name, time.perf_counter() - started, None, failed=True)
+            raise
+        record(name, time.perf_counter() - started, queries, failed=status >= 400)
+        if status >= 400:
+            raise RuntimeError(f'{method} {path} returned {status}')
+        return body
+
+    body = step('registration form', 'GET', registration_url)
+    step('register', 'POST', registration_url, {
+        'name': 'Load Test',
+        'email': f'{uuid.uuid4().hex}@{LOAD_TEST_EMAIL_DOMAIN}',
+        **csrf_data(body),
+    })
+
+    body = step('take test', 'GET', take_url)
+    answers = {name.decode(): rng.choice(ANSWER_VALUES) for name in set(QUESTION_FIELD.findall(body))}
+    if not answers:
+        raise RuntimeError('the test page has no questions')
+    step('submit answers', 'POST', take_url, {**answers, **csrf_data(body)})
+
+    step('result', 'GET', result_url)
+    step('certificate', 'GET', certificate_url)
+
+
+def delete_load_test_data(kind):
+    """Remove the candidates a load test created, with their certificate jobs and files"""
+    registration_model, result_model = LOAD_TEST_MODELS[kind]
+    registrations = registration_model.objects.filter(email__endswith=f'@{LOAD_TEST_EMAIL_DOMAIN}')
+
+    results = list(
+        result_model.objects.filter(session__registration__in=registrations).values_list('pk', 'certificate_path')
+    )
+    certificate_paths = {certificate_path for _, certificate_path in results if certificate_path}
+    deleted, _ = registrations.delete()
+    # Jobs refer to results by id only, so they are not deleted with them
+    CertificateJob.objects.filter(test_type=kind, result_id__in=[pk for pk, _ in results]).delete()
+
+    # Certificates are content-addressed, so a file may be shared with a real result
+    still_used = set(result_model.objects.filter(certificate_path__in=certificate_paths)
+                     .values_list('certificate_path', flat=True))
+    for certificate_path in certificate_paths - still_used:
+        for path in (certificate_path, certificate_thumbnail_path(certificate_path)):
+            try:
+                os.remove(os.path.join(settings.MEDIA_ROOT, path))
+            except OSError:
+                pass
+
+    refresh_daily_stats(kind, timezone.localdate())
+    return deleted
+
+
+def format_ms(seconds):
+    return f'{seconds * 1000:9.1f}'
+
+
+class Command(BaseCommand):
+    help = (
+        'Simulate concurrent candidates taking the test (register, take, submit, result, '
+        'certificate) and report throughput, per-step latency percentiles and DB queries'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--type', choices=['adult', 'junior'], default='adult', help='Which test to take')
+        parser.add_argument('--users', type=int, default=10, help='Simultaneous candidates')
+        parser.add_argument('--duration', type=float, default=30,
+                            help='Seconds to keep starting new flows (ignored with --flows)')
+        parser.add_argument('--flows', type=int, default=None, help='Flows per candidate instead of a duration')
+        parser.add_argument('--url', default=None,
+                            help='Base URL of a running server, e.g. http://127.0.0.1:8000 '
+                                 '(default: the Django test client in this process)')
+        parser.add_argument('--seed', type=int, default=None, help='Seed for the random answers')
+        parser.add_argument('--keep', action='store_true',
+                            help='Keep the registrations, results and certificates created by the run')
+
+    def handle(self, *args, **options):
+        kind = options['type']
+        users = options['users']
+        flows_per_user = options['flows']
+        if users < 1:
+            raise CommandError('--users must be at least 1')
+        if flows_per_user is not None and flows_per_user < 1:
+            raise CommandError('--flows must be at least 1')
+
+        if options['url']:
+            make_candidate = lambda: HttpCandidate(options['url'])  # noqa: E731
+            target = options['url']
+        else:
+            # Render certificates up front, as the deployed processes do at startup
+            warm_certificate_renderers()
+            make_candidate = InProcessCandidate
+            target = f'in-process test client ({connection.vendor})'
+
+        steps = defaultdict(StepStats)
+        completed = [0]
+        failed = [0]
+        lock = threading.Lock()
+
+        def record(name, elapsed, queries, failed=False):
+            with lock:
+                stats = steps[name]
+                stats.latencies.append(elapsed)
+                if queries is not None:
+                    stats.queries.append(queries)
+                if failed:
+                    stats.errors += 1
+
+        deadline = time.perf_counter() + options['duration']
+
+        def candidate_loop(index):
+            rng = random.Random(None if options['seed'] is None else options['seed'] + index)
+            candidate = make_candidate()
+            try:
+                runs = 0
+                while (runs < flows_per_user) if flows_per_user else (time.perf_counter() < deadline):
+                    runs += 1
+                    # A new candidate (fresh cookies) for every flow
+                    candidate.reset()
+                    try:
+                        run_flow(candidate, kind, record, rng)
+                    except Exception:
+                        with lock:
+                            failed[0] += 1
+                    else:
+                        with lock:
+                            completed[0] += 1
+            finally:
+                candidate.close()
+
+        self.stdout.write(f'{users} {kind} candidates against {target}')
+        started = time.perf_counter()
+        threads = [threading.Thread(target=candidate_loop, args=(index,)) for index in range(users)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+
+        requests = sum(len(stats.latencies) for stats in steps.values())
+        self.stdout.write(
+            f'{completed[0]} flows completed, {failed[0]} failed in {elapsed:.1f}s: '
+            f'{completed[0] / elapsed:.2f} flows/s, {requests / elapsed:.1f} requests/s'
+        )
+        self.stdout.write(
+            f'{"step":<20}{"requests":>9}{"errors":>8}{"p50 ms":>9}{"p95 ms":>9}{"p99 ms":>9}{"queries":>9}'
+        )
+        for name, stats in steps.items():
+            latencies = sorted(stats.latencies)
+            queries = f'{sum(stats.queries) / len(stats.queries):9.1f}' if stats.queries else f'{"n/a":>9}'
+            self.stdout.write(
+                f'{name:<20}{len(latencies):>9}{stats.errors:>8}'
+                f'{format_ms(percentile(latencies, 0.5))}{format_ms(percentile(latencies, 0.95))}'
+                f'{format_ms(percentile(latencies, 0.99))}{queries}'
+            )
+
+        if not options['keep']:
+            deleted = delete_load_test_data(kind)
+            self.stdout.write(f'Removed load test data ({deleted} rows)')
+
+        if failed[0]:
+            self.stdout.write(self.style.WARNING(f'{failed[0]} flows failed'))
+        else:
+            self.stdout.write(self.style.SUCCESS('Load test finished'))
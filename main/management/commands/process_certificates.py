@@ -0,0 +1,27 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from main.certificates import process_pending_jobs
+
+
+class Command(BaseCommand):
+    help = 'Render queued certificates (background worker for CertificateJob rows)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Process the current queue and exit')
+        parser.add_argument('--interval', type=float, default=2.0, help='Seconds between queue polls')
+        parser.add_argument('--batch', type=int, default=50, help='Maximum jobs per poll')
+
+    def handle(self, *args, **options):
+        while True:
+            rendered = process_pending_jobs(limit=options['batch'])
+            if rendered:
+                self.stdout.write(f'Rendered {rendered} certificate(s)')
+
+            if options['once']:
+                break
+            if not rendered:
+                time.sleep(options['interval'])
+
+        self.stdout.write(self.style.SUCCESS('Certificate queue processed'))
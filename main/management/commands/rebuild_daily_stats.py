@@ -0,0 +1,30 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+
+from main.stats import rebuild_daily_stats
+
+
+class Command(BaseCommand):
+    help = ('Rebuild the DailyStats rollup table from registrations and results. '
+            'Submissions only update counters and means; run this periodically '
+            '(e.g. --since today) to refresh the median and 90th percentile.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--type', choices=['adult', 'junior', 'all'], default='all',
+                            help='Which test type to rebuild')
+        parser.add_argument('--since', help='Only rebuild days from this date on (YYYY-MM-DD)')
+
+    def handle(self, *args, **options):
+        kinds = ['adult', 'junior'] if options['type'] == 'all' else [options['type']]
+
+        since = None
+        if options['since']:
+            try:
+                since = date.fromisoformat(options['since'])
+            except ValueError:
+                raise CommandError('--since must be a date in YYYY-MM-DD format')
+
+        for kind in kinds:
+            days = rebuild_daily_stats(kind, since=since)
+            self.stdout.write(self.style.SUCCESS(f'{kind}: {days} days rebuilt'))
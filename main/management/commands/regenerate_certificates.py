@@ -0,0 +1,56 @@
+import os
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from main.regeneration import delete_stale_certificates, regenerate_certificates
+
+
+class Command(BaseCommand):
+    help = (
+        'Re-render the certificates of existing results with the current template and wording, '
+        'in parallel; interrupted runs resume where they stopped'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--type', choices=['adult', 'junior', 'all'], default='all',
+                            help='Which certificates to regenerate')
+        parser.add_argument('--processes', type=int, default=os.cpu_count() or 1,
+                            help='Worker processes (default: one per core)')
+        parser.add_argument('--chunk-size', type=int, default=500, help='Results per chunk')
+        parser.add_argument('--force', action='store_true',
+                            help='Re-render every certificate, even those already up to date')
+        parser.add_argument('--delete-stale', action='store_true',
+                            help='Afterwards delete certificate files no result points to')
+
+    def handle(self, *args, **options):
+        if options['processes'] < 1:
+            raise CommandError('--processes must be at least 1')
+        kinds = ['adult', 'junior'] if options['type'] == 'all' else [options['type']]
+        run_started = time.time()
+
+        def progress(stats):
+            self.stdout.write(
+                f'  {stats.kind}: {stats.rendered} rendered, {stats.reused} reused, '
+                f'{stats.current} up to date ({stats.per_second:.1f}/s)'
+            )
+
+        for kind in kinds:
+            stats = regenerate_certificates(
+                kind,
+                processes=options['processes'],
+                chunk_size=options['chunk_size'],
+                force=options['force'],
+                progress=progress,
+            )
+            self.stdout.write(
+                f'{kind}: {stats.rendered} rendered, {stats.reused} reused, {stats.current} already up to date '
+                f'in {stats.elapsed:.1f}s with {stats.processes} process(es): '
+                f'{stats.per_second:.1f} certificates/s, {stats.per_core:.1f} per core'
+            )
+
+            if options['delete_stale']:
+                removed = delete_stale_certificates(kind, older_than=run_started)
+                self.stdout.write(f'{kind}: {removed} stale certificate file(s) deleted')
+
+        self.stdout.write(self.style.SUCCESS('Certificates regenerated'))
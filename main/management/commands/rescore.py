@@ -0,0 +1,35 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from main.rescoring import rescore
+
+
+class Command(BaseCommand):
+    help = 'Recompute stored test results with the current traits, weights and questions'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--type', choices=['adult', 'junior', 'all'], default='all',
+                            help='Which test results to rescore')
+        parser.add_argument('--chunk-size', type=int, default=5000, help='Sessions per scoring chunk')
+        parser.add_argument('--dry-run', action='store_true', help='Report the diff without saving')
+        parser.add_argument('--show', type=int, default=20, help='Number of changed scores to list')
+
+    def handle(self, *args, **options):
+        kinds = ['adult', 'junior'] if options['type'] == 'all' else [options['type']]
+
+        for kind in kinds:
+            started = time.perf_counter()
+            changes = rescore(kind, chunk_size=options['chunk_size'], dry_run=options['dry_run'])
+            elapsed = time.perf_counter() - started
+
+            self.stdout.write(f'{kind}: {len(changes)} score(s) changed in {elapsed:.2f}s')
+            for result_id, old_score, new_score in changes[:options['show']]:
+                self.stdout.write(f'  result {result_id}: {old_score}% -> {new_score}%')
+            if len(changes) > options['show']:
+                self.stdout.write(f'  ... {len(changes) - options["show"]} more')
+
+        if options['dry_run']:
+            self.stdout.write(self.style.WARNING('Dry run: no results were saved'))
+        else:
+            self.stdout.write(self.style.SUCCESS('Rescoring complete'))
@@ -0,0 +1,36 @@
+from datetime import timedelta
+import time
+
+from django.core.management.base import BaseCommand
+
+from main.services import finalize_expired_sessions, purge_abandoned_sessions
+
+
+class Command(BaseCommand):
+    help = 'Finalize test sessions past their deadline and purge sessions that were never started'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--type', choices=['adult', 'junior', 'all'], default='all',
+                            help='Which test sessions to sweep')
+        parser.add_argument('--batch-size', type=int, default=500, help='Sessions per transaction')
+        parser.add_argument('--purge-after', type=float, default=24.0,
+                            help='Hours after which never-started sessions are deleted')
+        parser.add_argument('--interval', type=float, default=0,
+                            help='Keep running, sweeping every N seconds (default: sweep once)')
+
+    def handle(self, *args, **options):
+        kinds = ['adult', 'junior'] if options['type'] == 'all' else [options['type']]
+        older_than = timedelta(hours=options['purge_after'])
+
+        while True:
+            for kind in kinds:
+                finalized = finalize_expired_sessions(kind, batch_size=options['batch_size'])
+                purged = purge_abandoned_sessions(kind, older_than=older_than, batch_size=options['batch_size'])
+                if finalized or purged or not options['interval']:
+                    self.stdout.write(f'{kind}: {finalized} finalized, {purged} purged')
+
+            if not options['interval']:
+                break
+            time.sleep(options['interval'])
+
+        self.stdout.write(self.style.SUCCESS('Test sessions swept'))
@@ -0,0 +1,353 @@
+"""
+Prometheus-format metrics shared by all worker processes.
+
+Each process aggregates its counters and histograms in memory and a
+background thread writes them, as cumulative values keyed by process, to a
+SQLite file (settings.METRICS_DB) every METRICS_FLUSH_INTERVAL seconds. The
+/metrics view sums the rows of all processes (maxima take the largest);
+rows of processes that have exited are folded into one row so the totals
+never go backwards.
+"""
+import atexit
+import os
+import re
+import sqlite3
+import threading
+import time
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+
+
+REGISTRY = {}
+
+# Seconds: scoring is sub-millisecond, rendering takes tens to hundreds of ms
+DURATION_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+SIZE_BUCKETS = (50_000, 100_000, 200_000, 300_000, 500_000, 750_000, 1_000_000, 2_000_000)
+
+_lock = threading.Lock()
+_flush_lock = threading.Lock()
+_values = {}
+_dirty = set()
+_process = None
+_flusher_started = False
+_connection = None
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def _with_le(labels, bound):
+    return (labels + ',' if labels else '') + f'le="{_format_value(bound)}"'
+
+
+_LABEL_PATTERN = re.compile(r'(\w+)="((?:[^"\\]|\\.)*)"')
+_UNESCAPE_PATTERN = re.compile(r'\\(.)')
+
+
+def _label_string(label_names, label_values):
+    return ','.join(
+        '%s="%s"' % (name, str(value).replace('\\', r'\\').replace('\n', r'\n').replace('"', r'\"'))
+        for name, value in zip(label_names, label_values)
+    )
+
+
+def parse_labels(labels):
+    """Label values of a series, the reverse of the label string stored for it"""
+    return {
+        name: _UNESCAPE_PATTERN.sub(lambda match: '\n' if match.group(1) == 'n' else match.group(1), value)
+        for name, value in _LABEL_PATTERN.findall(labels)
+    }
+
+
+class Metric:
+    type = None
+
+    def __init__(self, name, documentation, label_names=()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        REGISTRY[name] = self
+
+    def labels_for(self, labels):
+        return _label_string(self.label_names, [labels[name] for name in self.label_names])
+
+
+class Counter(Metric):
+    type = 'counter'
+
+    def inc(self, amount=1, **labels):
+        _add([((self.name, self.labels_for(labels)), amount)])
+
+
+class Histogram(Metric):
+    type = 'histogram'
+
+    def __init__(self, name, documentation, label_names=(), buckets=DURATION_BUCKETS):
+        super().__init__(name, documentation, label_names)
+        self.buckets = tuple(buckets) + (float('inf'),)
+
+    def observe(self, value, **labels):
+        labels = self.labels_for(labels)
+        # Buckets are stored cumulatively, as they are exposed
+        increments = [((f'{self.name}_bucket', _with_le(labels, bound)), 1) for bound in self.buckets if value <= bound]
+        increments += [((f'{self.name}_count', labels), 1), ((f'{self.name}_sum', labels), value)]
+        _add(increments)
+
+    def time(self, **labels):
+        return _Timer(self, labels)
+
+    def bucket_counts(self, totals, labels):
+        """Observations per bucket (not cumulative) of one series in `totals`"""
+        cumulative = [totals.get((f'{self.name}_bucket', _with_le(labels, bound)), 0) for bound in self.buckets]
+        return [int(count - previous) for count, previous in zip(cumulative, [0] + cumulative[:-1])]
+
+
+class Maximum(Metric):
+    """Largest observed value; processes are combined by taking the largest of their maxima"""
+    type = 'gauge'
+
+    def observe(self, value, **labels):
+        key = (self.name, self.labels_for(labels))
+        with _lock:
+            if value > _values.get(key, float('-inf')):
+                _values[key] = value
+                _dirty.add(key)
+        _ensure_flusher()
+
+
+class _Timer:
+    def __init__(self, histogram, labels):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.histogram.observe(time.perf_counter() - self.started, **self.labels)
+
+
+def _add(increments):
+    """Apply (key, amount) pairs together, so a flush never sees half of an observation"""
+    with _lock:
+        for key, amount in increments:
+            _values[key] = _values.get(key, 0) + amount
+            _dirty.add(key)
+    _ensure_flusher()
+
+
+SUBMISSIONS = Counter('ilefn_submissions_total', 'Submitted tests', ['test_type'])
+SCORING_DURATION = Histogram(
+    'ilefn_scoring_duration_seconds', 'Time to parse and score a submission', ['test_type']
+)
+CERTIFICATE_RENDER_DURATION = Histogram(
+    'ilefn_certificate_render_seconds', 'Time to render and save a certificate image', ['test_type']
+)
+CERTIFICATE_SIZE = Histogram(
+    'ilefn_certificate_bytes', 'Size of rendered certificate files', ['test_type'], buckets=SIZE_BUCKETS
+)
+CERTIFICATE_DOWNLOADS = Counter(
+    'ilefn_certificate_downloads_total', 'Certificate downloads by response status', ['test_type', 'status']
+)
+CACHE_REQUESTS = Counter('ilefn_cache_requests_total', 'Cache lookups by cache and result', ['cache', 'result'])
+WORKER_BUSY = Counter('ilefn_worker_busy_seconds_total', 'Time spent handling requests, summed over workers')
+REQUESTS = Counter('ilefn_requests_total', 'Requests handled, summed over workers')
+
+# Per-route request statistics, reported as JSON by the director metrics view
+ROUTE_REQUESTS = Counter('ilefn_route_requests_total', 'Requests by route', ['route'])
+ROUTE_ERRORS = Counter('ilefn_route_errors_total', 'Requests answered with a 5xx status by route', ['route'])
+ROUTE_DURATION = Histogram(
+    'ilefn_route_duration_seconds', 'Request duration by route', ['route'],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+)
+ROUTE_MAX_DURATION = Maximum('ilefn_route_max_duration_seconds', 'Longest request by route', ['route'])
+ROUTE_QUERIES = Counter('ilefn_route_queries_total', 'Database queries by route', ['route'])
+ROUTE_MAX_QUERIES = Maximum('ilefn_route_max_queries', 'Most database queries in one request by route', ['route'])
+ROUTE_DB_TIME = Counter('ilefn_route_db_seconds_total', 'Time spent in database queries by route', ['route'])
+
+
+def record_cache(cache_name, hit):
+    CACHE_REQUESTS.inc(cache=cache_name, result='hit' if hit else 'miss')
+
+
+def _process_id():
+    """pid plus start time, so a reused pid does not overwrite a dead process's rows"""
+    global _process
+    if _process is None:
+        _process = f'{os.getpid()}:{time.time_ns()}'
+    return _process
+
+
+def _get_connection():
+    global _connection
+    if _connection is None:
+        _connection = sqlite3.connect(settings.METRICS_DB, timeout=5, check_same_thread=False,
+                                      isolation_level=None)
+        _connection.execute('PRAGMA journal_mode=WAL')
+        _connection.execute('PRAGMA synchronous=NORMAL')
+        _connection.execute(
+            'CREATE TABLE IF NOT EXISTS samples ('
+            'process TEXT NOT NULL, name TEXT NOT NULL, labels TEXT NOT NULL, value REAL NOT NULL, '
+            'PRIMARY KEY (process, name, labels))'
+        )
+    return _connection
+
+
+def flush():
+    """Write this process's changed values to the shared file"""
+    # Flushes are serialized so an older snapshot never overwrites a newer one
+    with _flush_lock:
+        with _lock:
+            rows = [(_process_id(), name, labels, _values[(name, labels)]) for name, labels in _dirty]
+            _dirty.clear()
+        if not rows:
+            return
+        connection = _get_connection()
+        with connection:
+            connection.executemany(
+                'INSERT INTO samples (process, name, labels, value) VALUES (?, ?, ?, ?) '
+                'ON CONFLICT (process, name, labels) DO UPDATE SET value = excluded.value',
+                rows
+            )
+
+
+def _flush_loop():
+    while True:
+        time.sleep(settings.METRICS_FLUSH_INTERVAL)
+        try:
+            flush()
+        except sqlite3.Error:
+            pass
+
+
+def _ensure_flusher():
+    """Start the flush thread of this process on the first recorded value"""
+    global _flusher_started
+    if _flusher_started:
+        return
+    with _lock:
+        if _flusher_started:
+            return
+        _flusher_started = True
+    threading.Thread(target=_flush_loop, name='metrics-flush', daemon=True).start()
+
+
+def _reset_after_fork():
+    """A forked worker starts from zero; the values recorded before the fork belong to the parent"""
+    global _lock, _flush_lock, _process, _flusher_started, _connection
+    _lock = threading.Lock()
+    _flush_lock = threading.Lock()
+    _values.clear()
+    _dirty.clear()
+    _process = None
+    _flusher_started = False
+    _connection = None
+
+
+def reset():
+    """Forget this process's values and reconnect to METRICS_DB on the next flush"""
+    global _connection
+    with _flush_lock:
+        with _lock:
+            _values.clear()
+            _dirty.clear()
+        if _connection is not None:
+            _connection.close()
+        _connection = None
+
+
+@receiver(setting_changed)
+def _metrics_db_changed(setting, **kwargs):
+    # Tests point METRICS_DB at a file of their own
+    if setting == 'METRICS_DB':
+        reset()
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)
+atexit.register(lambda: flush() if _flusher_started else None)
+
+
+def _is_alive(process):
+    pid = int(process.split(':', 1)[0])
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def _collect():
+    """Totals per (name, labels) across processes, and the number of live worker processes"""
+    flush()
+    connection = _get_connection()
+    maxima = [metric.name for metric in REGISTRY.values() if isinstance(metric, Maximum)]
+    placeholders = ', '.join('?' * len(maxima))
+    processes = [row[0] for row in connection.execute('SELECT DISTINCT process FROM samples')]
+    dead = [process for process in processes if process != 'exited' and not _is_alive(process)]
+    if dead:
+        with connection:
+            for process in dead:
+                connection.execute(
+                    "INSERT INTO samples (process, name, labels, value) "
+                    "SELECT 'exited', name, labels, value FROM samples WHERE process = ? "
+                    "ON CONFLICT (process, name, labels) DO UPDATE SET value = CASE "
+                    f"WHEN name IN ({placeholders}) THEN max(value, excluded.value) "
+                    "ELSE value + excluded.value END",
+                    [process, *maxima]
+                )
+                connection.execute('DELETE FROM samples WHERE process = ?', [process])
+
+    totals = {}
+    for name, labels, total, maximum in connection.execute(
+        'SELECT name, labels, SUM(value), MAX(value) FROM samples GROUP BY name, labels ORDER BY name, labels'
+    ):
+        totals[(name, labels)] = maximum if name in maxima else total
+    workers = len([process for process in processes if process != 'exited' and process not in dead])
+    return totals, workers
+
+
+def collect_totals():
+    """Values per (name, labels) of every metric, combined across all processes"""
+    return _collect()[0]
+
+
+def _sample_line(name, labels, value):
+    return f'{name}{{{labels}}} {_format_value(value)}' if labels else f'{name} {_format_value(value)}'
+
+
+def render_metrics():
+    """All metrics in the Prometheus text exposition format (version 0.0.4)"""
+    totals, workers = _collect()
+
+    lines = []
+    for metric in REGISTRY.values():
+        lines.append(f'# HELP {metric.name} {metric.documentation}')
+        lines.append(f'# TYPE {metric.name} {metric.type}')
+        if metric.type != 'histogram':
+            for (name, labels), value in totals.items():
+                if name == metric.name:
+                    lines.append(_sample_line(name, labels, value))
+            continue
+
+        # One series per label set: buckets in bound order, then sum and count
+        for (name, labels), count in totals.items():
+            if name != f'{metric.name}_count':
+                continue
+            for bound in metric.buckets:
+                bucket = totals.get((f'{metric.name}_bucket', _with_le(labels, bound)), 0.0)
+                lines.append(_sample_line(f'{metric.name}_bucket', _with_le(labels, bound), bucket))
+            lines.append(_sample_line(f'{metric.name}_sum', labels, totals.get((f'{metric.name}_sum', labels), 0.0)))
+            lines.append(_sample_line(f'{metric.name}_count', labels, count))
+
+    lines.append('# HELP ilefn_workers Worker processes that have reported metrics and are still running')
+    lines.append('# TYPE ilefn_workers gauge')
+    lines.append(f'ilefn_workers {workers}')
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,78 @@
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from whitenoise.middleware import WhiteNoiseMiddleware
+
+from .instrumentation import finish_request, start_query_log, stop_query_log
+
+
+class AsyncWhiteNoiseMiddleware(WhiteNoiseMiddleware):
+    """
+    WhiteNoise middleware that also runs natively under ASGI.
+
+    WhiteNoise 6.6 is sync-only, which makes Django run the rest of the
+    middleware chain in a worker thread and call async views through
+    async_to_sync. The static-file lookup itself is a dict lookup (or a path
+    check under autorefresh), so it is safe to do on the event loop.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response=None, settings=None):
+        if settings is None:
+            super().__init__(get_response)
+        else:
+            super().__init__(get_response, settings)
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        return super().__call__(request)
+
+    async def __acall__(self, request):
+        if self.autorefresh:
+            static_file = self.find_file(request.path_info)
+        else:
+            static_file = self.files.get(request.path_info)
+        if static_file is not None:
+            return self.serve(static_file, request)
+        return await self.get_response(request)
+
+
+class RequestInstrumentationMiddleware:
+    """
+    Time every request, count its queries and DB time, add it to the per-route
+    histogram (see the director_metrics view) and log it when it is slow.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+
+        started = time.perf_counter()
+        query_log, token = start_query_log()
+        try:
+            response = self.get_response(request)
+        finally:
+            stop_query_log(token)
+        finish_request(request, response, started, query_log)
+        return response
+
+    async def __acall__(self, request):
+        started = time.perf_counter()
+        query_log, token = start_query_log()
+        try:
+            response = await self.get_response(request)
+        finally:
+            stop_query_log(token)
+        finish_request(request, response, started, query_log)
+        return response
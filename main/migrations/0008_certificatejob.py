@@ -0,0 +1,33 @@
+# Generated by Django 5.2.6 on 2026-10-18 10:28
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0007_alter_juniortrait_weight'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CertificateJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('test_type', models.CharField(choices=[('adult', 'اختبار البالغين'), ('junior', 'اختبار الناشئين')], max_length=10, verbose_name='نوع الاختبار')),
+                ('result_id', models.BigIntegerField(verbose_name='رقم النتيجة')),
+                ('status', models.CharField(choices=[('pending', 'في الانتظار'), ('running', 'قيد التنفيذ'), ('done', 'مكتملة'), ('failed', 'فشلت')], db_index=True, default='pending', max_length=10, verbose_name='الحالة')),
+                ('attempts', models.PositiveIntegerField(default=0, verbose_name='عدد المحاولات')),
+                ('error', models.TextField(blank=True, verbose_name='الخطأ')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='تاريخ الإنشاء')),
+                ('started_at', models.DateTimeField(blank=True, null=True, verbose_name='بدأت في')),
+                ('finished_at', models.DateTimeField(blank=True, null=True, verbose_name='انتهت في')),
+            ],
+            options={
+                'verbose_name': 'مهمة شهادة',
+                'verbose_name_plural': 'مهام الشهادات',
+                'ordering': ['created_at'],
+                'unique_together': {('test_type', 'result_id')},
+            },
+        ),
+    ]
@@ -0,0 +1,130 @@
+# Converts answers_json / trait_scores_json from TextField to JSONField (jsonb on PostgreSQL).
+# New columns are added, filled from the old text in batches, then swapped in.
+
+import json
+
+from django.db import migrations, models
+
+
+BATCH_SIZE = 2000
+
+FIELDS = [
+    ('TestSession', 'answers_json', 'answers_data'),
+    ('JuniorTestSession', 'answers_json', 'answers_data'),
+    ('TestResult', 'trait_scores_json', 'trait_scores_data'),
+    ('JuniorTestResult', 'trait_scores_json', 'trait_scores_data'),
+]
+
+
+def _parse(text):
+    if not text:
+        return {}
+    try:
+        return json.loads(text)
+    except ValueError:
+        return {}
+
+
+def _copy_in_batches(model, source, target, convert):
+    last_pk = 0
+    while True:
+        batch = list(
+            model.objects.filter(pk__gt=last_pk).order_by('pk').only('pk', source)[:BATCH_SIZE]
+        )
+        if not batch:
+            break
+        for obj in batch:
+            setattr(obj, target, convert(getattr(obj, source)))
+        model.objects.bulk_update(batch, [target])
+        last_pk = batch[-1].pk
+
+
+def text_to_json(apps, schema_editor):
+    for model_name, old_name, new_name in FIELDS:
+        _copy_in_batches(apps.get_model('main', model_name), old_name, new_name, _parse)
+
+
+def json_to_text(apps, schema_editor):
+    for model_name, old_name, new_name in FIELDS:
+        _copy_in_batches(
+            apps.get_model('main', model_name), new_name, old_name,
+            lambda value: json.dumps(value, ensure_ascii=False) if value else ''
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0008_certificatejob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='testsession',
+            name='answers_data',
+            field=models.JSONField(blank=True, default=dict, verbose_name='الإجابات (JSON)'),
+        ),
+        migrations.AddField(
+            model_name='juniortestsession',
+            name='answers_data',
+            field=models.JSONField(blank=True, default=dict, verbose_name='الإجابات (JSON)'),
+        ),
+        migrations.AddField(
+            model_name='testresult',
+            name='trait_scores_data',
+            field=models.JSONField(default=dict, verbose_name='درجات السمات (JSON)'),
+        ),
+        migrations.AddField(
+            model_name='juniortestresult',
+            name='trait_scores_data',
+            field=models.JSONField(default=dict, verbose_name='درجات السمات (JSON)'),
+        ),
+        migrations.RunPython(text_to_json, json_to_text),
+        # A default lets the text columns be re-added when migrating backwards
+        migrations.AlterField(
+            model_name='testresult',
+            name='trait_scores_json',
+            field=models.TextField(default='', verbose_name='درجات السمات (JSON)'),
+        ),
+        migrations.AlterField(
+            model_name='juniortestresult',
+            name='trait_scores_json',
+            field=models.TextField(default='', verbose_name='درجات السمات (JSON)'),
+        ),
+        migrations.RemoveField(
+            model_name='testsession',
+            name='answers_json',
+        ),
+        migrations.RemoveField(
+            model_name='juniortestsession',
+            name='answers_json',
+        ),
+        migrations.RemoveField(
+            model_name='testresult',
+            name='trait_scores_json',
+        ),
+        migrations.RemoveField(
+            model_name='juniortestresult',
+            name='trait_scores_json',
+        ),
+        migrations.RenameField(
+            model_name='testsession',
+            old_name='answers_data',
+            new_name='answers_json',
+        ),
+        migrations.RenameField(
+            model_name='juniortestsession',
+            old_name='answers_data',
+            new_name='answers_json',
+        ),
+        migrations.RenameField(
+            model_name='testresult',
+            old_name='trait_scores_data',
+            new_name='trait_scores_json',
+        ),
+        migrations.RenameField(
+            model_name='juniortestresult',
+            old_name='trait_scores_data',
+            new_name='trait_scores_json',
+        ),
+    ]
@@ -0,0 +1,46 @@
+# Generated by Django 5.2.6 on 2026-10-18 10:33
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0009_json_answers_and_trait_scores'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='JuniorTraitScore',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('percentage', models.FloatField(verbose_name='النسبة (%)')),
+                ('weighted_score', models.FloatField(verbose_name='الدرجة الموزونة')),
+                ('result', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='trait_score_rows', to='main.juniortestresult', verbose_name='النتيجة')),
+                ('trait', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='scores', to='main.juniortrait', verbose_name='السمة')),
+            ],
+            options={
+                'verbose_name': 'درجة سمة للناشئين',
+                'verbose_name_plural': 'درجات سمات الناشئين',
+                'indexes': [models.Index(fields=['trait', 'percentage'], name='jtraitscore_trait_pct_idx')],
+                'constraints': [models.UniqueConstraint(fields=('result', 'trait'), name='unique_junior_trait_score_per_result')],
+            },
+        ),
+        migrations.CreateModel(
+            name='TraitScore',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('percentage', models.FloatField(verbose_name='النسبة (%)')),
+                ('weighted_score', models.FloatField(verbose_name='الدرجة الموزونة')),
+                ('result', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='trait_score_rows', to='main.testresult', verbose_name='النتيجة')),
+                ('trait', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='scores', to='main.trait', verbose_name='السمة')),
+            ],
+            options={
+                'verbose_name': 'درجة سمة',
+                'verbose_name_plural': 'درجات السمات',
+                'indexes': [models.Index(fields=['trait', 'percentage'], name='traitscore_trait_pct_idx')],
+                'constraints': [models.UniqueConstraint(fields=('result', 'trait'), name='unique_trait_score_per_result')],
+            },
+        ),
+    ]
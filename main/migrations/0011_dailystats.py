@@ -0,0 +1,34 @@
+# Generated by Django 5.2.6 on 2026-10-18 10:38
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0010_traitscore_juniortraitscore'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(verbose_name='التاريخ')),
+                ('test_type', models.CharField(choices=[('adult', 'اختبار البالغين'), ('junior', 'اختبار الناشئين')], max_length=10, verbose_name='نوع الاختبار')),
+                ('registrations', models.PositiveIntegerField(default=0, verbose_name='التسجيلات')),
+                ('completions', models.PositiveIntegerField(default=0, verbose_name='الاختبارات المكتملة')),
+                ('mean_score', models.FloatField(blank=True, null=True, verbose_name='متوسط الدرجة')),
+                ('median_score', models.FloatField(blank=True, null=True, verbose_name='وسيط الدرجة')),
+                ('p90_score', models.FloatField(blank=True, null=True, verbose_name='المئين 90 للدرجة')),
+                ('mean_time_minutes', models.FloatField(blank=True, null=True, verbose_name='متوسط الوقت (دقائق)')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='آخر تحديث')),
+            ],
+            options={
+                'verbose_name': 'إحصائية يومية',
+                'verbose_name_plural': 'الإحصائيات اليومية',
+                'ordering': ['-date', 'test_type'],
+                'constraints': [models.UniqueConstraint(fields=('date', 'test_type'), name='unique_daily_stats_per_type')],
+            },
+        ),
+    ]
@@ -0,0 +1,53 @@
+# Generated by Django 5.2.6 on 2026-10-18 10:39
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0011_dailystats'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='juniorquestion',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['order', 'id'], name='jquestion_active_order_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='juniortestregistration',
+            index=models.Index(fields=['created_at'], name='jregistration_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='juniortestresult',
+            index=models.Index(fields=['created_at', 'id'], name='jresult_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='juniortestresult',
+            index=models.Index(fields=['total_score', 'id'], name='jresult_score_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='juniortestsession',
+            index=models.Index(condition=models.Q(('is_completed', True)), fields=['-completed_at'], name='jsession_completed_at_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='question',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['order', 'id'], name='question_active_order_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='testregistration',
+            index=models.Index(fields=['created_at'], name='registration_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='testresult',
+            index=models.Index(fields=['created_at', 'id'], name='result_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='testresult',
+            index=models.Index(fields=['total_score', 'id'], name='result_score_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='testsession',
+            index=models.Index(condition=models.Q(('is_completed', True)), fields=['-completed_at'], name='session_completed_at_idx'),
+        ),
+    ]
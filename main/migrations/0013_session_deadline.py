@@ -0,0 +1,31 @@
+# Generated by Django 5.2.6 on 2026-10-18 10:42
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0012_hot_path_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='juniortestsession',
+            name='deadline',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='الموعد النهائي'),
+        ),
+        migrations.AddField(
+            model_name='testsession',
+            name='deadline',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='الموعد النهائي'),
+        ),
+        migrations.AddIndex(
+            model_name='juniortestsession',
+            index=models.Index(condition=models.Q(('is_completed', False)), fields=['deadline', 'started_at'], name='jsession_open_deadline_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='testsession',
+            index=models.Index(condition=models.Q(('is_completed', False)), fields=['deadline', 'started_at'], name='session_open_deadline_idx'),
+        ),
+    ]
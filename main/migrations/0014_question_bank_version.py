@@ -0,0 +1,25 @@
+# Generated by Django 5.2.6 on 2026-10-18 11:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0013_session_deadline'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='QuestionBankVersion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('test_type', models.CharField(choices=[('adult', 'اختبار البالغين'), ('junior', 'اختبار الناشئين')], max_length=10, unique=True, verbose_name='نوع الاختبار')),
+                ('version', models.PositiveIntegerField(default=1, verbose_name='الإصدار')),
+            ],
+            options={
+                'verbose_name': 'إصدار بنك الأسئلة',
+                'verbose_name_plural': 'إصدارات بنوك الأسئلة',
+            },
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 5.2.6 on 2026-10-18 11:32
+
+from django.db import migrations, models
+from django.db.models import F
+
+
+def sums_from_means(apps, schema_editor):
+    """Existing rows carry their means; the sums follow from them and the completions"""
+    DailyStats = apps.get_model('main', 'DailyStats')
+    DailyStats.objects.filter(completions__gt=0).update(
+        score_sum=F('mean_score') * F('completions'),
+        time_sum_minutes=F('mean_time_minutes') * F('completions'),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0014_question_bank_version'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='dailystats',
+            name='score_sum',
+            field=models.FloatField(default=0, verbose_name='مجموع الدرجات'),
+        ),
+        migrations.AddField(
+            model_name='dailystats',
+            name='time_sum_minutes',
+            field=models.FloatField(default=0, verbose_name='مجموع الوقت (دقائق)'),
+        ),
+        migrations.RunPython(sums_from_means, migrations.RunPython.noop),
+    ]
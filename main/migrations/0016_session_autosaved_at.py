@@ -0,0 +1,23 @@
+# Generated by Django 5.2.6 on 2026-10-18 11:36
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0015_daily_stats_sums'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='juniortestsession',
+            name='autosaved_at',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='آخر حفظ تلقائي'),
+        ),
+        migrations.AddField(
+            model_name='testsession',
+            name='autosaved_at',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='آخر حفظ تلقائي'),
+        ),
+    ]
@@ -1,9 +1,15 @@
+from datetime import timedelta
+
 from django.db import models
 from django.utils import timezone
 from django.core.validators import MinValueValidator, MaxValueValidator
 import json
 
 
+# Extra time accepted after a session's deadline, for network latency on the final submit
+SUBMISSION_GRACE = timedelta(seconds=30)
+
+
 class TestRegistration(models.Model):
     name = models.CharField(max_length=200, verbose_name="الاسم")
     email = models.EmailField(unique=True, verbose_name="البريد الإلكتروني")
@@ -15,6 +21,9 @@ class TestRegistration(models.Model):
         verbose_name = "تسجيل الاختبار"
         verbose_name_plural = "تسجيلات الاختبار"
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['created_at'], name='registration_created_idx'),
+        ]
 
     def __str__(self):
         return f"{self.name} - {self.email}"
@@ -72,6 +81,9 @@ class Question(models.Model):
         verbose_name = "سؤال"
         verbose_name_plural = "الأسئلة"
         ordering = ['order']
+        indexes = [
+            models.Index(fields=['order', 'id'], condition=models.Q(is_active=True), name='question_active_order_idx'),
+        ]
 
     def __str__(self):
         return f"س{self.order}: {self.text[:50]}..."
@@ -79,6 +91,8 @@ class Question(models.Model):
 
 class TestSession(models.Model):
     """جلسة اختبار"""
+    TIME_LIMIT = timedelta(minutes=11)  # مدة الاختبار
+
     registration = models.OneToOneField(
         TestRegistration,
         on_delete=models.CASCADE,
@@ -88,26 +102,41 @@ class TestSession(models.Model):
     started_at = models.DateTimeField(auto_now_add=True, verbose_name="بدأ في")
     completed_at = models.DateTimeField(null=True, blank=True, verbose_name="انتهى في")
     is_completed = models.BooleanField(default=False, verbose_name="مكتمل")
-    answers_json = models.TextField(blank=True, verbose_name="الإجابات (JSON)")
+    deadline = models.DateTimeField(null=True, blank=True, verbose_name="الموعد النهائي")
+    answers_json = models.JSONField(default=dict, blank=True, verbose_name="الإجابات (JSON)")
+    autosaved_at = models.DateTimeField(null=True, blank=True, verbose_name="آخر حفظ تلقائي")
 
     class Meta:
         verbose_name = "جلسة اختبار"
         verbose_name_plural = "جلسات الاختبار"
         ordering = ['-started_at']
+        indexes = [
+            models.Index(fields=['-completed_at'], condition=models.Q(is_completed=True), name='session_completed_at_idx'),
+            models.Index(fields=['deadline', 'started_at'], condition=models.Q(is_completed=False), name='session_open_deadline_idx'),
+        ]
 
     def __str__(self):
         return f"جلسة: {self.registration.name} - {self.started_at.strftime('%Y-%m-%d')}"
 
     def set_answers(self, answers_dict):
         """حفظ الإجابات كـ JSON"""
-        self.answers_json = json.dumps(answers_dict, ensure_ascii=False)
+        self.answers_json = answers_dict
         self.save()
 
     def get_answers(self):
         """استرجاع الإجابات من JSON"""
-        if self.answers_json:
-            return json.loads(self.answers_json)
-        return {}
+        return self.answers_json or {}
+
+
+    def time_left(self, now=None):
+        """الوقت المتبقي حتى الموعد النهائي (None إذا لم يبدأ الاختبار)"""
+        if self.deadline is None:
+            return None
+        return max(self.deadline - (now or timezone.now()), timedelta(0))
+
+    def is_expired(self, now=None):
+        """انتهى وقت الاختبار (مع هامش التسليم)"""
+        return self.deadline is not None and (now or timezone.now()) > self.deadline + SUBMISSION_GRACE
 
 
 class TestResult(models.Model):
@@ -124,7 +153,7 @@ class TestResult(models.Model):
         validators=[MinValueValidator(0), MaxValueValidator(100)],
         verbose_name="الدرجة الكلية (%)"
     )
-    trait_scores_json = models.TextField(verbose_name="درجات السمات (JSON)")
+    trait_scores_json = models.JSONField(default=dict, verbose_name="درجات السمات (JSON)")
     certificate_path = models.CharField(max_length=500, blank=True, verbose_name="مسار الشهادة")
     created_at = models.DateTimeField(auto_now_add=True, verbose_name="تاريخ الإنشاء")
     time_taken_minutes = models.IntegerField(default=0, verbose_name="الوقت المستغرق (دقائق)")
@@ -133,20 +162,22 @@ class TestResult(models.Model):
         verbose_name = "نتيجة اختبار"
         verbose_name_plural = "نتائج الاختبارات"
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['created_at', 'id'], name='result_created_idx'),
+            models.Index(fields=['total_score', 'id'], name='result_score_idx'),
+        ]
 
     def __str__(self):
         return f"نتيجة: {self.session.registration.name} - {self.total_score}%"
 
     def set_trait_scores(self, trait_scores_dict):
         """حفظ درجات السمات كـ JSON"""
-        self.trait_scores_json = json.dumps(trait_scores_dict, ensure_ascii=False)
+        self.trait_scores_json = trait_scores_dict
         self.save()
 
     def get_trait_scores(self):
         """استرجاع درجات السمات من JSON"""
-        if self.trait_scores_json:
-            return json.loads(self.trait_scores_json)
-        return {}
+        return self.trait_scores_json or {}
 
 from django.db import models
 from django.utils import timezone
@@ -184,6 +215,9 @@ class JuniorTestRegistration(models.Model):
         verbose_name = "تسجيل اختبار الناشئين"
         verbose_name_plural = "تسجيلات اختبار الناشئين"
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['created_at'], name='jregistration_created_idx'),
+        ]
 
     def __str__(self):
         return f"{self.name} - {self.email}"
@@ -234,6 +268,9 @@ class JuniorQuestion(models.Model):
         verbose_name = "سؤال الناشئين"
         verbose_name_plural = "أسئلة الناشئين"
         ordering = ['order']
+        indexes = [
+            models.Index(fields=['order', 'id'], condition=models.Q(is_active=True), name='jquestion_active_order_idx'),
+        ]
 
     def __str__(self):
         return f"س{self.order}: {self.text[:50]}..."
@@ -241,6 +278,8 @@ class JuniorQuestion(models.Model):
 
 class JuniorTestSession(models.Model):
     """جلسة اختبار الناشئين"""
+    TIME_LIMIT = timedelta(minutes=6)  # مدة الاختبار
+
     registration = models.OneToOneField(
         JuniorTestRegistration,
         on_delete=models.CASCADE,
@@ -250,26 +289,41 @@ class JuniorTestSession(models.Model):
     started_at = models.DateTimeField(auto_now_add=True, verbose_name="بدأ في")
     completed_at = models.DateTimeField(null=True, blank=True, verbose_name="انتهى في")
     is_completed = models.BooleanField(default=False, verbose_name="مكتمل")
-    answers_json = models.TextField(blank=True, verbose_name="الإجابات (JSON)")
+    deadline = models.DateTimeField(null=True, blank=True, verbose_name="الموعد النهائي")
+    answers_json = models.JSONField(default=dict, blank=True, verbose_name="الإجابات (JSON)")
+    autosaved_at = models.DateTimeField(null=True, blank=True, verbose_name="آخر حفظ تلقائي")
 
     class Meta:
         verbose_name = "جلسة اختبار الناشئين"
         verbose_name_plural = "جلسات اختبار الناشئين"
         ordering = ['-started_at']
+        indexes = [
+            models.Index(fields=['-completed_at'], condition=models.Q(is_completed=True), name='jsession_completed_at_idx'),
+            models.Index(fields=['deadline', 'started_at'], condition=models.Q(is_completed=False), name='jsession_open_deadline_idx'),
+        ]
 
     def __str__(self):
         return f"جلسة ناشئين: {self.registration.name} - {self.started_at.strftime('%Y-%m-%d')}"
 
     def set_answers(self, answers_dict):
         """حفظ الإجابات كـ JSON"""
-        self.answers_json = json.dumps(answers_dict, ensure_ascii=False)
+        self.answers_json = answers_dict
         self.save()
 
     def get_answers(self):
         """استرجاع الإجابات من JSON"""
-        if self.answers_json:
-            return json.loads(self.answers_json)
-        return {}
+        return self.answers_json or {}
+
+
+    def time_left(self, now=None):
+        """الوقت المتبقي حتى الموعد النهائي (None إذا لم يبدأ الاختبار)"""
+        if self.deadline is None:
+            return None
+        return max(self.deadline - (now or timezone.now()), timedelta(0))
+
+    def is_expired(self, now=None):
+        """انتهى وقت الاختبار (مع هامش التسليم)"""
+        return self.deadline is not None and (now or timezone.now()) > self.deadline + SUBMISSION_GRACE
 
 
 class JuniorTestResult(models.Model):
@@ -286,7 +340,7 @@ class JuniorTestResult(models.Model):
         validators=[MinValueValidator(0), MaxValueValidator(100)],
         verbose_name="الدرجة الكلية (%)"
     )
-    trait_scores_json = models.TextField(verbose_name="درجات السمات (JSON)")
+    trait_scores_json = models.JSONField(default=dict, verbose_name="درجات السمات (JSON)")
     certificate_path = models.CharField(max_length=500, blank=True, verbose_name="مسار الشهادة")
     created_at = models.DateTimeField(auto_now_add=True, verbose_name="تاريخ الإنشاء")
     time_taken_minutes = models.IntegerField(default=0, verbose_name="الوقت المستغرق (دقائق)")
@@ -295,17 +349,170 @@ class JuniorTestResult(models.Model):
         verbose_name = "نتيجة اختبار الناشئين"
         verbose_name_plural = "نتائج اختبارات الناشئين"
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['created_at', 'id'], name='jresult_created_idx'),
+            models.Index(fields=['total_score', 'id'], name='jresult_score_idx'),
+        ]
 
     def __str__(self):
         return f"نتيجة ناشئين: {self.session.registration.name} - {self.total_score}%"
 
     def set_trait_scores(self, trait_scores_dict):
         """حفظ درجات السمات كـ JSON"""
-        self.trait_scores_json = json.dumps(trait_scores_dict, ensure_ascii=False)
+        self.trait_scores_json = trait_scores_dict
         self.save()
 
     def get_trait_scores(self):
         """استرجاع درجات السمات من JSON"""
-        if self.trait_scores_json:
-            return json.loads(self.trait_scores_json)
-        return {}
\ No newline at end of file
+        return self.trait_scores_json or {}
+
+class CertificateJob(models.Model):
+    """مهمة إنشاء شهادة في الخلفية"""
+    TEST_TYPE_CHOICES = [
+        ('adult', 'اختبار البالغين'),
+        ('junior', 'اختبار الناشئين'),
+    ]
+    STATUS_PENDING = 'pending'
+    STATUS_RUNNING = 'running'
+    STATUS_DONE = 'done'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = [
+        (STATUS_PENDING, 'في الانتظار'),
+        (STATUS_RUNNING, 'قيد التنفيذ'),
+        (STATUS_DONE, 'مكتملة'),
+        (STATUS_FAILED, 'فشلت'),
+    ]
+
+    test_type = models.CharField(max_length=10, choices=TEST_TYPE_CHOICES, verbose_name="نوع الاختبار")
+    result_id = models.BigIntegerField(verbose_name="رقم النتيجة")
+    status = models.CharField(
+        max_length=10,
+        choices=STATUS_CHOICES,
+        default=STATUS_PENDING,
+        db_index=True,
+        verbose_name="الحالة"
+    )
+    attempts = models.PositiveIntegerField(default=0, verbose_name="عدد المحاولات")
+    error = models.TextField(blank=True, verbose_name="الخطأ")
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="تاريخ الإنشاء")
+    started_at = models.DateTimeField(null=True, blank=True, verbose_name="بدأت في")
+    finished_at = models.DateTimeField(null=True, blank=True, verbose_name="انتهت في")
+
+    class Meta:
+        verbose_name = "مهمة شهادة"
+        verbose_name_plural = "مهام الشهادات"
+        ordering = ['created_at']
+        unique_together = [('test_type', 'result_id')]
+
+    def __str__(self):
+        return f"شهادة {self.test_type} #{self.result_id} - {self.status}"
+
+
+class QuestionBankVersion(models.Model):
+    """إصدار بنك الأسئلة لكل نوع اختبار (يزداد مع كل تعديل على الأسئلة أو السمات)"""
+    test_type = models.CharField(
+        max_length=10,
+        choices=CertificateJob.TEST_TYPE_CHOICES,
+        unique=True,
+        verbose_name="نوع الاختبار"
+    )
+    version = models.PositiveIntegerField(default=1, verbose_name="الإصدار")
+
+    class Meta:
+        verbose_name = "إصدار بنك الأسئلة"
+        verbose_name_plural = "إصدارات بنوك الأسئلة"
+
+    def __str__(self):
+        return f"{self.test_type}: {self.version}"
+
+
+class TraitScore(models.Model):
+    """درجة سمة واحدة ضمن نتيجة اختبار"""
+    result = models.ForeignKey(
+        TestResult,
+        on_delete=models.CASCADE,
+        related_name='trait_score_rows',
+        verbose_name="النتيجة"
+    )
+    trait = models.ForeignKey(
+        Trait,
+        on_delete=models.CASCADE,
+        related_name='scores',
+        verbose_name="السمة"
+    )
+    percentage = models.FloatField(verbose_name="النسبة (%)")
+    weighted_score = models.FloatField(verbose_name="الدرجة الموزونة")
+
+    class Meta:
+        verbose_name = "درجة سمة"
+        verbose_name_plural = "درجات السمات"
+        constraints = [
+            models.UniqueConstraint(fields=['result', 'trait'], name='unique_trait_score_per_result'),
+        ]
+        indexes = [
+            models.Index(fields=['trait', 'percentage'], name='traitscore_trait_pct_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.trait.name}: {self.percentage}%"
+
+
+class JuniorTraitScore(models.Model):
+    """درجة سمة واحدة ضمن نتيجة اختبار الناشئين"""
+    result = models.ForeignKey(
+        JuniorTestResult,
+        on_delete=models.CASCADE,
+        related_name='trait_score_rows',
+        verbose_name="النتيجة"
+    )
+    trait = models.ForeignKey(
+        JuniorTrait,
+        on_delete=models.CASCADE,
+        related_name='scores',
+        verbose_name="السمة"
+    )
+    percentage = models.FloatField(verbose_name="النسبة (%)")
+    weighted_score = models.FloatField(verbose_name="الدرجة الموزونة")
+
+    class Meta:
+        verbose_name = "درجة سمة للناشئين"
+        verbose_name_plural = "درجات سمات الناشئين"
+        constraints = [
+            models.UniqueConstraint(fields=['result', 'trait'], name='unique_junior_trait_score_per_result'),
+        ]
+        indexes = [
+            models.Index(fields=['trait', 'percentage'], name='jtraitscore_trait_pct_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.trait.name}: {self.percentage}%"
+
+
+class DailyStats(models.Model):
+    """إحصائيات يومية مجمعة لكل نوع اختبار"""
+    date = models.DateField(verbose_name="التاريخ")
+    test_type = models.CharField(
+        max_length=10,
+        choices=CertificateJob.TEST_TYPE_CHOICES,
+        verbose_name="نوع الاختبار"
+    )
+    registrations = models.PositiveIntegerField(default=0, verbose_name="التسجيلات")
+    completions = models.PositiveIntegerField(default=0, verbose_name="الاختبارات المكتملة")
+    mean_score = models.FloatField(null=True, blank=True, verbose_name="متوسط الدرجة")
+    median_score = models.FloatField(null=True, blank=True, verbose_name="وسيط الدرجة")
+    p90_score = models.FloatField(null=True, blank=True, verbose_name="المئين 90 للدرجة")
+    mean_time_minutes = models.FloatField(null=True, blank=True, verbose_name="متوسط الوقت (دقائق)")
+    score_sum = models.FloatField(default=0, verbose_name="مجموع الدرجات")
+    time_sum_minutes = models.FloatField(default=0, verbose_name="مجموع الوقت (دقائق)")
+    updated_at = models.DateTimeField(auto_now=True, verbose_name="آخر تحديث")
+
+    class Meta:
+        verbose_name = "إحصائية يومية"
+        verbose_name_plural = "الإحصائيات اليومية"
+        ordering = ['-date', 'test_type']
+        constraints = [
+            models.UniqueConstraint(fields=['date', 'test_type'], name='unique_daily_stats_per_type'),
+        ]
+
+    def __str__(self):
+        return f"{self.date} {self.test_type}: {self.completions}"
@@ -0,0 +1,191 @@
+"""
+Certificates as single-page PDF files.
+
+The page is the certificate template with the text on top. The template is
+embedded as one image whose compressed stream is built once per template and
+copied unchanged into every file: it is the PNG-filtered IDAT data of the
+background, which PDF's FlateDecode reads directly with the PNG predictor.
+The labels, name, score and date are real text in a subset of the
+certificate font, so a certificate only adds a few KB to the shared image
+and prints sharply at any size.
+"""
+from functools import lru_cache
+import hashlib
+import io
+import struct
+import threading
+import zlib
+
+from reportlab.pdfbase.ttfonts import TTFontFace, makeToUnicodeCMap
+
+
+# Templates are laid out at 96 dpi; PDF user space has 72 units per inch
+POINTS_PER_PIXEL = 72 / 96
+
+# Objects 1-4 (catalog, pages, page, template image) are the same in every
+# file of a template; 5-9 hold the font subset and the page text
+PAGE_OBJECTS = 9
+
+# Text is shown with single-byte codes into the font subset
+MAX_SUBSET_CHARACTERS = 256
+
+
+class SubsetTooLarge(ValueError):
+    """The texts use more different characters than one font subset can hold"""
+
+
+def _pdf_object(number, body, stream=None):
+    if stream is None:
+        return b'%d 0 obj\n%s\nendobj\n' % (number, body)
+    return b'%d 0 obj\n%s\nstream\n%s\nendstream\nendobj\n' % (number, body, stream)
+
+
+def _png_idat(image):
+    """Concatenated IDAT data of the image encoded as PNG"""
+    buffer = io.BytesIO()
+    image.save(buffer, 'PNG', optimize=True)
+    data = buffer.getvalue()
+    chunks = []
+    offset = 8  # PNG signature
+    while offset < len(data):
+        length, chunk_type = struct.unpack('>I4s', data[offset:offset + 8])
+        if chunk_type == b'IDAT':
+            chunks.append(data[offset + 8:offset + 8 + length])
+        offset += length + 12
+    return b''.join(chunks)
+
+
+@lru_cache(maxsize=None)
+def load_font(path):
+    """The PdfFont of a font file, shared by all templates using it"""
+    return PdfFont(path)
+
+
+class PdfFont:
+    """A TrueType font parsed once, from which each certificate embeds the subset it uses"""
+
+    def __init__(self, path):
+        self.face = TTFontFace(path)
+        # The parser reads through a shared cursor, so subsets are made one at a time
+        self._lock = threading.Lock()
+
+    def text_width(self, text, size):
+        """Advance width of the text at the given size, from the font's own (unhinted) metrics"""
+        return sum(self.face.getCharWidth(ord(char)) for char in text) * size / 1000
+
+    def subset_objects(self, first_number, codes):
+        """
+        Font, descriptor, font file and ToUnicode objects for the characters in
+        `codes`, which are encoded in the page text by their index in `codes`
+        """
+        face = self.face
+        tag = ''.join(chr(ord('A') + byte % 26) for byte in hashlib.sha1(repr(codes).encode()).digest()[:6])
+        base_font = b'/' + tag.encode() + b'+' + face.name
+        with self._lock:
+            font_file = face.makeSubset(codes)
+
+        font_number, descriptor_number, file_number, cmap_number = range(first_number, first_number + 4)
+        widths = b' '.join(b'%d' % round(face.getCharWidth(code)) for code in codes)
+        # Symbolic, as the subset's characters are addressed by index rather than a standard encoding
+        flags = (face.flags & ~32) | 4
+        cmap = makeToUnicodeCMap(tag + '+' + face.name.decode('latin-1'), codes).encode('latin-1')
+        compressed_font = zlib.compress(font_file)
+        compressed_cmap = zlib.compress(cmap)
+        return [
+            _pdf_object(font_number, b'<< /Type /Font /Subtype /TrueType /BaseFont %s /FirstChar 0 /LastChar %d '
+                        b'/Widths [%s] /FontDescriptor %d 0 R /ToUnicode %d 0 R >>'
+                        % (base_font, len(codes) - 1, widths, descriptor_number, cmap_number)),
+            _pdf_object(descriptor_number, b'<< /Type /FontDescriptor /FontName %s /Flags %d '
+                        b'/FontBBox [%s] /ItalicAngle %d /Ascent %d /Descent %d /CapHeight %d '
+                        b'/StemV %d /MissingWidth %d /FontFile2 %d 0 R >>'
+                        % (base_font, flags, b' '.join(b'%d' % round(v) for v in face.bbox),
+                           round(face.italicAngle), round(face.ascent), round(face.descent),
+                           round(face.capHeight), face.stemV, round(face.defaultWidth), file_number)),
+            _pdf_object(file_number, b'<< /Length %d /Length1 %d /Filter /FlateDecode >>'
+                        % (len(compressed_font), len(font_file)), compressed_font),
+            _pdf_object(cmap_number, b'<< /Length %d /Filter /FlateDecode >>' % len(compressed_cmap),
+                        compressed_cmap),
+        ]
+
+
+class PdfTemplate:
+    """
+    The constant part of a certificate PDF: header, catalog, page and the
+    template image, serialized once. build() appends the text of one certificate.
+    """
+
+    def __init__(self, background, font):
+        self.font = font
+        width, height = background.size
+        self.page_width = width * POINTS_PER_PIXEL
+        self.page_height = height * POINTS_PER_PIXEL
+
+        image = _png_idat(background.convert('RGB'))
+        objects = [
+            _pdf_object(1, b'<< /Type /Catalog /Pages 2 0 R >>'),
+            _pdf_object(2, b'<< /Type /Pages /Kids [3 0 R] /Count 1 >>'),
+            _pdf_object(3, b'<< /Type /Page /Parent 2 0 R /MediaBox [0 0 %s %s] '
+                        b'/Resources << /XObject << /Template 4 0 R >> /Font << /F1 5 0 R >> >> '
+                        b'/Contents 9 0 R >>' % (self._number(self.page_width), self._number(self.page_height))),
+            _pdf_object(4, b'<< /Type /XObject /Subtype /Image /Width %d /Height %d /ColorSpace /DeviceRGB '
+                        b'/BitsPerComponent 8 /Length %d /Filter /FlateDecode '
+                        b'/DecodeParms << /Predictor 15 /Colors 3 /BitsPerComponent 8 /Columns %d >> >>'
+                        % (width, height, len(image), width), image),
+        ]
+        self.prefix = b'%PDF-1.4\n%\xe2\xe3\xcf\xd3\n'
+        self.offsets = []
+        for pdf_object in objects:
+            self.offsets.append(len(self.prefix))
+            self.prefix += pdf_object
+
+    @staticmethod
+    def _number(value):
+        return (b'%.2f' % value).rstrip(b'0').rstrip(b'.')
+
+    def build(self, texts):
+        """
+        The PDF with `texts` on the template: (text, (x, y), size, ascent, fill)
+        in template pixels, as they are drawn on the raster certificate, with
+        (x, y) the top-left corner of the text and fill an RGB(A) tuple. An x
+        of None centres the text on the page.
+        """
+        codes = sorted({ord(char) for text, *_ in texts for char in text})
+        if len(codes) > MAX_SUBSET_CHARACTERS:
+            raise SubsetTooLarge(f'A PDF certificate can use at most {MAX_SUBSET_CHARACTERS} different characters')
+        index = {code: position for position, code in enumerate(codes)}
+
+        number = self._number
+        content = [b'q %s 0 0 %s 0 0 cm /Template Do Q' % (number(self.page_width), number(self.page_height))]
+        for text, (x, y), size, ascent, fill in texts:
+            encoded = bytes(index[ord(char)] for char in text).hex().encode()
+            size = size * POINTS_PER_PIXEL
+            if x is None:
+                left = (self.page_width - self.font.text_width(text, size)) / 2
+            else:
+                left = x * POINTS_PER_PIXEL
+            content.append(
+                b'BT /F1 %s Tf %s %s %s rg %s %s Td <%s> Tj ET' % (
+                    number(size),
+                    *(number(channel / 255) for channel in fill[:3]),
+                    number(left),
+                    number(self.page_height - (y + ascent) * POINTS_PER_PIXEL),
+                    encoded,
+                )
+            )
+        content = zlib.compress(b'\n'.join(content))
+
+        objects = self.font.subset_objects(5, codes)
+        objects.append(_pdf_object(9, b'<< /Length %d /Filter /FlateDecode >>' % len(content), content))
+
+        output = [self.prefix]
+        offsets = list(self.offsets)
+        position = len(self.prefix)
+        for pdf_object in objects:
+            offsets.append(position)
+            output.append(pdf_object)
+            position += len(pdf_object)
+
+        output.append(b'xref\n0 %d\n0000000000 65535 f \n' % (PAGE_OBJECTS + 1))
+        output.extend(b'%010d 00000 n \n' % offset for offset in offsets)
+        output.append(b'trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n' % (PAGE_OBJECTS + 1, position))
+        return b''.join(output)
@@ -0,0 +1,144 @@
+from itertools import islice
+import multiprocessing
+import os
+import time
+
+from django.conf import settings
+from django.db import connections, transaction
+from django.utils import timezone
+
+from .certificates import RENDERERS
+from .models import CertificateJob
+from .utils import (
+    CERTIFICATE_CONTENT_TYPES, CERTIFICATE_LAYOUTS, certificate_fields, certificate_relative_path,
+    certificate_thumbnail_path, render_certificate_file, warm_certificate_renderers
+)
+
+
+class RegenerationStats:
+    """Counters of one regeneration run for a test type"""
+    def __init__(self, kind, processes):
+        self.kind = kind
+        self.processes = processes
+        self.current = 0
+        self.rendered = 0
+        self.reused = 0
+        self.elapsed = 0.0
+
+    @property
+    def per_second(self):
+        return self.rendered / self.elapsed if self.elapsed else 0.0
+
+    @property
+    def per_core(self):
+        return self.per_second / self.processes
+
+
+def _render_task(task):
+    """Pool worker: render one certificate from plain values; returns (pk, path, rendered)"""
+    kind, pk, name, score, date_text, overwrite = task
+    filepath = os.path.join(settings.MEDIA_ROOT, certificate_relative_path(kind, name, score, date_text))
+    existed = os.path.exists(filepath)
+    return pk, render_certificate_file(kind, name, score, date_text, overwrite=overwrite), overwrite or not existed
+
+
+def _save_paths(kind, paths):
+    """Store the new certificate paths of a chunk and close any job still queued for those results"""
+    model, _ = RENDERERS[kind]
+    with transaction.atomic():
+        model.objects.bulk_update(
+            [model(pk=pk, certificate_path=path) for pk, path in paths.items()],
+            ['certificate_path'], batch_size=1000
+        )
+        CertificateJob.objects.filter(test_type=kind, result_id__in=list(paths)).exclude(
+            status=CertificateJob.STATUS_DONE
+        ).update(status=CertificateJob.STATUS_DONE, error='', finished_at=timezone.now())
+
+
+def regenerate_certificates(kind, processes=None, chunk_size=500, force=False, progress=None):
+    """
+    Render the certificate of every result of a test type with the current
+    template and layout, on a pool of `processes` worker processes (default:
+    one per core), and store the new paths with bulk_update chunk by chunk.
+
+    Results whose stored path already is the current content-addressed file
+    are skipped, so an interrupted run resumes where it stopped; `force`
+    re-renders every file. `progress(stats)` is called after each chunk.
+    """
+    model, _ = RENDERERS[kind]
+    processes = processes or os.cpu_count() or 1
+    stats = RegenerationStats(kind, processes)
+
+    # Workers are forked with the template and fonts already loaded and
+    # without database connections (they only draw and write files)
+    warm_certificate_renderers()
+    connections.close_all()
+
+    rows = model.objects.select_related('session__registration').only(
+        'total_score', 'created_at', 'certificate_path', 'session__started_at', 'session__registration__name'
+    ).order_by('pk').iterator(chunk_size=chunk_size)
+
+    started = time.perf_counter()
+    with multiprocessing.get_context('fork').Pool(processes) as pool:
+        while True:
+            chunk = list(islice(rows, chunk_size))
+            if not chunk:
+                break
+
+            tasks = []
+            for result in chunk:
+                fields = certificate_fields(kind, result.session.registration, result)
+                current = certificate_relative_path(kind, *fields)
+                if (not force and result.certificate_path == current
+                        and os.path.exists(os.path.join(settings.MEDIA_ROOT, current))):
+                    stats.current += 1
+                    continue
+                tasks.append((kind, result.pk, *fields, force))
+
+            paths = {}
+            for pk, path, rendered in pool.imap_unordered(_render_task, tasks, chunksize=8):
+                paths[pk] = path
+                if rendered:
+                    stats.rendered += 1
+                else:
+                    stats.reused += 1
+            if paths:
+                _save_paths(kind, paths)
+
+            stats.elapsed = time.perf_counter() - started
+            if progress:
+                progress(stats)
+
+    stats.elapsed = time.perf_counter() - started
+    return stats
+
+
+def delete_stale_certificates(kind, older_than):
+    """
+    Remove certificate files of a test type that no result points to, e.g. the
+    files of the previous template or encoding after a regeneration. Files
+    modified after `older_than` (a timestamp) are kept, as they may belong to a
+    result whose path is being saved right now. PDF certificates are never
+    referenced and are removed too; they are written again on their next
+    download. Thumbnails go with their certificate. Returns the number of
+    files removed.
+    """
+    model, _ = RENDERERS[kind]
+    _, directory, prefix, _ = CERTIFICATE_LAYOUTS[kind]
+    referenced = set(model.objects.exclude(certificate_path='').values_list('certificate_path', flat=True))
+    referenced |= {certificate_thumbnail_path(path) for path in referenced}
+
+    removed = 0
+    for subdirectory in (directory, (*directory, 'thumbnails')):
+        certificates_dir = os.path.join(settings.MEDIA_ROOT, *subdirectory)
+        if not os.path.isdir(certificates_dir):
+            continue
+        for entry in os.scandir(certificates_dir):
+            extension = os.path.splitext(entry.name)[1].lstrip('.')
+            if not (entry.is_file() and entry.name.startswith(prefix) and extension in CERTIFICATE_CONTENT_TYPES):
+                continue
+            if os.path.join(*subdirectory, entry.name) in referenced or entry.stat().st_mtime >= older_than:
+                continue
+            os.remove(entry.path)
+            removed += 1
+    return removed
@@ -0,0 +1,166 @@
+from decimal import Decimal
+from itertools import islice
+import math
+
+import numpy as np
+from django.db import transaction
+from django.utils import timezone
+
+from .models import TestResult, JuniorTestResult
+from .scoring import get_scoring_plan
+from .stats import invalidate_dashboard_stats, refresh_daily_stats
+
+
+RESULT_MODELS = {
+    'adult': TestResult,
+    'junior': JuniorTestResult,
+}
+
+
+def membership_matrix(plan):
+    """(questions × traits) 0/1 matrix; questions that are not scored get an empty row"""
+    membership = np.zeros((len(plan), len(plan.trait_ids)), dtype=np.float64)
+    for row, trait_index in enumerate(plan.question_traits):
+        if trait_index is not None:
+            membership[row, trait_index] = 1.0
+    return membership
+
+
+def answers_matrix(plan, answers_rows):
+    """Dense (sessions × questions) matrix of stored answers, missing answers are 0"""
+    keys = plan.question_keys
+    return np.array(
+        [[answers.get(key, 0.0) for key in keys] for answers in answers_rows],
+        dtype=np.float64
+    ).reshape(len(answers_rows), len(keys))
+
+
+def score_matrix(plan, matrix, membership=None):
+    """
+    Vectorized version of ScoringPlan.score for many sessions at once.
+    Returns (final_scores, trait_sums, percentages, weighted_scores) arrays, where
+    percentages are 0-100 and weighted scores are percentage/100 × weight.
+    """
+    if membership is None:
+        membership = membership_matrix(plan)
+    weights = np.array([float(weight) for weight in plan.weights], dtype=np.float64)
+    max_scores = np.array(plan.trait_question_counts, dtype=np.float64) * 2.0
+
+    trait_sums = matrix @ membership
+    ratios = trait_sums / max_scores
+    weighted = ratios * weights
+
+    total_weight = weights.sum()
+    if total_weight > 0:
+        final_scores = weighted.sum(axis=1) / total_weight * 100
+    else:
+        final_scores = np.zeros(len(matrix))
+
+    return final_scores, trait_sums, ratios * 100, weighted
+
+
+def _trait_results(plan, sums, percentages, weighted):
+    """Rebuild the per-trait JSON payload stored on a result row (plain lists in, dict out)"""
+    trait_results = {}
+    for index, name in enumerate(plan.trait_names):
+        trait_results[name] = {
+            'percentage': percentages[index],
+            'weighted_score': weighted[index],
+            'weight': float(plan.weights[index]),
+        }
+        if plan.kind == 'adult':
+            trait_results[name].update({
+                'score': sums[index],
+                'total_score': float(plan.trait_question_counts[index] * 2),
+                'questions_count': plan.trait_question_counts[index],
+            })
+    return trait_results
+
+
+def _same_trait_scores(old_trait_results, new_trait_results):
+    """Compare stored trait scores with recomputed ones, ignoring float noise"""
+    old_trait_results = old_trait_results or {}
+    if old_trait_results.keys() != new_trait_results.keys():
+        return False
+    for name, new_values in new_trait_results.items():
+        old_values = old_trait_results[name]
+        if old_values.keys() != new_values.keys():
+            return False
+        for key, value in new_values.items():
+            if not math.isclose(old_values[key], value, rel_tol=1e-9, abs_tol=1e-9):
+                return False
+    return True
+
+
+def rescore(kind, chunk_size=5000, dry_run=False):
+    """
+    Recompute total_score and trait scores of every completed result of the given
+    test type ('adult' or 'junior') with the current question bank and weights.
+
+    Sessions are loaded chunk by chunk into a dense answers matrix, multiplied by the
+    trait-membership matrix and weight vector, and only changed rows are written back
+    with bulk_update. bulk_update sends no signals, so the daily rollups of days whose
+    scores changed, and the cached dashboard, are refreshed at the end. Returns a list
+    of (result_id, old_score, new_score) for every result whose total score changed.
+    """
+    model = RESULT_MODELS[kind]
+    plan = get_scoring_plan(kind)
+    membership = membership_matrix(plan)
+
+    rows = model.objects.filter(session__is_completed=True).order_by('pk').values_list(
+        'pk', 'total_score', 'trait_scores_json', 'session__answers_json', 'created_at'
+    ).iterator(chunk_size=chunk_size)
+
+    changes = []
+    changed_days = set()
+    rewritten = 0
+    while True:
+        chunk = list(islice(rows, chunk_size))
+        if not chunk:
+            break
+
+        answers_rows = [answers_json or {} for _, _, _, answers_json, _ in chunk]
+        final_scores, trait_sums, percentages, weighted = score_matrix(
+            plan, answers_matrix(plan, answers_rows), membership
+        )
+
+        # Plain Python lists are much cheaper to index row by row than numpy arrays
+        final_scores = final_scores.round(2).tolist()
+        trait_sums, percentages, weighted = trait_sums.tolist(), percentages.tolist(), weighted.tolist()
+
+        to_update = []
+        for row, (pk, old_score, old_trait_results, _, created_at) in enumerate(chunk):
+            new_score = Decimal(str(final_scores[row])).quantize(Decimal('0.01'))
+            new_trait_results = _trait_results(plan, trait_sums[row], percentages[row], weighted[row])
+            if new_score == old_score and _same_trait_scores(old_trait_results, new_trait_results):
+                continue
+            if new_score != old_score:
+                changes.append((pk, old_score, new_score))
+                changed_days.add(timezone.localdate(created_at))
+            to_update.append(model(
+                pk=pk,
+                total_score=new_score,
+                trait_scores_json=new_trait_results
+            ))
+
+        if to_update and not dry_run:
+            rewritten += len(to_update)
+            with transaction.atomic():
+                model.objects.bulk_update(to_update, ['total_score', 'trait_scores_json'], batch_size=1000)
+
+                # Keep the normalized per-trait rows in step with the JSON
+                score_model = plan.trait_score_model
+                score_model.objects.filter(result_id__in=[obj.pk for obj in to_update]).delete()
+                score_model.objects.bulk_create(
+                    [row for obj in to_update for row in plan.trait_score_rows(obj, obj.trait_scores_json)],
+                    batch_size=1000
+                )
+
+    if not dry_run:
+        for day in sorted(changed_days):
+            refresh_daily_stats(kind, day)
+    if rewritten:
+        # The dashboard's per-trait averages come from the rewritten trait rows
+        invalidate_dashboard_stats()
+
+    return changes
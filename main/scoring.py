@@ -0,0 +1,320 @@
+from decimal import Decimal
+import threading
+
+from django.db.models import F
+
+from .metrics import record_cache
+
+from .models import Question, QuestionBankVersion, Trait, TraitScore, JuniorQuestion, JuniorTraitScore
+
+
+ANSWER_VALUES = frozenset([0.0, 0.5, 1.0, 1.5, 2.0])
+
+_plans = {}
+_plans_lock = threading.Lock()
+
+
+class InvalidAnswer(ValueError):
+    """A submitted answer is not one of the allowed choices"""
+
+
+class ScoringPlan:
+    """
+    Compiled, read-only view of a question bank used to score submissions.
+
+    Holds everything scoring needs (trait ids, names, weights, the ordered
+    question ids, the question -> trait index array and reverse-scored flags)
+    so scoring a set of answers does not touch the database.
+    """
+    kind = None
+
+    def __init__(self, version, traits, question_ids, question_traits, reverse_flags):
+        self.version = version
+        # traits: list of dicts {'id', 'name', 'name_en', 'weight'} in display order
+        self.trait_ids = [trait['id'] for trait in traits]
+        self.trait_names = [trait['name'] for trait in traits]
+        self.trait_names_en = [trait['name_en'] for trait in traits]
+        self.weights = [Decimal(str(trait['weight'])) for trait in traits]
+        # Question arrays, aligned by position
+        self.question_ids = list(question_ids)
+        self.question_keys = [str(question_id) for question_id in self.question_ids]
+        self.question_traits = list(question_traits)
+        self.reverse_flags = list(reverse_flags)
+        self.trait_question_counts = [0] * len(self.trait_ids)
+        for trait_index in self.question_traits:
+            if trait_index is not None:
+                self.trait_question_counts[trait_index] += 1
+
+    def __len__(self):
+        return len(self.question_ids)
+
+    def _parse_answer(self, answer_key, value, is_reverse):
+        try:
+            raw_answer = float(value)
+        except (TypeError, ValueError):
+            raise InvalidAnswer(answer_key)
+        if raw_answer not in ANSWER_VALUES:
+            raise InvalidAnswer(answer_key)
+
+        # Reverse the score: 2->0, 1.5->0.5, 1->1, 0.5->1.5, 0->2
+        if is_reverse:
+            raw_answer = 2.0 - raw_answer
+        return raw_answer
+
+    def parse_answers(self, data, saved=None):
+        """
+        Build the stored answers dict from submitted form data.
+        Reverse scoring is applied here. Questions missing from the form fall back
+        to the already saved (autosaved) answer, and unanswered questions get 0 points.
+        Raises InvalidAnswer if a value is not one of the answer choices.
+        """
+        saved = saved or {}
+        answers = {}
+        for key, is_reverse in zip(self.question_keys, self.reverse_flags):
+            answer_key = f'question_{key}'
+            if answer_key in data:
+                answers[key] = self._parse_answer(answer_key, data[answer_key], is_reverse)
+            else:
+                answers[key] = saved.get(key, 0.0)
+        return answers
+
+    def parse_answer_delta(self, data):
+        """
+        Parse a partial set of answers (an autosave), keeping only the questions
+        present in data. Keys of questions not in the plan are ignored.
+        """
+        answers = {}
+        for key, is_reverse in zip(self.question_keys, self.reverse_flags):
+            answer_key = f'question_{key}'
+            if answer_key in data:
+                answers[key] = self._parse_answer(answer_key, data[answer_key], is_reverse)
+        return answers
+
+    def form_answers(self, answers):
+        """
+        Inverse of parse_answers for answers saved so far: the radio values to
+        re-check on the form, keyed by input name (reverse scoring undone).
+        """
+        values = {}
+        for key, is_reverse in zip(self.question_keys, self.reverse_flags):
+            if key in answers:
+                value = 2.0 - answers[key] if is_reverse else answers[key]
+                values[f'question_{key}'] = f'{value:g}'
+        return values
+
+    def score(self, answers):
+        """Return (final_score, trait_results) for an answers dict"""
+        raise NotImplementedError
+
+    def trait_score_rows(self, result, trait_results):
+        """Unsaved per-trait score rows for a result scored with this plan"""
+        return [
+            self.trait_score_model(
+                result=result,
+                trait_id=trait_id,
+                percentage=trait_results[name]['percentage'],
+                weighted_score=trait_results[name]['weighted_score']
+            )
+            for trait_id, name in zip(self.trait_ids, self.trait_names)
+            if name in trait_results
+        ]
+
+    @classmethod
+    def build(cls, version):
+        raise NotImplementedError
+
+
+class AdultScoringPlan(ScoringPlan):
+    """Scoring plan for the adult test (active traits with active questions)"""
+    kind = 'adult'
+    trait_score_model = TraitScore
+
+    @classmethod
+    def build(cls, version):
+        traits = list(
+            Trait.objects.filter(is_active=True).values('id', 'name', 'name_en', 'weight')
+        )
+        trait_index = {trait['id']: index for index, trait in enumerate(traits)}
+
+        # Every active question is parsed from the form, but only questions of
+        # active traits count towards the score (question_traits entry is None)
+        questions = Question.objects.filter(is_active=True).order_by('order', 'id').values_list(
+            'id', 'trait_id', 'is_reverse_scored'
+        )
+
+        question_ids, question_traits, reverse_flags = [], [], []
+        for question_id, trait_id, is_reverse in questions:
+            question_ids.append(question_id)
+            question_traits.append(trait_index.get(trait_id))
+            reverse_flags.append(is_reverse)
+
+        # Traits without active questions are skipped by the scoring methodology
+        counts = [0] * len(traits)
+        for index in question_traits:
+            if index is not None:
+                counts[index] += 1
+        kept = [index for index, count in enumerate(counts) if count]
+        remap = {old: new for new, old in enumerate(kept)}
+
+        return cls(
+            version,
+            [traits[index] for index in kept],
+            question_ids,
+            [remap.get(index) for index in question_traits],
+            reverse_flags,
+        )
+
+    def score(self, answers):
+        """
+        Calculate test results following the EXACT methodology from documentation:
+        1. For each trait: percentage = score / totalScore (where totalScore = questions × 2)
+        2. weightedScore = percentage × relativeWeight
+        3. Sum all weightedScores
+        4. finalScore = (Σ weightedScores / Σ relativeWeights) × 100
+        """
+        trait_sums = [Decimal('0')] * len(self.trait_ids)
+        for key, trait_index in zip(self.question_keys, self.question_traits):
+            # Answer values are already reversed if needed during form submission
+            if trait_index is not None:
+                trait_sums[trait_index] += Decimal(str(answers.get(key, 0.0)))
+
+        total_weighted_score = Decimal('0')
+        total_weights = Decimal('0')
+        trait_results = {}
+
+        for index, name in enumerate(self.trait_names):
+            questions_count = self.trait_question_counts[index]
+            trait_score = trait_sums[index]
+            total_score = Decimal(str(questions_count * 2))
+            percentage = trait_score / total_score
+            relative_weight = self.weights[index]
+            weighted_score = percentage * relative_weight
+
+            total_weighted_score += weighted_score
+            total_weights += relative_weight
+
+            trait_results[name] = {
+                'percentage': float(percentage * 100),  # Display as 0-100%
+                'weighted_score': float(weighted_score),
+                'weight': float(relative_weight),
+                'score': float(trait_score),
+                'total_score': float(total_score),
+                'questions_count': questions_count
+            }
+
+        if total_weights > 0:
+            final_score = (total_weighted_score / total_weights) * Decimal('100')
+        else:
+            final_score = Decimal('0')
+
+        return final_score, trait_results
+
+
+class JuniorScoringPlan(ScoringPlan):
+    """Scoring plan for the junior test (all active questions, grouped by trait)"""
+    kind = 'junior'
+    trait_score_model = JuniorTraitScore
+
+    @classmethod
+    def build(cls, version):
+        questions = JuniorQuestion.objects.filter(is_active=True).order_by('order', 'id').values_list(
+            'id', 'trait_id', 'is_reverse_scored',
+            'trait__name', 'trait__name_en', 'trait__weight',
+        )
+
+        traits, trait_index = [], {}
+        question_ids, question_traits, reverse_flags = [], [], []
+        for question_id, trait_id, is_reverse, name, name_en, weight in questions:
+            # Traits are ordered by first appearance, as in the original grouping
+            if trait_id not in trait_index:
+                trait_index[trait_id] = len(traits)
+                traits.append({'id': trait_id, 'name': name, 'name_en': name_en, 'weight': weight})
+            question_ids.append(question_id)
+            question_traits.append(trait_index[trait_id])
+            reverse_flags.append(is_reverse)
+
+        return cls(version, traits, question_ids, question_traits, reverse_flags)
+
+    def score(self, answers):
+        """Calculate the junior score: weighted average of per-trait percentages"""
+        trait_sums = [0] * len(self.trait_ids)
+        for key, trait_index in zip(self.question_keys, self.question_traits):
+            trait_sums[trait_index] += float(answers.get(key, 0.0))
+
+        trait_results = {}
+        total_weighted_score = Decimal('0')
+        total_weight = Decimal('0')
+
+        for index, name in enumerate(self.trait_names):
+            max_score = self.trait_question_counts[index] * 2.0
+            trait_percentage = Decimal(str(trait_sums[index] / max_score * 100))
+            trait_weight_decimal = self.weights[index]
+            weighted_score = (trait_percentage * trait_weight_decimal) / Decimal('100')
+
+            trait_results[name] = {
+                'percentage': float(trait_percentage),
+                'weighted_score': float(weighted_score),
+                'weight': float(trait_weight_decimal)
+            }
+
+            total_weighted_score += weighted_score
+            total_weight += trait_weight_decimal
+
+        if total_weight > 0:
+            total_score = (total_weighted_score / total_weight) * Decimal('100')
+        else:
+            total_score = Decimal('0')
+
+        return total_score, trait_results
+
+
+PLAN_CLASSES = {
+    AdultScoringPlan.kind: AdultScoringPlan,
+    JuniorScoringPlan.kind: JuniorScoringPlan,
+}
+
+
+def get_bank_version(kind):
+    """
+    Current question-bank version for 'adult' or 'junior'.
+    Stored in the database, so an edit made in one worker invalidates the
+    plans (and the cached question markup) of every other worker on their
+    next request.
+    """
+    version = QuestionBankVersion.objects.filter(test_type=kind).values_list('version', flat=True).first()
+    return version or 1
+
+
+def bump_bank_version(kind):
+    """Invalidate compiled plans (and anything keyed on the bank version)"""
+    versions = QuestionBankVersion.objects.filter(test_type=kind)
+    if not versions.update(version=F('version') + 1):
+        _, created = versions.get_or_create(test_type=kind, defaults={'version': 2})
+        if not created:
+            # Another worker created the row first
+            versions.update(version=F('version') + 1)
+    with _plans_lock:
+        _plans.pop(kind, None)
+
+
+def get_scoring_plan(kind):
+    """
+    Return the compiled plan for the current bank version, building it if stale.
+
+    Checking the version costs one indexed single-row query per call. It is
+    not cached in the process, since a worker holding on to an old version
+    would score submissions against a bank that was already edited.
+    """
+    version = get_bank_version(kind)
+    plan = _plans.get(kind)
+    if plan is not None and plan.version == version:
+        record_cache('scoring_plan', True)
+        return plan
+    record_cache('scoring_plan', False)
+
+    with _plans_lock:
+        plan = _plans.get(kind)
+        if plan is None or plan.version != version:
+            plan = PLAN_CLASSES[kind].build(version)
+            _plans[kind] = plan
+    return plan
@@ -0,0 +1,255 @@
+from datetime import timedelta
+
+from django.db import models, transaction
+from django.db.models import F, Func, Q, Value
+from django.utils import timezone
+
+from .certificates import enqueue_certificate
+from .metrics import SCORING_DURATION, SUBMISSIONS
+from .models import TestRegistration, TestSession, TestResult
+from .models import JuniorTestRegistration, JuniorTestSession, JuniorTestResult
+from .models import SUBMISSION_GRACE
+from .scoring import InvalidAnswer, get_scoring_plan
+from .stats import invalidate_dashboard_stats, refresh_daily_stats
+
+
+SUBMISSION_MODELS = {
+    'adult': (TestRegistration, TestSession, TestResult),
+    'junior': (JuniorTestRegistration, JuniorTestSession, JuniorTestResult),
+}
+
+
+AUTOSAVE_MIN_INTERVAL = 2  # seconds between two autosaves of the same session
+
+
+class SessionAlreadySubmitted(Exception):
+    """The session was completed by another request in the meantime"""
+
+
+class AutosaveRateLimited(Exception):
+    """The session was autosaved less than AUTOSAVE_MIN_INTERVAL seconds ago"""
+
+
+class JSONMerge(Func):
+    """Shallow merge of a JSON object into a JSON column, evaluated by the database"""
+    output_field = models.JSONField()
+
+    def as_sql(self, compiler, connection, **extra_context):
+        return super().as_sql(compiler, connection, function='JSON_PATCH', **extra_context)
+
+    def as_postgresql(self, compiler, connection, **extra_context):
+        lhs, rhs = self.get_source_expressions()
+        lhs_sql, lhs_params = compiler.compile(lhs)
+        rhs_sql, rhs_params = compiler.compile(rhs)
+        return f"(COALESCE({lhs_sql}, '{{}}'::jsonb) || {rhs_sql}::jsonb)", (*lhs_params, *rhs_params)
+
+    def as_mysql(self, compiler, connection, **extra_context):
+        return super().as_sql(compiler, connection, function='JSON_MERGE_PATCH', **extra_context)
+
+
+def start_session_clock(kind, session):
+    """
+    Start the server-side timer of a session the first time its test page is
+    served: deadline = now + the test's TIME_LIMIT. Later calls keep the
+    original deadline, so reloading the page does not reset the clock.
+    """
+    if session.deadline is not None:
+        return session.deadline
+
+    _, session_model, _ = SUBMISSION_MODELS[kind]
+    deadline = timezone.now() + session.TIME_LIMIT
+    if session_model.objects.filter(pk=session.pk, deadline__isnull=True).update(deadline=deadline):
+        session.deadline = deadline
+    else:
+        session.deadline = session_model.objects.values_list('deadline', flat=True).get(pk=session.pk)
+    return session.deadline
+
+
+def time_taken_minutes(session, completed_at):
+    """Whole minutes between the start of the clock and the submission, capped at the deadline"""
+    if session.deadline is not None:
+        started_at = session.deadline - session.TIME_LIMIT
+        completed_at = min(completed_at, session.deadline)
+    else:
+        started_at = session.started_at
+    return int((completed_at - started_at).total_seconds() / 60)
+
+
+def build_result(kind, plan, session, answers, completed_at):
+    """Score answers and return the unsaved result and its unsaved per-trait rows"""
+    _, _, result_model = SUBMISSION_MODELS[kind]
+    final_score, trait_results = plan.score(answers)
+    result = result_model(
+        session=session,
+        # The junior flow has always stored the float score
+        total_score=float(final_score) if kind == 'junior' else final_score,
+        trait_scores_json=trait_results,
+        time_taken_minutes=time_taken_minutes(session, completed_at)
+    )
+    return result, plan.trait_score_rows(result, trait_results)
+
+
+def submit_test(kind, session, data):
+    """
+    Validate, score and persist a test submission for 'adult' or 'junior'.
+
+    Answers are parsed and scored against the compiled scoring plan before any
+    write, then the session, the registration flag, the result, its per-trait
+    score rows and the certificate job are written in one transaction with a
+    fixed number of queries, whatever the number of questions.
+
+    Past the session's deadline the posted answers are ignored and the session
+    is finalized with the answers autosaved in time.
+
+    Raises InvalidAnswer for out-of-range answers and SessionAlreadySubmitted
+    if the session was completed concurrently.
+    """
+    registration_model, session_model, _ = SUBMISSION_MODELS[kind]
+    plan = get_scoring_plan(kind)
+
+    completed_at = timezone.now()
+    if session.is_expired(completed_at):
+        data = {}
+        completed_at = session.deadline
+
+    # Answers already autosaved need not be posted again
+    with SCORING_DURATION.time(test_type=kind):
+        answers = plan.parse_answers(data, saved=session.get_answers())
+        result, trait_rows = build_result(kind, plan, session, answers, completed_at)
+
+    with transaction.atomic():
+        # Conditional UPDATE doubles as a guard against double submission
+        updated = session_model.objects.filter(pk=session.pk, is_completed=False).update(
+            answers_json=answers,
+            completed_at=completed_at,
+            is_completed=True
+        )
+        if not updated:
+            raise SessionAlreadySubmitted(session.pk)
+
+        registration_model.objects.filter(pk=session.registration_id).update(has_taken_test=True)
+
+        result.save(force_insert=True)
+
+        # Normalized per-trait rows for SQL analytics, in a single INSERT
+        plan.trait_score_model.objects.bulk_create(trait_rows)
+
+        # Rendered in the background once the transaction commits
+        enqueue_certificate(kind, result)
+
+    SUBMISSIONS.inc(test_type=kind)
+    session.answers_json = answers
+    session.completed_at = completed_at
+    session.is_completed = True
+    return result
+
+
+def finalize_expired_sessions(kind, batch_size=500):
+    """
+    Finalize open sessions whose deadline (plus grace) has passed, scoring the
+    answers autosaved in time; unanswered questions get 0, as with the client's
+    auto-submit. Each batch is written with bulk queries in one transaction
+    and its certificates are queued like those of a live submission. Results
+    are dated at the deadline, and the rollup rows of those days and the
+    dashboard snapshot are refreshed afterwards, since bulk writes send no
+    signals.
+    Returns the number of finalized sessions.
+    """
+    registration_model, session_model, result_model = SUBMISSION_MODELS[kind]
+    plan = get_scoring_plan(kind)
+    expired = session_model.objects.filter(
+        is_completed=False, deadline__lt=timezone.now() - SUBMISSION_GRACE
+    )
+
+    finalized, days = 0, set()
+    while True:
+        with transaction.atomic():
+            # Rows a live submission is writing are skipped (PostgreSQL)
+            sessions = list(expired.select_for_update(skip_locked=True).order_by('deadline', 'pk')[:batch_size])
+            if not sessions:
+                break
+
+            results, trait_rows = [], []
+            for session in sessions:
+                session.answers_json = plan.parse_answers({}, saved=session.get_answers())
+                session.completed_at = session.deadline
+                session.is_completed = True
+                result, rows = build_result(kind, plan, session, session.answers_json, session.deadline)
+                results.append(result)
+                trait_rows.extend(rows)
+
+            session_model.objects.bulk_update(sessions, ['answers_json', 'completed_at', 'is_completed'])
+            registration_model.objects.filter(
+                pk__in=[session.registration_id for session in sessions]
+            ).update(has_taken_test=True)
+            result_model.objects.bulk_create(results)
+            # created_at is stamped with the time of the insert; the session ended at its deadline
+            for result in results:
+                result.created_at = result.session.deadline
+            result_model.objects.bulk_update(results, ['created_at'])
+            plan.trait_score_model.objects.bulk_create(trait_rows)
+            for result in results:
+                enqueue_certificate(kind, result)
+
+        finalized += len(sessions)
+        days.update(timezone.localdate(session.deadline) for session in sessions)
+
+    for day in sorted(days):
+        refresh_daily_stats(kind, day)
+    if finalized:
+        invalidate_dashboard_stats()
+    return finalized
+
+
+def purge_abandoned_sessions(kind, older_than=timedelta(days=1), batch_size=1000):
+    """
+    Delete sessions whose test page was never opened (no deadline) and that are
+    older than older_than, in batches. The candidate can register again and
+    gets a new session. Returns the number of deleted sessions.
+    """
+    _, session_model, _ = SUBMISSION_MODELS[kind]
+    abandoned = session_model.objects.filter(
+        is_completed=False, deadline__isnull=True, started_at__lt=timezone.now() - older_than
+    )
+
+    purged = 0
+    while True:
+        batch = list(abandoned.order_by('pk').values_list('pk', flat=True)[:batch_size])
+        if not batch:
+            break
+        session_model.objects.filter(pk__in=batch).delete()
+        purged += len(batch)
+    return purged
+
+
+def autosave_answers(kind, session_id, data):
+    """
+    Merge a delta of answers into an in-progress session with a single UPDATE.
+
+    Only the posted questions are validated and written; the stored answers are
+    merged by the database instead of being read, modified and written back.
+    Returns the number of answers saved. Raises InvalidAnswer for out-of-range
+    answers, AutosaveRateLimited when called again within AUTOSAVE_MIN_INTERVAL
+    and SessionAlreadySubmitted if the session is completed, past its deadline
+    or does not exist.
+    """
+    _, session_model, _ = SUBMISSION_MODELS[kind]
+    delta = get_scoring_plan(kind).parse_answer_delta(data)
+    if not delta:
+        return 0
+
+    now = timezone.now()
+    # Answers arriving after the deadline are not accepted
+    on_time = Q(deadline__isnull=True) | Q(deadline__gte=now - SUBMISSION_GRACE)
+    sessions = session_model.objects.filter(on_time, pk=session_id, is_completed=False)
+    # The last autosave is stamped on the row, so the limit holds across worker processes
+    rested = Q(autosaved_at__isnull=True) | Q(autosaved_at__lte=now - timedelta(seconds=AUTOSAVE_MIN_INTERVAL))
+    updated = sessions.filter(rested).update(
+        answers_json=JSONMerge(F('answers_json'), Value(delta, output_field=models.JSONField())),
+        autosaved_at=now
+    )
+    if not updated:
+        if sessions.exists():
+            raise AutosaveRateLimited(session_id)
+        raise SessionAlreadySubmitted(session_id)
+    return len(delta)
@@ -0,0 +1,48 @@
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from .models import Question, Trait, TestRegistration, TestResult
+from .models import JuniorQuestion, JuniorTrait, JuniorTestRegistration, JuniorTestResult
+from .scoring import bump_bank_version
+from .stats import invalidate_dashboard_stats, schedule_daily_stats_update
+
+
+@receiver([post_save, post_delete], sender=Trait)
+@receiver([post_save, post_delete], sender=Question)
+def invalidate_adult_bank(sender, **kwargs):
+    """Any trait/question change invalidates the compiled adult scoring plan"""
+    bump_bank_version('adult')
+    invalidate_dashboard_stats()
+
+
+@receiver([post_save, post_delete], sender=JuniorTrait)
+@receiver([post_save, post_delete], sender=JuniorQuestion)
+def invalidate_junior_bank(sender, **kwargs):
+    """Any junior trait/question change invalidates the compiled junior scoring plan"""
+    bump_bank_version('junior')
+    invalidate_dashboard_stats()
+
+
+@receiver([post_save, post_delete], sender=TestRegistration)
+@receiver([post_save, post_delete], sender=TestResult)
+@receiver([post_save, post_delete], sender=JuniorTestRegistration)
+@receiver([post_save, post_delete], sender=JuniorTestResult)
+def invalidate_dashboard(sender, **kwargs):
+    """New registrations and submissions make the cached dashboard counters stale"""
+    invalidate_dashboard_stats()
+
+
+@receiver(post_save, sender=TestRegistration)
+@receiver(post_save, sender=TestResult)
+def update_adult_daily_stats(sender, instance, created, raw=False, **kwargs):
+    """Keep today's adult rollup row current as people register and submit"""
+    if created and not raw:
+        schedule_daily_stats_update('adult', instance)
+
+
+@receiver(post_save, sender=JuniorTestRegistration)
+@receiver(post_save, sender=JuniorTestResult)
+def update_junior_daily_stats(sender, instance, created, raw=False, **kwargs):
+    """Keep today's junior rollup row current as people register and submit"""
+    if created and not raw:
+        schedule_daily_stats_update('junior', instance)
@@ -0,0 +1,226 @@
+from datetime import datetime, time, timedelta
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Avg, Count, ExpressionWrapper, F, FloatField, OuterRef, Q, Subquery
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .metrics import record_cache
+from .models import TestRegistration, Trait, TestSession, TestResult, TraitScore, DailyStats
+from .models import JuniorTestRegistration, JuniorTrait, JuniorTestResult, JuniorTraitScore
+
+
+DASHBOARD_STATS_KEY = 'director_dashboard_stats'
+DASHBOARD_STATS_TTL = 60
+TREND_DAYS = 14
+
+STATS_MODELS = {
+    'adult': (TestRegistration, Trait, TraitScore),
+    'junior': (JuniorTestRegistration, JuniorTrait, JuniorTraitScore),
+}
+
+ROLLUP_MODELS = {
+    'adult': (TestRegistration, TestResult),
+    'junior': (JuniorTestRegistration, JuniorTestResult),
+}
+
+
+def trait_average_subquery(score_model):
+    """Average percentage of a trait across all results, as a single indexed aggregate"""
+    return Subquery(
+        score_model.objects.filter(trait=OuterRef('pk'))
+        .values('trait')
+        .annotate(average=Avg('percentage'))
+        .values('average')[:1]
+    )
+
+
+def bank_counters(trait_model):
+    """Trait and question counts of a question bank in one aggregate query"""
+    return trait_model.objects.aggregate(
+        total_traits=Count('id', distinct=True),
+        total_questions=Count('questions'),
+        active_questions=Count('questions', filter=Q(questions__is_active=True)),
+    )
+
+
+def participation_counters(registration_model):
+    """Registrations and completed tests in one aggregate query"""
+    return registration_model.objects.aggregate(
+        total_registrations=Count('id'),
+        completed_tests=Count('id', filter=Q(test_session__is_completed=True)),
+    )
+
+
+def compute_dashboard_stats():
+    """
+    Build the director dashboard snapshot: adult and junior counters (two
+    conditional aggregates per test type), recent activity and per-trait stats.
+    Counters of the junior test are prefixed with 'junior_', as in the template.
+    """
+    stats = {}
+    for kind, (registration_model, trait_model, score_model) in STATS_MODELS.items():
+        prefix = 'junior_' if kind == 'junior' else ''
+        counters = {**bank_counters(trait_model), **participation_counters(registration_model)}
+        stats.update({prefix + name: value for name, value in counters.items()})
+
+        stats[prefix + 'trait_stats'] = list(trait_model.objects.annotate(
+            question_count=Count('questions'),
+            average_percentage=trait_average_subquery(score_model),
+        ))
+
+    stats['recent_registrations'] = list(TestRegistration.objects.order_by('-created_at')[:5])
+    stats['recent_sessions'] = list(
+        TestSession.objects.filter(is_completed=True)
+        .select_related('registration', 'result')
+        .order_by('-completed_at')[:5]
+    )
+    stats['daily_trend'] = daily_trend()
+    return stats
+
+
+def get_dashboard_stats():
+    """Cached dashboard snapshot; rebuilt after DASHBOARD_STATS_TTL seconds or an invalidation"""
+    stats = cache.get(DASHBOARD_STATS_KEY)
+    record_cache('dashboard_stats', stats is not None)
+    if stats is None:
+        stats = compute_dashboard_stats()
+        cache.set(DASHBOARD_STATS_KEY, stats, DASHBOARD_STATS_TTL)
+    return stats
+
+
+def invalidate_dashboard_stats():
+    cache.delete(DASHBOARD_STATS_KEY)
+
+
+def percentile(sorted_values, fraction):
+    """Linearly interpolated percentile of an ascending list, None if it is empty"""
+    if not sorted_values:
+        return None
+    position = (len(sorted_values) - 1) * fraction
+    lower = int(position)
+    upper = min(lower + 1, len(sorted_values) - 1)
+    return sorted_values[lower] + (sorted_values[upper] - sorted_values[lower]) * (position - lower)
+
+
+def day_bounds(day):
+    """[start, end) datetimes of a local calendar day"""
+    start = timezone.make_aware(datetime.combine(day, time.min))
+    return start, start + timedelta(days=1)
+
+
+def daily_stats_values(kind, day):
+    """Registrations, completions and score / time statistics of one day for a test type"""
+    registration_model, result_model = ROLLUP_MODELS[kind]
+    start, end = day_bounds(day)
+
+    registrations = registration_model.objects.filter(created_at__gte=start, created_at__lt=end).count()
+    rows = list(
+        result_model.objects.filter(created_at__gte=start, created_at__lt=end)
+        .order_by('total_score')
+        .values_list('total_score', 'time_taken_minutes')
+    )
+    scores = [float(score) for score, _ in rows]
+    minutes = [taken for _, taken in rows]
+
+    return {
+        'registrations': registrations,
+        'completions': len(rows),
+        'mean_score': sum(scores) / len(scores) if scores else None,
+        'median_score': percentile(scores, 0.5),
+        'p90_score': percentile(scores, 0.9),
+        'mean_time_minutes': sum(minutes) / len(minutes) if minutes else None,
+        'score_sum': sum(scores),
+        'time_sum_minutes': sum(minutes),
+    }
+
+
+def refresh_daily_stats(kind, day):
+    """
+    Recompute the rollup row of one day, percentiles included. Used by batch
+    jobs (sweepers, rescoring, load tests) that write many rows at once.
+    """
+    stats, _ = DailyStats.objects.update_or_create(
+        date=day, test_type=kind, defaults=daily_stats_values(kind, day)
+    )
+    invalidate_dashboard_stats()
+    return stats
+
+
+def _float_ratio(numerator, denominator):
+    return ExpressionWrapper(numerator / denominator, output_field=FloatField())
+
+
+def increment_daily_stats(kind, day, registrations=0, score=None, minutes=0):
+    """
+    Add registrations, or one completion with its score and time, to the rollup
+    row of a day in a single UPDATE, so a submission costs the same however
+    busy the day is. The means follow from the sums; the median and 90th
+    percentile need every score of the day and are left to rebuild_daily_stats.
+    """
+    changes = {'registrations': F('registrations') + registrations}
+    if score is not None:
+        # The right-hand side reads the values from before the update
+        completions = F('completions') + 1
+        changes.update(
+            completions=completions,
+            score_sum=F('score_sum') + score,
+            time_sum_minutes=F('time_sum_minutes') + minutes,
+            mean_score=_float_ratio(F('score_sum') + score, completions),
+            mean_time_minutes=_float_ratio(F('time_sum_minutes') + minutes, completions),
+        )
+
+    rows = DailyStats.objects.filter(date=day, test_type=kind)
+    if not rows.update(**changes):
+        # First event of the day; get_or_create copes with another worker creating the row too
+        rows.get_or_create(date=day, test_type=kind)
+        rows.update(**changes)
+
+
+def schedule_daily_stats_update(kind, instance):
+    """Count a new registration or result in its day's rollup once the current transaction commits"""
+    day = timezone.localdate(instance.created_at)
+    if isinstance(instance, ROLLUP_MODELS[kind][1]):
+        increments = {'score': float(instance.total_score), 'minutes': instance.time_taken_minutes}
+    else:
+        increments = {'registrations': 1}
+    transaction.on_commit(lambda: increment_daily_stats(kind, day, **increments))
+
+
+def rebuild_daily_stats(kind, since=None):
+    """
+    Rebuild the rollup rows of a test type from the raw tables, optionally only
+    from the date `since` onwards. Returns the number of days written.
+    """
+    registration_model, result_model = ROLLUP_MODELS[kind]
+
+    days = set()
+    for model in (registration_model, result_model):
+        queryset = model.objects.all()
+        if since is not None:
+            queryset = queryset.filter(created_at__gte=day_bounds(since)[0])
+        days.update(
+            queryset.annotate(day=TruncDate('created_at')).order_by().values_list('day', flat=True).distinct()
+        )
+
+    with transaction.atomic():
+        stale = DailyStats.objects.filter(test_type=kind)
+        if since is not None:
+            stale = stale.filter(date__gte=since)
+        stale.exclude(date__in=days).delete()
+        for day in sorted(days):
+            DailyStats.objects.update_or_create(
+                date=day, test_type=kind, defaults=daily_stats_values(kind, day)
+            )
+    invalidate_dashboard_stats()
+    return len(days)
+
+
+def daily_trend(days=TREND_DAYS):
+    """Rollup rows of the last `days` days, newest first, grouped by date"""
+    since = timezone.localdate() - timedelta(days=days - 1)
+    trend = {}
+    for stats in DailyStats.objects.filter(date__gte=since):
+        trend.setdefault(stats.date, {})[stats.test_type] = stats
+    return [{'date': day, **by_type} for day, by_type in trend.items()]
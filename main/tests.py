@@ -1,3 +1,1341 @@
-from django.test import TestCase
+from datetime import timedelta
+from decimal import Decimal
+import base64
+import csv
+import io
+import json
+import os
+import random
+import re
+import shutil
+import tempfile
+import time
+import unittest
+from unittest import mock
+import zlib
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management import call_command
+from django.db import connection, connections, models as db_models
+from django.db.models import F, Value
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from PIL import Image
+
+from . import async_views, metrics
+from . import urls as main_urls
+from .certificates import PDF_RENDERERS, THUMBNAIL_MAX_AGE, THUMBNAIL_RETRY_AFTER, certificate_thumbnail_url, run_job
+from .instrumentation import record_query, route_stats, start_query_log, stop_query_log
+from .models import SUBMISSION_GRACE
+from .models import TestRegistration, Trait, Question, TestSession, TestResult, CertificateJob, DailyStats, TraitScore
+from .models import DirectorProfile
+from .models import JuniorTestRegistration, JuniorTrait, JuniorQuestion, JuniorTestSession, JuniorTestResult
+from .models import JuniorTraitScore
+from .management.commands.load_test import LOAD_TEST_EMAIL_DOMAIN, delete_load_test_data
+from .regeneration import delete_stale_certificates, regenerate_certificates
+from .rescoring import rescore
+from .services import AUTOSAVE_MIN_INTERVAL, AutosaveRateLimited, JSONMerge, SessionAlreadySubmitted, autosave_answers
+from .services import finalize_expired_sessions, purge_abandoned_sessions, start_session_clock, submit_test
+from .scoring import get_bank_version, get_scoring_plan
+from .urls import candidate_urlpatterns
+from .stats import compute_dashboard_stats, get_dashboard_stats, rebuild_daily_stats
+from .utils import ADULT_CERTIFICATE, certificate_encoding, keyset_paginate
+from .utils import CERTIFICATE_THUMBNAIL_REDUCE, prepare_arabic_text
+
+
+def setUpModule():
+    # Metrics recorded by the test run go to a file of its own, not to the METRICS_DB of a dev server
+    metrics_dir = tempfile.mkdtemp()
+    settings_override = override_settings(METRICS_DB=os.path.join(metrics_dir, 'metrics.sqlite3'))
+    settings_override.enable()
+    unittest.addModuleCleanup(shutil.rmtree, metrics_dir, ignore_errors=True)
+    unittest.addModuleCleanup(settings_override.disable)
+
+
+class MetricsStoreMixin:
+    """Each test starts from an empty metrics store of its own"""
+
+    def setUp(self):
+        super().setUp()
+        metrics_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, metrics_dir, ignore_errors=True)
+        settings_override = override_settings(METRICS_DB=os.path.join(metrics_dir, 'metrics.sqlite3'))
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+
+class SubmissionMixin:
+    """Submits a full adult or junior test through the take-test view"""
+
+    def create_bank(self, trait_model, question_model, question_count):
+        trait_model.objects.all().delete()
+        traits = [
+            trait_model.objects.create(name=f'سمة {i}', weight=Decimal('10.00'), order=i)
+            for i in range(3)
+        ]
+        for i in range(question_count):
+            question_model.objects.create(
+                trait=traits[i % len(traits)],
+                text=f'سؤال {i}',
+                order=i,
+                is_reverse_scored=(i % 4 == 0)
+            )
+        return list(question_model.objects.values_list('id', flat=True))
+
+    def submit(self, kind, question_count, index):
+        if kind == 'adult':
+            question_ids = self.create_bank(Trait, Question, question_count)
+            registration = TestRegistration.objects.create(name='Test', email=f'adult{index}@example.com')
+            session = TestSession.objects.create(registration=registration)
+            url, cookie = reverse('take_test'), 'test_session_id'
+        else:
+            question_ids = self.create_bank(JuniorTrait, JuniorQuestion, question_count)
+            registration = JuniorTestRegistration.objects.create(name='Test', email=f'junior{index}@example.com')
+            session = JuniorTestSession.objects.create(registration=registration)
+            url, cookie = reverse('junior_take_test'), 'junior_test_session_id'
+
+        # Compile the plan outside the measured request
+        get_scoring_plan(kind)
+
+        self.client.cookies[cookie] = str(session.id)
+        data = {f'question_{question_id}': '1.5' for question_id in question_ids}
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(url, data)
+        self.assertEqual(response.status_code, 302)
+        return session, len(queries)
+
+
+class SubmissionQueryCountTests(SubmissionMixin, TestCase):
+    """The submission pipeline issues the same number of queries for any bank size"""
+
+    def test_adult_query_count_is_constant(self):
+        session, small = self.submit('adult', 5, 1)
+        _, large = self.submit('adult', 60, 2)
+        self.assertEqual(small, large)
+
+        session.refresh_from_db()
+        self.assertTrue(session.is_completed)
+        self.assertTrue(session.registration.has_taken_test)
+        result = TestResult.objects.get(session=session)
+        self.assertTrue(CertificateJob.objects.filter(test_type='adult', result_id=result.pk).exists())
+
+    def test_junior_query_count_is_constant(self):
+        session, small = self.submit('junior', 5, 1)
+        _, large = self.submit('junior', 60, 2)
+        self.assertEqual(small, large)
+
+        session.refresh_from_db()
+        self.assertTrue(session.is_completed)
+        self.assertTrue(JuniorTestResult.objects.filter(session=session).exists())
+
+    def test_invalid_answer_is_rejected_without_writes(self):
+        question_ids = self.create_bank(Trait, Question, 3)
+        registration = TestRegistration.objects.create(name='Test', email='invalid@example.com')
+        session = TestSession.objects.create(registration=registration)
+        self.client.cookies['test_session_id'] = str(session.id)
+
+        response = self.client.post(reverse('take_test'), {f'question_{question_ids[0]}': '7'})
+
+        self.assertEqual(response.status_code, 400)
+        session.refresh_from_db()
+        self.assertFalse(session.is_completed)
+
+
+def adult_reference_score(answers):
+    """The adult scoring calculate_test_results did per request before scoring plans"""
+    trait_results = {}
+    total_weighted_score = Decimal('0')
+    total_weight = Decimal('0')
+    for trait in Trait.objects.filter(is_active=True):
+        questions = trait.questions.filter(is_active=True)
+        if not questions.exists():
+            continue
+
+        user_score = sum((Decimal(str(answers.get(str(question.id), '0'))) for question in questions), Decimal('0'))
+        max_score = Decimal('2') * len(questions)
+        percentage = user_score / max_score
+        weight = Decimal(str(trait.weight))
+        weighted_score = percentage * weight
+        trait_results[trait.name] = {
+            'percentage': float(percentage * Decimal('100')), 'weighted_score': float(weighted_score)
+        }
+        total_weighted_score += weighted_score
+        total_weight += weight
+
+    total = (total_weighted_score / total_weight) * Decimal('100') if total_weight > 0 else Decimal('0')
+    return total, trait_results
+
+
+def junior_reference_score(answers):
+    """The junior scoring the take-test view did per request before scoring plans"""
+    trait_scores, trait_max_scores = {}, {}
+    for question in JuniorQuestion.objects.filter(is_active=True).select_related('trait'):
+        trait_scores.setdefault(question.trait_id, 0)
+        trait_max_scores.setdefault(question.trait_id, 0)
+        trait_scores[question.trait_id] += float(answers.get(str(question.id), 0.0))
+        trait_max_scores[question.trait_id] += 2.0
+
+    trait_results = {}
+    total_weighted_score = Decimal('0')
+    total_weight = Decimal('0')
+    for trait_id, user_score in trait_scores.items():
+        trait = JuniorTrait.objects.get(id=trait_id)
+        trait_percentage = Decimal(str(user_score / trait_max_scores[trait_id] * 100))
+        weight = Decimal(str(trait.weight))
+        weighted_score = (trait_percentage * weight) / Decimal('100')
+        trait_results[trait.name] = {'percentage': float(trait_percentage), 'weighted_score': float(weighted_score)}
+        total_weighted_score += weighted_score
+        total_weight += weight
+
+    total = (total_weighted_score / total_weight) * Decimal('100') if total_weight > 0 else Decimal('0')
+    return total, trait_results
+
+
+class ScoringPlanTests(TestCase):
+    """Compiled scoring plans score exactly like the original per-request algorithms"""
+
+    ANSWERS = [0.0, 0.5, 1.0, 1.5, 2.0]
+
+    def create_bank(self, trait_model, question_model):
+        trait_model.objects.all().delete()
+        traits = [
+            trait_model.objects.create(name=f'سمة {i}', weight=Decimal(weight), order=i)
+            for i, weight in enumerate(['10.00', '25.50', '7.25', '40.00'])
+        ]
+        if trait_model is Trait:
+            # Inactive traits do not count towards the adult score
+            traits[3].is_active = False
+            traits[3].save()
+        questions = [
+            question_model.objects.create(
+                trait=traits[i % len(traits)],
+                text=f'سؤال {i}',
+                order=i,
+                is_reverse_scored=(i % 3 == 0),
+                is_active=(i % 7 != 6),
+            )
+            for i in range(24)
+        ]
+        return [str(question.id) for question in questions]
+
+    def test_adult_plan_matches_original_algorithm(self):
+        keys = self.create_bank(Trait, Question)
+        plan = get_scoring_plan('adult')
+        rng = random.Random(1)
+        for _ in range(20):
+            # Some questions are left unanswered
+            answers = {key: rng.choice(self.ANSWERS) for key in keys if rng.random() < 0.9}
+
+            expected_total, expected_traits = adult_reference_score(answers)
+            total, trait_results = plan.score(answers)
+
+            self.assertEqual(total, expected_total)
+            self.assertEqual(set(trait_results), set(expected_traits))
+            for name, scores in trait_results.items():
+                self.assertAlmostEqual(scores['percentage'], expected_traits[name]['percentage'])
+                self.assertAlmostEqual(scores['weighted_score'], expected_traits[name]['weighted_score'])
+
+    def test_junior_plan_matches_original_algorithm(self):
+        keys = self.create_bank(JuniorTrait, JuniorQuestion)
+        plan = get_scoring_plan('junior')
+        rng = random.Random(2)
+        for _ in range(20):
+            answers = {key: rng.choice(self.ANSWERS) for key in keys if rng.random() < 0.9}
+
+            expected_total, expected_traits = junior_reference_score(answers)
+            total, trait_results = plan.score(answers)
+
+            self.assertEqual(total, expected_total)
+            self.assertEqual(set(trait_results), set(expected_traits))
+            for name, scores in trait_results.items():
+                self.assertEqual(scores['percentage'], expected_traits[name]['percentage'])
+                self.assertEqual(scores['weighted_score'], expected_traits[name]['weighted_score'])
+
+    def test_bank_edit_is_seen_through_the_database(self):
+        self.create_bank(Trait, Question)
+        plan = get_scoring_plan('adult')
+        version = get_bank_version('adult')
+
+        question = Question.objects.filter(is_active=True).first()
+        question.is_reverse_scored = not question.is_reverse_scored
+        question.save()
+
+        # Another worker's plan would carry the old version, which no longer matches
+        self.assertGreater(get_bank_version('adult'), version)
+        self.assertNotEqual(plan.version, get_bank_version('adult'))
+        self.assertEqual(get_scoring_plan('adult').version, get_bank_version('adult'))
+
+
+class QuestionMarkupCacheTests(TestCase):
+    """The cached question markup follows edits to the bank"""
+
+    def setUp(self):
+        cache.clear()
+
+    def test_editing_a_question_invalidates_the_markup(self):
+        trait = Trait.objects.create(name='سمة', weight=Decimal('10.00'))
+        question = Question.objects.create(trait=trait, text='النص الأول', order=1)
+        registration = TestRegistration.objects.create(name='Test', email='markup@example.com')
+        session = TestSession.objects.create(registration=registration)
+        self.client.cookies['test_session_id'] = str(session.id)
+
+        self.assertContains(self.client.get(reverse('take_test')), 'النص الأول')
+        # Served from the fragment cache
+        self.assertContains(self.client.get(reverse('take_test')), 'النص الأول')
+
+        question.text = 'النص المعدل'
+        question.save()
+
+        response = self.client.get(reverse('take_test'))
+        self.assertContains(response, 'النص المعدل')
+        self.assertNotContains(response, 'النص الأول')
+
+    def test_editing_a_junior_question_invalidates_the_markup(self):
+        trait = JuniorTrait.objects.create(name='سمة', weight=Decimal('10.00'))
+        question = JuniorQuestion.objects.create(trait=trait, text='النص الأول', order=1)
+        registration = JuniorTestRegistration.objects.create(name='Test', email='markup@example.com')
+        session = JuniorTestSession.objects.create(registration=registration)
+        self.client.cookies['junior_test_session_id'] = str(session.id)
+
+        self.assertContains(self.client.get(reverse('junior_take_test')), 'النص الأول')
+
+        question.text = 'النص المعدل'
+        question.save()
+
+        response = self.client.get(reverse('junior_take_test'))
+        self.assertContains(response, 'النص المعدل')
+        self.assertNotContains(response, 'النص الأول')
+
+
+class DailyStatsTests(TestCase):
+    """Submissions update the day's rollup incrementally; batch jobs recompute it"""
+
+    def create_result(self, index, score, minutes, answers=None):
+        with self.captureOnCommitCallbacks(execute=True):
+            registration = TestRegistration.objects.create(name='Test', email=f'daily{index}@example.com')
+        session = TestSession.objects.create(registration=registration, is_completed=True, answers_json=answers or {})
+        with self.captureOnCommitCallbacks(execute=True):
+            return TestResult.objects.create(session=session, total_score=Decimal(score), time_taken_minutes=minutes)
+
+    def test_submissions_update_counters_and_means(self):
+        self.create_result(1, '40.00', 10)
+        self.create_result(2, '70.00', 20)
+
+        stats = DailyStats.objects.get(date=timezone.localdate(), test_type='adult')
+        self.assertEqual(stats.registrations, 2)
+        self.assertEqual(stats.completions, 2)
+        self.assertAlmostEqual(stats.score_sum, 110.0)
+        self.assertAlmostEqual(stats.mean_score, 55.0)
+        self.assertAlmostEqual(stats.mean_time_minutes, 15.0)
+
+    def test_submission_update_does_not_read_the_day(self):
+        for index in range(5):
+            self.create_result(index, '50.00', 10)
+        registration = TestRegistration.objects.create(name='Test', email='daily-last@example.com')
+        session = TestSession.objects.create(registration=registration, is_completed=True)
+        with self.captureOnCommitCallbacks() as callbacks:
+            TestResult.objects.create(session=session, total_score=Decimal('80.00'))
+
+        with CaptureQueriesContext(connection) as queries:
+            for callback in callbacks:
+                callback()
+        self.assertEqual(len(queries), 1)
+        self.assertTrue(queries[0]['sql'].startswith('UPDATE'))
+
+    def test_rebuild_adds_percentiles_and_keeps_means(self):
+        for index, score in enumerate(['10.00', '20.00', '30.00', '40.00', '50.00']):
+            self.create_result(index, score, 10)
+        incremental = DailyStats.objects.get(test_type='adult')
+        self.assertIsNone(incremental.median_score)
+
+        rebuild_daily_stats('adult')
+        rebuilt = DailyStats.objects.get(test_type='adult')
+        self.assertAlmostEqual(rebuilt.median_score, 30.0)
+        self.assertAlmostEqual(rebuilt.p90_score, 46.0)
+        self.assertAlmostEqual(rebuilt.mean_score, incremental.mean_score)
+        self.assertAlmostEqual(rebuilt.score_sum, incremental.score_sum)
+        self.assertEqual(rebuilt.completions, incremental.completions)
+
+    def test_rescore_refreshes_the_rollup(self):
+        trait = Trait.objects.create(name='سمة', weight=Decimal('10.00'))
+        question = Question.objects.create(trait=trait, text='سؤال', order=1)
+        # The stored score is stale: the answer is worth 100%
+        self.create_result(1, '20.00', 10, answers={str(question.id): 2.0})
+
+        rescore('adult')
+
+        stats = DailyStats.objects.get(test_type='adult')
+        self.assertAlmostEqual(stats.mean_score, 100.0)
+        self.assertAlmostEqual(stats.median_score, 100.0)
+
+
+class RescoreTests(TestCase):
+    """rescore rewrites exactly the results whose scores changed"""
+
+    def setUp(self):
+        self.traits = [
+            Trait.objects.create(name=f'سمة {i}', weight=Decimal(weight), order=i)
+            for i, weight in enumerate(['10.00', '30.00'])
+        ]
+        questions = [
+            Question.objects.create(trait=self.traits[i % 2], text=f'سؤال {i}', order=i)
+            for i in range(4)
+        ]
+        self.results = []
+        for index, answer in enumerate([0.5, 2.0]):
+            registration = TestRegistration.objects.create(name='Test', email=f'rescore{index}@example.com')
+            answers = {str(question.id): answer if question.trait == self.traits[0] else 1.0 for question in questions}
+            session = TestSession.objects.create(registration=registration, is_completed=True, answers_json=answers)
+            self.results.append(TestResult.objects.create(session=session, total_score=Decimal('0.00')))
+
+    def test_unchanged_results_are_skipped(self):
+        rescore('adult')
+        # Stored JSON whose keys come back in another order is still unchanged
+        for result in TestResult.objects.all():
+            result.trait_scores_json = {
+                name: dict(reversed(values.items())) for name, values in reversed(result.trait_scores_json.items())
+            }
+            result.save()
+
+        with CaptureQueriesContext(connection) as queries:
+            changes = rescore('adult')
+        self.assertEqual(changes, [])
+        self.assertFalse([query for query in queries if query['sql'].startswith(('INSERT', 'UPDATE', 'DELETE'))])
+
+    def test_changed_scores_are_written(self):
+        rescore('adult')
+        before = {result.pk: result.total_score for result in TestResult.objects.all()}
+
+        self.traits[1].weight = Decimal('90.00')
+        self.traits[1].save()
+        changes = rescore('adult')
+
+        self.assertEqual(len(changes), 2)
+        for pk, old_score, new_score in changes:
+            self.assertEqual(old_score, before[pk])
+            result = TestResult.objects.get(pk=pk)
+            self.assertEqual(result.total_score, new_score)
+            self.assertEqual(result.trait_scores_json[self.traits[1].name]['weight'], 90.0)
+            self.assertEqual(
+                {row.trait_id: row.percentage for row in TraitScore.objects.filter(result_id=pk)},
+                {trait.pk: result.trait_scores_json[trait.name]['percentage'] for trait in self.traits},
+            )
+
+        # 25% on the first trait (weight 10) and 50% on the second (weight 90)
+        self.assertEqual(TestResult.objects.get(pk=self.results[0].pk).total_score, Decimal('47.50'))
+
+    def test_dry_run_writes_nothing(self):
+        with CaptureQueriesContext(connection) as queries:
+            changes = rescore('adult', dry_run=True)
+
+        self.assertEqual(len(changes), 2)
+        self.assertFalse([query for query in queries if query['sql'].startswith(('INSERT', 'UPDATE', 'DELETE'))])
+        self.assertFalse(TestResult.objects.exclude(total_score=Decimal('0.00')).exists())
+        self.assertFalse(TraitScore.objects.exists())
+        self.assertFalse(DailyStats.objects.exists())
+
+
+class RequestInstrumentationTests(MetricsStoreMixin, TestCase):
+    """Queries are counted on every connection and route stats cover all workers"""
+
+    def test_recorder_stays_outermost_on_new_connections(self):
+        calls = []
+
+        def inner(execute, sql, params, many, context):
+            calls.append(sql)
+            return execute(sql, params, many, context)
+
+        new_connection = connections.create_connection('default')
+        try:
+            query_log, token = start_query_log()
+            try:
+                # The connection is opened inside the wrapper's block
+                with new_connection.execute_wrapper(inner):
+                    with new_connection.cursor() as cursor:
+                        cursor.execute('SELECT 1')
+                    self.assertEqual(new_connection.execute_wrappers, [record_query, inner])
+                self.assertEqual(new_connection.execute_wrappers, [record_query])
+                with new_connection.cursor() as cursor:
+                    cursor.execute('SELECT 2')
+                    cursor.execute('SELECT 3')
+            finally:
+                stop_query_log(token)
+        finally:
+            new_connection.close()
+
+        self.assertEqual(calls, ['SELECT 1'])
+        self.assertEqual(query_log.count, 3)
+        self.assertEqual([sql for _, sql in query_log.queries], ['SELECT 1', 'SELECT 2', 'SELECT 3'])
+
+    def test_queries_outside_a_request_are_not_counted(self):
+        query_log, token = start_query_log()
+        stop_query_log(token)
+        Trait.objects.count()
+        self.assertEqual(query_log.count, 0)
+
+    def test_route_stats_include_other_workers(self):
+        self.client.get(reverse('home'))
+        self.client.get(reverse('home'))
+        after = route_stats.snapshot()['GET /']
+        self.assertEqual(after['count'], 2)
+        self.assertEqual(sum(after['buckets']), 2)
+
+        # Values flushed to the shared store by another live worker
+        worker = f'{os.getppid()}:0'
+        store = metrics._get_connection()
+        with store:
+            store.executemany(
+                'INSERT INTO samples (process, name, labels, value) VALUES (?, ?, ?, ?)',
+                [
+                    (worker, 'ilefn_route_requests_total', 'route="GET /other"', 3),
+                    (worker, 'ilefn_route_duration_seconds_sum', 'route="GET /other"', 0.3),
+                    (worker, 'ilefn_route_max_duration_seconds', 'route="GET /"', 9999.0),
+                ]
+            )
+        snapshot = route_stats.snapshot()
+
+        self.assertEqual(snapshot['GET /other']['count'], 3)
+        self.assertAlmostEqual(snapshot['GET /other']['total_ms'], 300.0)
+        self.assertEqual(snapshot['GET /']['max_ms'], 9999000.0)
+        self.assertEqual(snapshot['GET /']['count'], after['count'])
+
+
+class AutosaveTests(TestCase):
+    """Autosaves merge answer deltas in the database and are rate limited per session"""
+
+    def setUp(self):
+        trait = Trait.objects.create(name='سمة', weight=Decimal('10.00'))
+        self.keys = [
+            str(Question.objects.create(trait=trait, text=f'سؤال {i}', order=i).id)
+            for i in range(3)
+        ]
+        registration = TestRegistration.objects.create(name='Test', email='autosave@example.com')
+        self.session = TestSession.objects.create(registration=registration)
+
+    def merge(self, delta):
+        TestSession.objects.filter(pk=self.session.pk).update(
+            answers_json=JSONMerge(F('answers_json'), Value(delta, output_field=db_models.JSONField()))
+        )
+        self.session.refresh_from_db()
+        return self.session.answers_json
+
+    def allow_next_autosave(self):
+        TestSession.objects.filter(pk=self.session.pk).update(
+            autosaved_at=timezone.now() - timedelta(seconds=AUTOSAVE_MIN_INTERVAL + 1)
+        )
+
+    def test_merge_adds_and_overwrites_keys(self):
+        self.assertEqual(self.merge({'1': 1.0, '2': 2.0}), {'1': 1.0, '2': 2.0})
+        self.assertEqual(self.merge({'2': 0.5, '3': 1.5}), {'1': 1.0, '2': 0.5, '3': 1.5})
+        self.assertEqual(self.merge({}), {'1': 1.0, '2': 0.5, '3': 1.5})
+
+    def test_autosave_merges_posted_answers(self):
+        first, second, third = self.keys
+        saved = autosave_answers('adult', self.session.pk, {f'question_{first}': '1', f'question_{second}': '2'})
+        self.assertEqual(saved, 2)
+        self.allow_next_autosave()
+        saved = autosave_answers('adult', self.session.pk, {f'question_{second}': '0.5', f'question_{third}': '0'})
+        self.assertEqual(saved, 2)
+
+        self.session.refresh_from_db()
+        self.assertEqual(self.session.answers_json, {first: 1.0, second: 0.5, third: 0.0})
+
+    def test_autosave_is_rate_limited(self):
+        data = {f'question_{self.keys[0]}': '1'}
+        autosave_answers('adult', self.session.pk, data)
+        with self.assertRaises(AutosaveRateLimited):
+            autosave_answers('adult', self.session.pk, {f'question_{self.keys[1]}': '2'})
+        self.session.refresh_from_db()
+        self.assertEqual(self.session.answers_json, {self.keys[0]: 1.0})
+
+        self.allow_next_autosave()
+        self.assertEqual(autosave_answers('adult', self.session.pk, data), 1)
+
+    def test_rate_limit_is_answered_with_429(self):
+        self.client.cookies['test_session_id'] = str(self.session.pk)
+        url = reverse('take_test_autosave')
+        body = f'{{"question_{self.keys[0]}": "1"}}'
+        self.assertEqual(self.client.post(url, body, content_type='application/json').status_code, 200)
+
+        response = self.client.post(url, body, content_type='application/json')
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response['Retry-After'], str(AUTOSAVE_MIN_INTERVAL))
+
+    def test_completed_session_is_not_reported_as_rate_limited(self):
+        autosave_answers('adult', self.session.pk, {f'question_{self.keys[0]}': '1'})
+        TestSession.objects.filter(pk=self.session.pk).update(is_completed=True)
+        with self.assertRaises(SessionAlreadySubmitted):
+            autosave_answers('adult', self.session.pk, {f'question_{self.keys[0]}': '2'})
+
+
+class KeysetPaginationTests(TestCase):
+    """Cursor pages cover every row once in both directions and survive tampered cursors"""
+
+    SORTS = ['-created_at', 'created_at', '-total_score', 'total_score']
+
+    def setUp(self):
+        # Repeated scores, so pages split runs of equal sort values
+        for index, score in enumerate(['50.00', '50.00', '70.00', '50.00', '30.00', '70.00', '50.00', '50.00']):
+            registration = TestRegistration.objects.create(name='Test', email=f'page{index}@example.com')
+            session = TestSession.objects.create(registration=registration, is_completed=True)
+            TestResult.objects.create(session=session, total_score=Decimal(score))
+
+    def expected_order(self, sort):
+        order = [sort, '-id' if sort.startswith('-') else 'id']
+        return list(TestResult.objects.order_by(*order).values_list('pk', flat=True))
+
+    def page(self, sort, **cursor):
+        rows, next_cursor, prev_cursor = keyset_paginate(TestResult.objects.all(), sort, page_size=3, **cursor)
+        return [row.pk for row in rows], next_cursor, prev_cursor
+
+    def test_pages_round_trip(self):
+        for sort in self.SORTS:
+            with self.subTest(sort=sort):
+                pages, after, prev_cursor = [], None, None
+                while True:
+                    rows, after, prev_cursor = self.page(sort, after=after)
+                    pages.append(rows)
+                    if after is None:
+                        break
+                self.assertEqual([pk for page in pages for pk in page], self.expected_order(sort))
+                self.assertEqual([len(page) for page in pages], [3, 3, 2])
+
+                # Walking back from the last page gives the same pages
+                for page in reversed(pages[:-1]):
+                    rows, _, prev_cursor = self.page(sort, before=prev_cursor)
+                    self.assertEqual(rows, page)
+                self.assertIsNone(prev_cursor)
+
+    def test_tampered_cursors_give_the_first_page(self):
+        def encode(value):
+            return base64.urlsafe_b64encode(json.dumps(value).encode()).decode().rstrip('=')
+
+        first_page = self.page('-created_at')[0]
+        for cursor in ['not a cursor', encode(['not a date', 1]), encode([[1], 1]), encode(['2026-01-01', 'x']),
+                       encode(['2026-01-01T00:00:00', 2 ** 70]), encode({'a': 1}), encode('ab')]:
+            with self.subTest(cursor=cursor):
+                for direction in ('after', 'before'):
+                    self.assertEqual(self.page('-created_at', **{direction: cursor})[0], first_page)
+
+        for cursor in [encode(['abc', 1]), encode(['NaN', 1])]:
+            with self.subTest(cursor=cursor):
+                self.assertEqual(self.page('total_score', after=cursor)[0], self.expected_order('total_score')[:3])
+
+    def test_results_view_accepts_tampered_cursor(self):
+        user = User.objects.create_user('director', password='secret')
+        DirectorProfile.objects.create(user=user)
+        self.client.force_login(user)
+        cursor = base64.urlsafe_b64encode(json.dumps(['abc', 1]).encode()).decode()
+
+        response = self.client.get(reverse('test_results'), {'sort': 'total_score', 'after': cursor})
+        self.assertEqual(response.status_code, 200)
+
+
+class ResultExportTests(TestCase):
+    """The streamed CSV export cannot inject formulas into a spreadsheet"""
+
+    def test_formula_cells_are_escaped(self):
+        Trait.objects.create(name='=سمة', weight=Decimal('10.00'))
+        names = ['=HYPERLINK("http://example.com")', '+966500000000', '-2+3', '@SUM(A1)', 'سارة - أحمد']
+        for index, name in enumerate(names):
+            registration = TestRegistration.objects.create(name=name, email=f'export{index}@example.com')
+            session = TestSession.objects.create(registration=registration, is_completed=True)
+            TestResult.objects.create(session=session, total_score=Decimal('55.50'),
+                                      trait_scores_json={'=سمة': {'percentage': 55.5}})
+
+        user = User.objects.create_user('director', password='secret')
+        DirectorProfile.objects.create(user=user)
+        self.client.force_login(user)
+        response = self.client.get(reverse('export_results'), {'type': 'adult'})
+
+        self.assertEqual(response['Content-Type'], 'text/csv; charset=utf-8')
+        content = b''.join(response.streaming_content).decode('utf-8')
+        self.assertTrue(content.startswith('\ufeff'))
+        header, *rows = list(csv.reader(io.StringIO(content[1:])))
+
+        self.assertEqual(header[-1], "'=سمة (%)")
+        self.assertEqual(
+            [row[1] for row in rows],
+            ["'=HYPERLINK(\"http://example.com\")", "'+966500000000", "'-2+3", "'@SUM(A1)", 'سارة - أحمد']
+        )
+        # Numbers are left as they are
+        self.assertEqual({(row[3], row[-1]) for row in rows}, {('55.50', '55.5')})
+
+
+class MetricsAccessTests(MetricsStoreMixin, TestCase):
+    """/metrics is served to staff users and to scrapers holding the configured token"""
+
+    @override_settings(METRICS_TOKEN='')
+    def test_anonymous_is_denied_without_a_token(self):
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, 401)
+        self.assertEqual(self.client.get(reverse('metrics'), HTTP_AUTHORIZATION='Bearer ').status_code, 401)
+
+    @override_settings(METRICS_TOKEN='')
+    def test_staff_is_allowed(self):
+        self.client.force_login(User.objects.create_user('staff', password='secret', is_staff=True))
+        response = self.client.get(reverse('metrics'))
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, '# TYPE ilefn_requests_total counter')
+        # Only the requests of this test are counted
+        self.assertNotContains(response, 'route="GET /"')
+
+    @override_settings(METRICS_TOKEN='s3cret')
+    def test_token_is_required_when_set(self):
+        self.client.force_login(User.objects.create_user('user', password='secret'))
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, 401)
+        self.assertEqual(self.client.get(reverse('metrics'), HTTP_AUTHORIZATION='Bearer wrong').status_code, 401)
+        self.assertEqual(self.client.get(reverse('metrics'), HTTP_AUTHORIZATION='Bearer s3cret').status_code, 200)
+
+
+class CertificateMediaMixin:
+    """
+    Certificates rendered into a temporary MEDIA_ROOT. Missing certificates are
+    rendered inline, also by the async views, so no pool thread writes while
+    the test transaction is open.
+    """
+
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        settings_override = override_settings(MEDIA_ROOT=media_root, CERTIFICATE_ASYNC=False)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def create_result(self, kind='adult', name='سارة أحمد', score='87.50', email='certificate@example.com'):
+        if kind == 'adult':
+            registration = TestRegistration.objects.create(name=name, email=email)
+            session = TestSession.objects.create(
+                registration=registration, is_completed=True, completed_at=timezone.now()
+            )
+            result = TestResult.objects.create(session=session, total_score=Decimal(score))
+            self.client.cookies['test_session_id'] = str(session.pk)
+        else:
+            registration = JuniorTestRegistration.objects.create(name=name, email=email)
+            session = JuniorTestSession.objects.create(
+                registration=registration, is_completed=True, completed_at=timezone.now()
+            )
+            result = JuniorTestResult.objects.create(session=session, total_score=Decimal(score))
+            self.client.cookies['junior_test_session_id'] = str(session.pk)
+        CertificateJob.objects.create(test_type=kind, result_id=result.pk)
+        return result
+
+
+class CertificateTestCase(CertificateMediaMixin, TestCase):
+    pass
+
+
+class CertificatePreviewTests(CertificateTestCase):
+    """The result page previews the certificate before the background job has run"""
+
+    def test_result_page_falls_back_to_the_thumbnail_endpoint(self):
+        for kind, result_url, thumbnail_url in [
+            ('adult', 'test_result', 'certificate_thumbnail'),
+            ('junior', 'junior_test_result', 'junior_certificate_thumbnail'),
+        ]:
+            with self.subTest(kind=kind):
+                result = self.create_result(kind)
+                self.assertEqual(result.certificate_path, '')
+
+                response = self.client.get(reverse(result_url))
+                self.assertContains(response, f'<img src="{reverse(thumbnail_url)}"')
+
+                # The bare endpoint shows the empty template without rendering anything
+                response = self.client.get(reverse(thumbnail_url))
+                self.assertEqual(response.status_code, 202)
+                self.assertEqual(response['Content-Type'], 'image/webp')
+                self.assertEqual(response['Retry-After'], str(THUMBNAIL_RETRY_AFTER))
+                self.assertIn('no-cache', response['Cache-Control'])
+                self.assertNotIn('immutable', response['Cache-Control'])
+                self.assertEqual(Image.open(io.BytesIO(response.content)).format, 'WEBP')
+
+                result.refresh_from_db()
+                self.assertEqual(result.certificate_path, '')
+                job = CertificateJob.objects.get(result_id=result.pk, test_type=kind)
+                self.assertEqual(job.status, CertificateJob.STATUS_PENDING)
+
+                # The job writes the certificate and its thumbnail
+                self.assertTrue(run_job(job.pk))
+                result.refresh_from_db()
+                key = os.path.splitext(os.path.basename(result.certificate_path))[0]
+                self.assertEqual(certificate_thumbnail_url(kind, result), f'{reverse(thumbnail_url)}?v={key}')
+                response = self.client.get(certificate_thumbnail_url(kind, result))
+                self.assertEqual(response.status_code, 200)
+                self.assertIn('immutable', response['Cache-Control'])
+
+
+class CertificateDownloadTests(CertificateTestCase):
+    """Certificate downloads carry an ETag and repeat requests are answered with 304"""
+
+    def test_repeat_download_is_not_modified(self):
+        for kind, url in [('adult', 'download_certificate'), ('junior', 'junior_download_certificate')]:
+            with self.subTest(kind=kind):
+                self.create_result(kind)
+                response = self.client.get(reverse(url))
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(response['Content-Type'], 'image/png')
+                self.assertTrue(response['Content-Disposition'].startswith('attachment'))
+                self.assertIn('private', response['Cache-Control'])
+                etag = response['ETag']
+                self.assertTrue(b''.join(response.streaming_content).startswith(b'\x89PNG'))
+
+                response = self.client.get(reverse(url), HTTP_IF_NONE_MATCH=etag)
+                self.assertEqual(response.status_code, 304)
+                self.assertEqual(response['ETag'], etag)
+                self.assertEqual(response.content, b'')
+
+                response = self.client.get(reverse(url), HTTP_IF_NONE_MATCH='"stale"')
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(response['ETag'], etag)
+
+
+class CertificateEncodingTests(CertificateTestCase):
+    """Each test type writes its certificates in its configured encoding"""
+
+    SIGNATURES = {'png': b'\x89PNG', 'png-small': b'\x89PNG', 'webp': b'RIFF', 'jpeg': b'\xff\xd8\xff'}
+
+    def test_encoding_is_chosen_per_test_type(self):
+        for adult, junior, adult_type, junior_type in [
+            ('webp', 'jpeg', 'image/webp', 'image/jpeg'),
+            ('png-small', 'webp', 'image/png', 'image/webp'),
+        ]:
+            with self.subTest(adult=adult, junior=junior), \
+                    override_settings(CERTIFICATE_ENCODING={'adult': adult, 'junior': junior}):
+                for kind, mode, content_type, url in [
+                    ('adult', adult, adult_type, 'download_certificate'),
+                    ('junior', junior, junior_type, 'junior_download_certificate'),
+                ]:
+                    result = self.create_result(kind, email=f'{kind}-{mode}@example.com')
+                    response = self.client.get(reverse(url))
+                    self.assertEqual(response['Content-Type'], content_type)
+                    extension = {'image/png': 'png', 'image/webp': 'webp', 'image/jpeg': 'jpg'}[content_type]
+                    self.assertTrue(response['Content-Disposition'].rstrip('"').endswith(f'.{extension}'))
+                    self.assertTrue(b''.join(response.streaming_content).startswith(self.SIGNATURES[mode]))
+
+                    result.refresh_from_db()
+                    self.assertTrue(result.certificate_path.endswith(f'.{extension}'))
+
+    def test_unknown_encoding_is_rejected(self):
+        with override_settings(CERTIFICATE_ENCODING={'adult': 'gif'}):
+            with self.assertRaises(ImproperlyConfigured):
+                certificate_encoding('adult')
+        with override_settings(CERTIFICATE_ENCODING={}):
+            self.assertEqual(certificate_encoding('junior'), 'png')
+
+
+class CertificatePdfTests(CertificateTestCase):
+    """PDF certificates are well-formed files with the text in an embedded font subset"""
+
+    def pdf_objects(self, pdf):
+        objects = {}
+        for match in re.finditer(rb'(\d+) 0 obj\n(.*?)\nendobj\n', pdf, re.S):
+            body, _, stream = match.group(2).partition(b'\nstream\n')
+            objects[int(match.group(1))] = (match.start(), body, stream[:-len(b'\nendstream')] if stream else None)
+        return objects
+
+    def test_pdf_is_well_formed(self):
+        self.create_result(name='سارة أحمد')
+        response = self.client.get(reverse('download_certificate'), {'format': 'pdf'})
+        self.assertEqual(response['Content-Type'], 'application/pdf')
+        self.assertTrue(response['Content-Disposition'].rstrip('"').endswith('.pdf'))
+        pdf = b''.join(response.streaming_content)
+
+        self.assertTrue(pdf.startswith(b'%PDF-1.4\n'))
+        self.assertTrue(pdf.endswith(b'%%EOF\n'))
+        objects = self.pdf_objects(pdf)
+        self.assertEqual(sorted(objects), list(range(1, 10)))
+
+        # The cross-reference table points at every object and startxref at the table
+        startxref = int(re.search(rb'startxref\n(\d+)\n%%EOF', pdf).group(1))
+        self.assertTrue(pdf[startxref:].startswith(b'xref\n0 10\n'))
+        offsets = [int(offset) for offset in re.findall(rb'(\d{10}) 00000 n ', pdf[startxref:])]
+        self.assertEqual(offsets, [objects[number][0] for number in range(1, 10)])
+
+        for number, (_, body, stream) in objects.items():
+            if stream is not None:
+                length = int(re.search(rb'/Length (\d+)', body).group(1))
+                self.assertEqual(len(stream), length, f'object {number}')
+
+    def test_font_is_an_embedded_subset(self):
+        self.create_result(name='سارة أحمد')
+        pdf = b''.join(self.client.get(reverse('download_certificate'), {'format': 'pdf'}).streaming_content)
+        objects = self.pdf_objects(pdf)
+
+        font = objects[5][1]
+        self.assertRegex(font, rb'/BaseFont /[A-Z]{6}\+')
+        self.assertIn(b'/FontFile2 7 0 R', objects[6][1])
+        font_file = zlib.decompress(objects[7][2])
+        self.assertEqual(len(font_file), int(re.search(rb'/Length1 (\d+)', objects[7][1]).group(1)))
+        self.assertIn(font_file[:4], (b'\x00\x01\x00\x00', b'true'))
+        with open(ADULT_CERTIFICATE.font_path, 'rb') as full_font:
+            self.assertLess(len(font_file), len(full_font.read()) / 2)
+
+        # Text is selectable: the ToUnicode map covers the shaped characters shown
+        cmap = zlib.decompress(objects[8][2])
+        codes = {int(code, 16) for code in re.findall(rb'<[0-9A-F]{2}> <([0-9A-F]{4})>', cmap)}
+        self.assertTrue({ord(char) for char in prepare_arabic_text('سارة أحمد')} <= codes)
+        last_char = int(re.search(rb'/LastChar (\d+)', font).group(1))
+        self.assertEqual(last_char + 1, len(codes))
+
+        content = zlib.decompress(objects[9][2])
+        self.assertIn(b'/Template Do', content)
+        self.assertGreaterEqual(content.count(b' Tj ET'), 4)
+
+
+    def test_existing_pdf_is_served_without_the_renderer(self):
+        self.create_result()
+        first = self.client.get(reverse('download_certificate'), {'format': 'pdf'})
+        self.assertEqual(first['Content-Type'], 'application/pdf')
+
+        def fail(registration, result):
+            raise AssertionError('PDF rendered again')
+
+        with mock.patch.dict(PDF_RENDERERS, {'adult': fail}):
+            second = self.client.get(reverse('download_certificate'), {'format': 'pdf'})
+        self.assertEqual(second['Content-Type'], 'application/pdf')
+        self.assertEqual(second['ETag'], first['ETag'])
+
+    def test_name_beyond_the_font_subset_falls_back_to_the_image(self):
+        self.create_result()
+        # Names are at most 200 characters long, so the limit is lowered instead
+        with mock.patch('main.pdf.MAX_SUBSET_CHARACTERS', 10), self.assertLogs('main.certificates', 'WARNING'):
+            response = self.client.get(reverse('download_certificate'), {'format': 'pdf'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'image/png')
+        self.assertTrue(response['Content-Disposition'].rstrip('"').endswith('.png'))
+
+
+class CertificateRegenerationTests(CertificateMediaMixin, TransactionTestCase):
+    """Regeneration only renders certificates whose contents or layout changed"""
+
+    def setUp(self):
+        super().setUp()
+        self.results = [
+            self.create_result(name=f'مشارك {index}', email=f'regen{index}@example.com') for index in range(3)
+        ]
+
+    def certificate_files(self):
+        paths = TestResult.objects.order_by('pk').values_list('certificate_path', flat=True)
+        return {path: os.stat(os.path.join(settings.MEDIA_ROOT, path)).st_mtime_ns for path in paths}
+
+    def test_second_run_skips_unchanged_certificates(self):
+        stats = regenerate_certificates('adult', processes=1)
+        self.assertEqual((stats.rendered, stats.reused, stats.current), (3, 0, 0))
+        self.assertFalse(CertificateJob.objects.exclude(status=CertificateJob.STATUS_DONE).exists())
+        files = self.certificate_files()
+        self.assertEqual(len(files), 3)
+
+        stats = regenerate_certificates('adult', processes=1)
+        self.assertEqual((stats.rendered, stats.reused, stats.current), (0, 0, 3))
+        self.assertEqual(self.certificate_files(), files)
+
+    def test_only_changed_certificates_are_rendered(self):
+        regenerate_certificates('adult', processes=1)
+        registration = self.results[0].session.registration
+        registration.name = 'اسم جديد'
+        registration.save()
+
+        stats = regenerate_certificates('adult', processes=1)
+        self.assertEqual((stats.rendered, stats.reused, stats.current), (1, 0, 2))
+
+        # The old name's certificate and its thumbnail are no longer referenced
+        self.assertEqual(delete_stale_certificates('adult', older_than=time.time() + 1), 2)
+        self.assertEqual(len(self.certificate_files()), 3)
+
+    def test_force_renders_every_certificate(self):
+        regenerate_certificates('adult', processes=1)
+        stats = regenerate_certificates('adult', processes=1, force=True)
+        self.assertEqual((stats.rendered, stats.reused, stats.current), (3, 0, 0))
+
+
+class CertificateThumbnailTests(CertificateTestCase):
+    """Result pages show a small WebP preview that the browser may keep for good"""
+
+    def test_versioned_thumbnail_is_immutable(self):
+        for kind, result_url, download_url in [
+            ('adult', 'test_result', 'download_certificate'),
+            ('junior', 'junior_test_result', 'junior_download_certificate'),
+        ]:
+            with self.subTest(kind=kind):
+                result = self.create_result(kind)
+                self.client.get(reverse(download_url))
+                result.refresh_from_db()
+                url = certificate_thumbnail_url(kind, result)
+                self.assertIn('?v=', url)
+                self.assertContains(self.client.get(reverse(result_url)), f'<img src="{url}"')
+
+                response = self.client.get(url)
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(response['Content-Type'], 'image/webp')
+                cache_control = {part.strip() for part in response['Cache-Control'].split(',')}
+                self.assertEqual(cache_control, {'private', f'max-age={THUMBNAIL_MAX_AGE}', 'immutable'})
+
+                thumbnail = Image.open(io.BytesIO(b''.join(response.streaming_content)))
+                certificate = Image.open(os.path.join(settings.MEDIA_ROOT, result.certificate_path))
+                self.assertEqual(thumbnail.format, 'WEBP')
+                self.assertEqual(thumbnail.size, (certificate.width // CERTIFICATE_THUMBNAIL_REDUCE,
+                                                  certificate.height // CERTIFICATE_THUMBNAIL_REDUCE))
+
+                # A version that is not the served file's is not cached for good
+                response = self.client.get(url.split('?')[0], {'v': 'outdated'})
+                self.assertIn('no-cache', response['Cache-Control'])
+                self.assertNotIn('immutable', response['Cache-Control'])
+
+
+class LoadTestCleanupTests(CertificateTestCase):
+    """Load test cleanup removes its candidates' certificate jobs and files"""
+
+    def test_cleanup_deletes_certificate_jobs(self):
+        real = self.create_result(email='real@example.com')
+        load = self.create_result(name='Load Test', email=f'user1@{LOAD_TEST_EMAIL_DOMAIN}')
+        self.client.cookies['test_session_id'] = str(load.session_id)
+        self.client.get(reverse('download_certificate'))
+        load.refresh_from_db()
+        certificate_file = os.path.join(settings.MEDIA_ROOT, load.certificate_path)
+        self.assertTrue(os.path.exists(certificate_file))
+
+        delete_load_test_data('adult')
+
+        self.assertFalse(TestResult.objects.filter(pk=load.pk).exists())
+        self.assertEqual(list(CertificateJob.objects.values_list('result_id', flat=True)), [real.pk])
+        self.assertFalse(os.path.exists(certificate_file))
+
+
+# URLconf of AsyncCandidateFlowTests: the candidate flow served by the async views
+urlpatterns = candidate_urlpatterns(async_views) + main_urls.urlpatterns
+
+
+@override_settings(ROOT_URLCONF=__name__)
+class AsyncCandidateFlowTests(SubmissionMixin, CertificateTestCase):
+    """The async candidate views (ASYNC_VIEWS=True) register, test, score and serve certificates"""
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        self.question_ids = {
+            'adult': self.create_bank(Trait, Question, 6),
+            'junior': self.create_bank(JuniorTrait, JuniorQuestion, 6),
+        }
+
+    async def test_candidate_flow(self):
+        for kind, prefix, cookie, result_model in [
+            ('adult', '', 'test_session_id', TestResult),
+            ('junior', 'junior_', 'junior_test_session_id', JuniorTestResult),
+        ]:
+            with self.subTest(kind=kind):
+                self.assertEqual((await self.async_client.get(reverse(f'{prefix}test_registration'))).status_code, 200)
+                response = await self.async_client.post(
+                    reverse(f'{prefix}test_registration'), {'name': 'سارة أحمد', 'email': f'{kind}@example.com'}
+                )
+                self.assertRedirects(response, reverse(f'{prefix}take_test'), fetch_redirect_response=False)
+                session_id = response.cookies[cookie].value
+                self.async_client.cookies[cookie] = session_id
+
+                response = await self.async_client.get(reverse(f'{prefix}take_test'))
+                self.assertContains(response, 'سؤال 5')
+
+                # Full marks: reverse-scored questions (every fourth) answered with 0
+                answers = {
+                    f'question_{question_id}': '0' if i % 4 == 0 else '2'
+                    for i, question_id in enumerate(self.question_ids[kind])
+                }
+                response = await self.async_client.post(reverse(f'{prefix}take_test'), answers)
+                self.assertRedirects(response, reverse(f'{prefix}test_result'), fetch_redirect_response=False)
+                result = await result_model.objects.aget(session_id=session_id)
+                self.assertEqual(result.total_score, Decimal('100.00'))
+
+                response = await self.async_client.get(reverse(f'{prefix}test_result'))
+                self.assertContains(response, f'<img src="{reverse(f"{prefix}certificate_thumbnail")}"')
+                response = await self.async_client.get(reverse(f'{prefix}certificate_thumbnail'))
+                self.assertEqual(response.status_code, 202)
+
+                # A missing certificate is rendered on the first download, then served from the file
+                response = await self.async_client.get(reverse(f'{prefix}download_certificate'))
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(response['Content-Type'], 'image/png')
+                response = await self.async_client.get(
+                    reverse(f'{prefix}download_certificate'), headers={'if-none-match': response['ETag']}
+                )
+                self.assertEqual(response.status_code, 304)
+
+                response = await self.async_client.get(reverse(f'{prefix}download_certificate'), {'format': 'pdf'})
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(response['Content-Type'], 'application/pdf')
+
+                result = await result_model.objects.aget(session_id=session_id)
+                response = await self.async_client.get(certificate_thumbnail_url(kind, result))
+                self.assertEqual(response.status_code, 200)
+                self.assertIn('immutable', response['Cache-Control'])
+
+
+class TraitScoreTests(SubmissionMixin, TestCase):
+    """Per-trait score rows are written with each result and backfilled for older ones"""
+
+    def test_submission_writes_one_row_per_trait(self):
+        for kind, result_model, score_model in [
+            ('adult', TestResult, TraitScore), ('junior', JuniorTestResult, JuniorTraitScore)
+        ]:
+            with self.subTest(kind=kind):
+                session, _ = self.submit(kind, 9, 1)
+                result = result_model.objects.get(session=session)
+                rows = score_model.objects.filter(result=result).select_related('trait')
+                self.assertEqual(len(rows), 3)
+                for row in rows:
+                    self.assertAlmostEqual(row.percentage, result.trait_scores_json[row.trait.name]['percentage'])
+                    self.assertAlmostEqual(
+                        row.weighted_score, result.trait_scores_json[row.trait.name]['weighted_score']
+                    )
+
+    def test_backfill_creates_missing_rows_once(self):
+        session, _ = self.submit('adult', 6, 1)
+        result = TestResult.objects.get(session=session)
+        expected = sorted(TraitScore.objects.filter(result=result).values_list('trait_id', 'percentage'))
+        TraitScore.objects.all().delete()
+        # Names no trait has any more are skipped
+        result.trait_scores_json['سمة محذوفة'] = {'percentage': 10.0, 'weighted_score': 1.0}
+        result.save()
+
+        output = io.StringIO()
+        call_command('backfill_trait_scores', '--type', 'adult', stdout=output)
+        self.assertIn('adult: 3 trait score row(s) created, 1 unknown trait name(s) skipped', output.getvalue())
+        self.assertEqual(sorted(TraitScore.objects.values_list('trait_id', 'percentage')), expected)
+
+        call_command('backfill_trait_scores', '--type', 'adult', stdout=io.StringIO())
+        self.assertEqual(TraitScore.objects.count(), 3)
+
+
+class DashboardStatsTests(TestCase):
+    """Dashboard counters and trait averages are aggregated in a fixed number of queries"""
+
+    def setUp(self):
+        cache.clear()
+        traits = [Trait.objects.create(name=f'سمة {i}', weight=Decimal('10.00'), order=i) for i in range(2)]
+        for i in range(5):
+            Question.objects.create(trait=traits[i % 2], text=f'سؤال {i}', order=i, is_active=(i != 4))
+        junior_trait = JuniorTrait.objects.create(name='سمة', weight=Decimal('10.00'))
+        JuniorQuestion.objects.create(trait=junior_trait, text='سؤال', order=1)
+
+        for index, percentages in enumerate([(40.0, 80.0), (60.0, None), None]):
+            registration = TestRegistration.objects.create(name='Test', email=f'dash{index}@example.com')
+            session = TestSession.objects.create(registration=registration, is_completed=percentages is not None)
+            if percentages is not None:
+                result = TestResult.objects.create(session=session, total_score=Decimal('50.00'))
+                for trait, percentage in zip(traits, percentages):
+                    if percentage is not None:
+                        TraitScore.objects.create(result=result, trait=trait, percentage=percentage, weighted_score=0)
+        JuniorTestRegistration.objects.create(name='Test', email='dash-junior@example.com')
+        self.traits = traits
+
+    def test_counters_and_trait_averages(self):
+        with CaptureQueriesContext(connection) as queries:
+            stats = compute_dashboard_stats()
+        # Per test type two aggregates and the trait list; then recent activity and the trend
+        self.assertEqual(len(queries), 9)
+
+        self.assertEqual(
+            {name: stats[name] for name in ['total_traits', 'total_questions', 'active_questions',
+                                            'total_registrations', 'completed_tests']},
+            {'total_traits': 2, 'total_questions': 5, 'active_questions': 4,
+             'total_registrations': 3, 'completed_tests': 2},
+        )
+        self.assertEqual(
+            {name: stats[f'junior_{name}'] for name in ['total_traits', 'total_questions', 'total_registrations',
+                                                        'completed_tests']},
+            {'total_traits': 1, 'total_questions': 1, 'total_registrations': 1, 'completed_tests': 0},
+        )
+        trait_stats = {trait.pk: trait for trait in stats['trait_stats']}
+        self.assertEqual(trait_stats[self.traits[0].pk].question_count, 3)
+        self.assertAlmostEqual(trait_stats[self.traits[0].pk].average_percentage, 50.0)
+        self.assertAlmostEqual(trait_stats[self.traits[1].pk].average_percentage, 80.0)
+        self.assertEqual(len(stats['recent_sessions']), 2)
+
+    def test_snapshot_is_cached_until_a_change(self):
+        self.assertEqual(get_dashboard_stats()['total_registrations'], 3)
+        with self.assertNumQueries(0):
+            get_dashboard_stats()
+
+        TestRegistration.objects.create(name='Test', email='dash-new@example.com')
+        self.assertEqual(get_dashboard_stats()['total_registrations'], 4)
+
+    def test_dashboard_view(self):
+        user = User.objects.create_user('director', password='secret')
+        DirectorProfile.objects.create(user=user)
+        self.client.force_login(user)
+        response = self.client.get(reverse('director_dashboard'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['completed_tests'], 2)
+
+
+class SessionDeadlineTests(TestCase):
+    """Sessions are timed by a server-side deadline; sweepers close expired and abandoned ones"""
+
+    def setUp(self):
+        trait = Trait.objects.create(name='سمة', weight=Decimal('10.00'))
+        self.keys = [
+            str(Question.objects.create(trait=trait, text=f'سؤال {i}', order=i).id)
+            for i in range(4)
+        ]
+        self.index = 0
+
+    def create_session(self, started_ago=None):
+        self.index += 1
+        registration = TestRegistration.objects.create(name='Test', email=f'deadline{self.index}@example.com')
+        session = TestSession.objects.create(registration=registration)
+        if started_ago is not None:
+            start_session_clock('adult', session)
+            TestSession.objects.filter(pk=session.pk).update(deadline=F('deadline') - started_ago)
+            session.refresh_from_db()
+        return session
+
+    def all_answers(self, value):
+        return {f'question_{key}': value for key in self.keys}
+
+    def test_clock_starts_once(self):
+        session = self.create_session()
+        self.client.cookies['test_session_id'] = str(session.pk)
+        self.client.get(reverse('take_test'))
+        session.refresh_from_db()
+        deadline = session.deadline
+        remaining = (deadline - timezone.now()).total_seconds()
+        self.assertAlmostEqual(remaining, TestSession.TIME_LIMIT.total_seconds(), delta=5)
+
+        # Reloading the page keeps the deadline
+        self.client.get(reverse('take_test'))
+        session.refresh_from_db()
+        self.assertEqual(session.deadline, deadline)
+
+    def test_submission_in_time_is_scored(self):
+        session = self.create_session(started_ago=timedelta(minutes=4))
+        result = submit_test('adult', session, self.all_answers('2'))
+        self.assertEqual(result.total_score, Decimal('100'))
+        self.assertEqual(result.time_taken_minutes, 4)
+
+    def test_late_submission_scores_only_autosaved_answers(self):
+        session = self.create_session(started_ago=timedelta(minutes=2))
+        autosave_answers('adult', session.pk, {f'question_{self.keys[0]}': '2', f'question_{self.keys[1]}': '2'})
+        TestSession.objects.filter(pk=session.pk).update(
+            deadline=timezone.now() - SUBMISSION_GRACE - timedelta(seconds=1)
+        )
+        session.refresh_from_db()
+
+        result = submit_test('adult', session, self.all_answers('2'))
+        self.assertEqual(result.total_score, Decimal('50'))
+        self.assertEqual(session.completed_at, session.deadline)
+        self.assertEqual(result.time_taken_minutes, int(TestSession.TIME_LIMIT.total_seconds() // 60))
+
+    def test_sweeper_finalizes_expired_sessions(self):
+        expired = self.create_session(started_ago=TestSession.TIME_LIMIT + timedelta(minutes=5))
+        TestSession.objects.filter(pk=expired.pk).update(answers_json={self.keys[0]: 2.0})
+        running = self.create_session(started_ago=timedelta(minutes=1))
+
+        self.assertEqual(finalize_expired_sessions('adult'), 1)
+
+        expired.refresh_from_db()
+        self.assertTrue(expired.is_completed)
+        self.assertEqual(expired.completed_at, expired.deadline)
+        self.assertTrue(expired.registration.has_taken_test)
+        result = TestResult.objects.get(session=expired)
+        self.assertEqual(result.total_score, Decimal('25.00'))
+        self.assertEqual(TraitScore.objects.filter(result=result).count(), 1)
+        self.assertTrue(CertificateJob.objects.filter(test_type='adult', result_id=result.pk).exists())
+        self.assertFalse(TestSession.objects.get(pk=running.pk).is_completed)
+        self.assertEqual(finalize_expired_sessions('adult'), 0)
+
+    def test_sweep_after_midnight_updates_the_deadline_day(self):
+        expired = self.create_session(started_ago=timedelta(days=2))
+        TestSession.objects.filter(pk=expired.pk).update(answers_json={self.keys[0]: 2.0})
+        expired.refresh_from_db()
+        deadline_day = timezone.localdate(expired.deadline)
+        self.assertLess(deadline_day, timezone.localdate())
+        get_dashboard_stats()
+
+        self.assertEqual(finalize_expired_sessions('adult'), 1)
+
+        result = TestResult.objects.get(session=expired)
+        self.assertEqual(result.created_at, expired.deadline)
+        stats = DailyStats.objects.get(test_type='adult', date=deadline_day)
+        self.assertEqual(stats.completions, 1)
+        self.assertEqual(stats.mean_score, 25.0)
+        self.assertFalse(DailyStats.objects.filter(test_type='adult', date=timezone.localdate(), completions__gt=0))
+        self.assertEqual(get_dashboard_stats()['completed_tests'], 1)
+
+    def test_sweeper_purges_abandoned_sessions(self):
+        abandoned = self.create_session()
+        recent = self.create_session()
+        started = self.create_session(started_ago=timedelta(days=2))
+        TestSession.objects.filter(pk__in=[abandoned.pk, started.pk]).update(
+            started_at=timezone.now() - timedelta(days=2)
+        )
+
+        self.assertEqual(purge_abandoned_sessions('adult', older_than=timedelta(days=1)), 1)
+        self.assertEqual(set(TestSession.objects.values_list('pk', flat=True)), {recent.pk, started.pk})
+
+    def test_sweep_command(self):
+        self.create_session(started_ago=TestSession.TIME_LIMIT + timedelta(minutes=5))
+        output = io.StringIO()
+        call_command('sweep_test_sessions', '--type', 'adult', stdout=output)
+        self.assertIn('adult: 1 finalized, 0 purged', output.getvalue())
+
+
+class HotQueryIndexTests(TestCase):
+    """The queries on the test flow and director pages are answered from an index"""
+
+    INDEX_MARKERS = {
+        'sqlite': ('USING INDEX', 'USING COVERING INDEX', 'USING INTEGER PRIMARY KEY'),
+        'postgresql': ('Index Scan', 'Index Only Scan', 'Bitmap Index Scan'),
+    }
+
+    def setUp(self):
+        if connection.vendor not in self.INDEX_MARKERS:
+            self.skipTest(f'No EXPLAIN parser for {connection.vendor}')
+        if connection.vendor == 'postgresql':
+            # Test tables are tiny, so make the planner show whether an index is usable at all
+            with connection.cursor() as cursor:
+                cursor.execute('SET LOCAL enable_seqscan = off')
+
+    def assertUsesIndex(self, queryset, index_name=None):
+        plan = queryset.explain()
+        if index_name:
+            self.assertIn(index_name, plan)
+        else:
+            self.assertTrue(any(marker in plan for marker in self.INDEX_MARKERS[connection.vendor]), plan)
+
+    def test_active_questions_in_order(self):
+        self.assertUsesIndex(
+            Question.objects.filter(is_active=True).select_related('trait').order_by('order', 'id'),
+            'question_active_order_idx'
+        )
+        self.assertUsesIndex(
+            JuniorQuestion.objects.filter(is_active=True).select_related('trait').order_by('order', 'id'),
+            'jquestion_active_order_idx'
+        )
+
+    def test_completed_sessions_by_completed_at(self):
+        self.assertUsesIndex(
+            TestSession.objects.filter(is_completed=True).order_by('-completed_at')[:5],
+            'session_completed_at_idx'
+        )
+        self.assertUsesIndex(
+            JuniorTestSession.objects.filter(is_completed=True).order_by('-completed_at')[:5],
+            'jsession_completed_at_idx'
+        )
+
+    def test_results_pages(self):
+        for model, prefix in ((TestResult, ''), (JuniorTestResult, 'j')):
+            self.assertUsesIndex(model.objects.order_by('-created_at', '-id')[:51], f'{prefix}result_created_idx')
+            self.assertUsesIndex(model.objects.order_by('total_score', 'id')[:51], f'{prefix}result_score_idx')
+
+    def test_registrations_by_date(self):
+        self.assertUsesIndex(TestRegistration.objects.order_by('-created_at')[:5], 'registration_created_idx')
+        self.assertUsesIndex(JuniorTestRegistration.objects.order_by('-created_at')[:5], 'jregistration_created_idx')
+
+    def test_point_lookups(self):
+        # Served by the unique email index and the primary key
+        for registration_model, session_model in ((TestRegistration, TestSession),
+                                                  (JuniorTestRegistration, JuniorTestSession)):
+            self.assertUsesIndex(registration_model.objects.filter(email='a@example.com', has_taken_test=True))
+            self.assertUsesIndex(session_model.objects.filter(id=1, is_completed=False))
@@ -1,8 +1,29 @@
 from django.urls import path
 from . import views
+from . import async_views
 from django.conf import settings
 from django.conf.urls.static import static
 
+
+def candidate_urlpatterns(candidate_views):
+    """Routes of the candidate flow, served by views or by their async variants in async_views"""
+    return [
+        path('test-registration/', candidate_views.TestRegistrationView.as_view(), name='test_registration'),
+        path('take-test/', candidate_views.take_test, name='take_test'),
+        path('test-result/', candidate_views.test_result, name='test_result'),
+        path('download-certificate/', candidate_views.download_certificate, name='download_certificate'),
+        path('certificate-thumbnail/', candidate_views.certificate_thumbnail, name='certificate_thumbnail'),
+
+        # Junior Test URLs
+        path('junior-test-registration/', candidate_views.JuniorTestRegistrationView.as_view(), name='junior_test_registration'),
+        path('junior-take-test/', candidate_views.junior_take_test, name='junior_take_test'),
+        path('junior-test-result/', candidate_views.junior_test_result, name='junior_test_result'),
+        path('junior-download-certificate/', candidate_views.junior_download_certificate, name='junior_download_certificate'),
+        path('junior-certificate-thumbnail/', candidate_views.junior_certificate_thumbnail,
+             name='junior_certificate_thumbnail'),
+    ]
+
+
 urlpatterns = [
     path('', views.home, name='home'),
     path('programs/', views.programs, name='programs'),
@@ -14,10 +35,7 @@ urlpatterns = [
     path('programs/program4/', views.program4, name='program4'),
     path('ilfen-test/', views.ilfen_test_view, name='ilfen_test'),
     path('junior_ilfen-test/', views.junior_ilfen_test_view, name='junior_ilfen_test'),
-    path('test-registration/', views.TestRegistrationView.as_view(), name='test_registration'),
-    path('take-test/', views.take_test, name='take_test'),
-    path('test-result/', views.test_result, name='test_result'),
-    path('download-certificate/', views.download_certificate, name='download_certificate'),
+    path('take-test/autosave/', views.take_test_autosave, name='take_test_autosave'),
 
     path('director/login/', views.director_login, name='director_login'),
     path('director/logout/', views.director_logout, name='director_logout'),
@@ -31,12 +49,12 @@ urlpatterns = [
     path('director/traits/<int:pk>/edit/', views.trait_edit, name='trait_edit'),
     path('director/traits/<int:pk>/delete/', views.trait_delete, name='trait_delete'),
     path('director/results/', views.test_results, name='test_results'),
+    path('director/results/export/', views.export_results, name='export_results'),
+    path('director/metrics/', views.director_metrics, name='director_metrics'),
+    path('metrics', views.metrics, name='metrics'),
 
     # Junior Test URLs
-    path('junior-test-registration/', views.JuniorTestRegistrationView.as_view(), name='junior_test_registration'),
-    path('junior-take-test/', views.junior_take_test, name='junior_take_test'),
-    path('junior-test-result/', views.junior_test_result, name='junior_test_result'),
-    path('junior-download-certificate/', views.junior_download_certificate, name='junior_download_certificate'),
+    path('junior-take-test/autosave/', views.junior_take_test_autosave, name='junior_take_test_autosave'),
 
     # Junior Questions URLs
     path('director/junior-questions/', views.junior_question_list, name='junior_question_list'),
@@ -50,6 +68,9 @@ urlpatterns = [
     path('director/junior-traits/<int:pk>/edit/', views.junior_trait_edit, name='junior_trait_edit'),
     path('director/junior-traits/<int:pk>/delete/', views.junior_trait_delete, name='junior_trait_delete'),
 ]
+# Candidate-facing views: async variants when served over ASGI
+urlpatterns += candidate_urlpatterns(async_views if settings.ASYNC_VIEWS else views)
+
 if settings.DEBUG:
     urlpatterns += static(settings.STATIC_URL, document_root=settings.STATIC_ROOT)
     urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
\ No newline at end of file
@@ -1,298 +1,460 @@
 from decimal import Decimal
+import base64
+import json
 from PIL import Image, ImageDraw, ImageFont
 import os
 from django.conf import settings
-from .models import Question, Trait, TestResult
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from django.core.exceptions import ImproperlyConfigured
+from arabic_reshaper import reshape
+from bidi.algorithm import get_display
 
 
-def calculate_test_results(session):
-    """
-    Calculate test results following the exact methodology from documentation:
-    1. For each trait: percentage = score / totalScore (where totalScore = questions × 2)
-    2. weightedScore = percentage × relativeWeight
-    3. Sum all weightedScores
-    4. finalScore = (Σ weightedScores / Σ relativeWeights) × 100
-    """
-    from decimal import Decimal
+from functools import lru_cache
+import hashlib
+import io
+import logging
+import threading
+import time
 
-    answers = session.get_answers()
-    traits = Trait.objects.filter(is_active=True).prefetch_related('questions')
+from .metrics import CERTIFICATE_RENDER_DURATION, CERTIFICATE_SIZE, record_cache
+from .pdf import PdfTemplate, load_font
 
-    trait_scores = {}
-    total_weighted_score = Decimal('0')
-    total_weight = Decimal('0')
 
-    for trait in traits:
-        # Get all questions for this trait
-        questions = trait.questions.filter(is_active=True)
+logger = logging.getLogger(__name__)
 
-        if not questions.exists():
-            continue
 
-        # Calculate score for this trait
-        user_score = Decimal('0')
-        max_score = Decimal('0')
+# Bump when certificate wording or layout changes, so content-addressed
+# certificate files are re-rendered instead of reused
+CERTIFICATE_LAYOUT_VERSION = '1'
 
-        for question in questions:
-            max_score += Decimal('2')  # Each question max is 2
+# Bump when the PDF serialization changes, so files written before are replaced
+CERTIFICATE_PDF_VERSION = '2'
 
-            # Get user's answer (default to 0 if not found)
-            answer_value = Decimal(str(answers.get(str(question.id), '0')))
+# Text shared by every certificate, drawn into the prepared template once
+PARTICIPATION_LABEL = "على المشاركة في اختبار السمات الريادية"
+SCORE_LABEL = "والحصول على درجة"
 
-            # Note: Reverse scoring should already be handled when saving answers
-            # Do NOT reverse here if already reversed in the view
-            user_score += answer_value
+TEXT_BLACK = (0, 0, 0, 255)
+SCORE_GOLD = (255, 192, 0, 255)
 
-        # Calculate percentage for this trait (as decimal, not ×100 yet)
-        if max_score > 0:
-            trait_percentage_decimal = user_score / max_score
-            trait_percentage_display = trait_percentage_decimal * Decimal('100')  # For display
-        else:
-            trait_percentage_decimal = Decimal('0')
-            trait_percentage_display = Decimal('0')
-
-        # Calculate weighted score (percentage × weight)
-        trait_weight = Decimal(str(trait.weight))
-        weighted_score = trait_percentage_decimal * trait_weight
-
-        # Store trait score
-        trait_scores[trait.name] = {
-            'name': trait.name,
-            'name_en': trait.name_en,
-            'percentage': float(trait_percentage_display),  # Display as 0-100
-            'user_score': float(user_score),
-            'max_score': float(max_score),
-            'weight': float(trait_weight),
-            'weighted_score': float(weighted_score)
-        }
+# Shaped names and their positions kept per template
+NAME_LAYOUT_CACHE_SIZE = 4096
 
-        total_weighted_score += weighted_score
-        total_weight += trait_weight
+CERTIFICATE_FONT = 'IBMPlexSansArabic-Regular.ttf'
 
-    # Calculate final score percentage: (sum of weighted scores / sum of weights) × 100
-    if total_weight > 0:
-        final_score = (total_weighted_score / total_weight) * Decimal('100')  # ✅ NOW MULTIPLY BY 100
-    else:
-        final_score = Decimal('0')
+# Certificate file encodings: mode -> (file extension, content type, encoder)
+CERTIFICATE_ENCODINGS = {
+    # Full-colour PNG, zlib level 6 (the original output)
+    'png': ('png', 'image/png', lambda img, fp: img.save(fp, 'PNG')),
+    # Less compression, faster to write, slightly larger files
+    'png-fast': ('png', 'image/png', lambda img, fp: img.save(fp, 'PNG', compress_level=1)),
+    # 256-colour palette, optimized: a fraction of the size at about the same cost
+    'png-small': ('png', 'image/png', lambda img, fp: img.quantize(
+        256, method=Image.Quantize.FASTOCTREE
+    ).save(fp, 'PNG', optimize=True)),
+    'webp': ('webp', 'image/webp', lambda img, fp: img.save(fp, 'WEBP', quality=90)),
+    'jpeg': ('jpg', 'image/jpeg', lambda img, fp: img.save(fp, 'JPEG', quality=90, optimize=True)),
+}
 
-    # Create or update result
-    result, created = TestResult.objects.update_or_create(
-        session=session,
-        defaults={
-            'total_score': final_score,  # This should now be 0-100 range
-        }
-    )
+CERTIFICATE_CONTENT_TYPES = {extension: content_type for extension, content_type, _ in CERTIFICATE_ENCODINGS.values()}
+CERTIFICATE_CONTENT_TYPES['pdf'] = 'application/pdf'
 
-    result.set_trait_scores(trait_scores)
+# Preview on the result pages: half the template size (a cheap box reduce), as WebP
+CERTIFICATE_THUMBNAIL_REDUCE = 2
+CERTIFICATE_THUMBNAIL_QUALITY = 85
 
-    # Calculate time taken
-    if session.completed_at and session.started_at:
-        time_diff = session.completed_at - session.started_at
-        result.time_taken_minutes = int(time_diff.total_seconds() / 60)
-        result.save()
 
-    return result
+class CertificateRenderer:
+    """
+    Process-level cache for one certificate template.
 
-from decimal import Decimal
-from PIL import Image, ImageDraw, ImageFont
-import os
-from django.conf import settings
-from datetime import datetime
-from arabic_reshaper import reshape
-from bidi.algorithm import get_display
+    The template is opened, converted and has its white cover rectangles painted
+    exactly once; fonts are loaded once per size. The constant labels are drawn
+    into the base image and the position of every score from 0% to 100% is
+    measured up front, so each render gets a cheap copy of the prepared base
+    image and only lays out the participant's name (LRU-cached).
+    """
+
+    def __init__(self, template_name, font_sizes, cover_boxes):
+        self.template_name = template_name
+        self.font_sizes = font_sizes
+        self.cover_boxes = cover_boxes  # callable: (width, height) -> list of rectangles
+        self._base = None
+        self._fonts = None
+        self._version = None
+        self._labels = None
+        self._background = None
+        self._score_x = None
+        self._name_layout = None
+        self._centered_x = None
+        self._pdf = None
+        self._placeholder = None
+        self._lock = threading.Lock()
+
+    @property
+    def template_path(self):
+        return os.path.join(settings.BASE_DIR, 'static', 'images', self.template_name)
+
+    @property
+    def font_path(self):
+        return os.path.join(settings.BASE_DIR, 'static', 'fonts', CERTIFICATE_FONT)
+
+    def load(self):
+        """Load template and fonts if not loaded yet (safe to call from many threads)"""
+        if self._base is not None:
+            return
+        with self._lock:
+            if self._base is not None:
+                return
+
+            if not os.path.exists(self.template_path):
+                raise FileNotFoundError(f"Certificate template not found at {self.template_path}")
+
+            # Template version: changes whenever the template image or layout changes
+            with open(self.template_path, 'rb') as f:
+                digest = hashlib.sha1(f.read())
+            digest.update(f"{CERTIFICATE_LAYOUT_VERSION}|{sorted(self.font_sizes.items())}".encode())
+
+            # Cover existing content areas with white, then drop the alpha channel:
+            # text is drawn straight onto an RGB copy, which is what compositing a
+            # text overlay and converting to RGB produced before
+            base = Image.open(self.template_path).convert('RGBA')
+            overlay = Image.new('RGBA', base.size, (255, 255, 255, 0))
+            draw = ImageDraw.Draw(overlay)
+            for box in self.cover_boxes(*base.size):
+                draw.rectangle(box, fill=(255, 255, 255, 255))
+            base = Image.alpha_composite(base, overlay).convert('RGB')
+
+            # Load fonts with error handling
+            try:
+                fonts = {role: ImageFont.truetype(self.font_path, size) for role, size in self.font_sizes.items()}
+            except Exception:
+                logger.exception('Certificate font %s could not be loaded, using the default font', self.font_path)
+                default = ImageFont.load_default()
+                fonts = {role: default for role in self.font_sizes}
+
+            width = base.size[0]
+            draw = ImageDraw.Draw(base)
+
+            def centered_x(text, font):
+                bbox = draw.textbbox((0, 0), text, font=font)
+                return (width - (bbox[2] - bbox[0])) // 2
+
+            labels = []
+            for label, y in ((PARTICIPATION_LABEL, 430), (SCORE_LABEL, 460)):
+                label_text = prepare_arabic_text(label)
+                labels.append(('label', label_text, (centered_x(label_text, fonts['label']), y), TEXT_BLACK))
+            # The PDF draws the labels as text on the background without them
+            background = base.copy()
+            for role, text, position, fill in labels:
+                draw.text(position, text, fill=fill, font=fonts[role])
+
+            score_x = [centered_x(f'{score}%', fonts['score']) for score in range(101)]
+
+            @lru_cache(maxsize=NAME_LAYOUT_CACHE_SIZE)
+            def name_layout(name):
+                name_text = prepare_arabic_text(name)
+                return name_text, centered_x(name_text, fonts['name'])
+
+            self._fonts = fonts
+            self._labels = labels
+            self._background = background
+            self._score_x = score_x
+            self._name_layout = name_layout
+            self._centered_x = centered_x
+            self._version = digest.hexdigest()[:16]
+            self._base = base
+
+    def reset(self):
+        """Forget the cached template and fonts (e.g. after the template file changed)"""
+        with self._lock:
+            self._base = None
+            self._fonts = None
+            self._version = None
+            self._labels = None
+            self._background = None
+            self._score_x = None
+            self._name_layout = None
+            self._centered_x = None
+            self._pdf = None
+            self._placeholder = None
+
+    @property
+    def version(self):
+        self.load()
+        return self._version
+
+    def content_key(self, *parts):
+        """Hash of the template version and everything drawn on the certificate"""
+        payload = '|'.join([self.version] + [str(part) for part in parts])
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()[:40]
+
+    def canvas(self):
+        """Return (image, draw, fonts) for a new certificate"""
+        self.load()
+        img = self._base.copy()
+        return img, ImageDraw.Draw(img), self._fonts
+
+    def texts(self, name, score):
+        """(font role, text, position, fill) of the centred participant name and the gold percentage score"""
+        name_text, name_x = self._name_layout(name)
+
+        score = round(score)
+        score_text = f"{score}%"
+        if 0 <= score <= 100:
+            score_x = self._score_x[score]
+        else:
+            score_x = self._centered_x(score_text, self._fonts['score'])
+        return [
+            ('name', name_text, (name_x, 310), TEXT_BLACK),
+            ('score', score_text, (score_x, 490), SCORE_GOLD),
+        ]
+
+    def draw_text(self, draw, name, score):
+        """Draw the centred participant name and the gold percentage score"""
+        for role, text, position, fill in self.texts(name, score):
+            draw.text(position, text, fill=fill, font=self._fonts[role])
+
+    def placeholder_thumbnail(self):
+        """WebP preview of the template without any text, shown until a certificate is rendered"""
+        self.load()
+        if self._placeholder is None:
+            with self._lock:
+                if self._placeholder is None:
+                    buffer = io.BytesIO()
+                    self._background.reduce(CERTIFICATE_THUMBNAIL_REDUCE).save(
+                        buffer, 'WEBP', quality=CERTIFICATE_THUMBNAIL_QUALITY
+                    )
+                    self._placeholder = buffer.getvalue()
+        return self._placeholder
+
+    def pdf(self, name, score, dated=None):
+        """
+        The certificate as a PDF: the template without any text as a shared
+        image, with the labels, name, score and optional (text, position) date
+        drawn as text in the embedded font. Centred lines are centred with the
+        font's own widths, which differ slightly from the hinted raster ones.
+        """
+        self.load()
+        if self._pdf is None:
+            with self._lock:
+                if self._pdf is None:
+                    self._pdf = PdfTemplate(self._background, load_font(self.font_path))
+
+        texts = [(role, text, (None, y), fill) for role, text, (_, y), fill in self._labels + self.texts(name, score)]
+        if dated:
+            date_text, date_position = dated
+            texts.append(('date', date_text, date_position, TEXT_BLACK))
+        return self._pdf.build([
+            (text, position, self.font_sizes[role], self._fonts[role].getmetrics()[0], fill)
+            for role, text, position, fill in texts
+        ])
+
+
+ADULT_CERTIFICATE = CertificateRenderer(
+    'Frame 2 Gold.png',
+    {'name': 70, 'label': 24, 'score': 40, 'date': 22},
+    lambda width, height: [
+        [(80, 310), (width - 80, 430)],
+        [(width // 2 - 220, 430), (width // 2 + 220, 520)],
+        [(100, 680), (370, 750)],
+    ],
+)
+
+JUNIOR_CERTIFICATE = CertificateRenderer(
+    'image.png',
+    {'name': 70, 'label': 24, 'score': 40, 'date': 20},
+    lambda width, height: [
+        [(80, 310), (width - 80, 430)],
+        [(width // 2 - 260, 430), (width // 2 + 260, 550)],
+        [(100, 680), (370, 750)],
+    ],
+)
+
+
+def warm_certificate_renderers():
+    """Preload both certificate templates and their fonts (called at worker start)"""
+    for renderer in (ADULT_CERTIFICATE, JUNIOR_CERTIFICATE):
+        try:
+            renderer.load()
+        except FileNotFoundError as e:
+            logger.warning('Certificate warm-up skipped: %s', e)
+
+
+def prepare_arabic_text(text):
+    """Reshape and reorder Arabic text for drawing"""
+    reshaped_text = reshape(text)
+    return get_display(reshaped_text)
+
+
+def certificate_encoding(kind):
+    """Encoding mode configured for a test type in settings.CERTIFICATE_ENCODING (default 'png')"""
+    mode = getattr(settings, 'CERTIFICATE_ENCODING', {}).get(kind, 'png')
+    if mode not in CERTIFICATE_ENCODINGS:
+        raise ImproperlyConfigured(
+            f"CERTIFICATE_ENCODING['{kind}'] must be one of {', '.join(CERTIFICATE_ENCODINGS)}, not {mode!r}"
+        )
+    return mode
+
+
+def _save_certificate(img, filepath, encode):
+    """Write the image under a temporary name and move it into place atomically"""
+    tmp_path = f'{filepath}.{os.getpid()}.{threading.get_ident()}.tmp'
+    encode(img, tmp_path)
+    os.replace(tmp_path, filepath)
+
+
+def _record_render(kind, started, filepath):
+    """Render time and file size of a freshly rendered certificate"""
+    CERTIFICATE_RENDER_DURATION.observe(time.perf_counter() - started, test_type=kind)
+    CERTIFICATE_SIZE.observe(os.path.getsize(filepath), test_type=kind)
+
+
+# Per test type: renderer, directory under MEDIA_ROOT, file name prefix and date position
+CERTIFICATE_LAYOUTS = {
+    'adult': (ADULT_CERTIFICATE, ('certificates',), 'certificate_', (160, 695)),
+    'junior': (JUNIOR_CERTIFICATE, ('certificates', 'junior'), 'junior_certificate_', (160, 680)),
+}
+
+
+def certificate_fields(kind, registration, result):
+    """(name, rounded score, date text) drawn on the certificate of a result"""
+    if kind == 'adult':
+        date_text = result.created_at.strftime("%Y/%m/%d")
+    else:
+        date_text = ''
+        if hasattr(result.session, 'started_at') and result.session.started_at:
+            date_text = result.session.started_at.strftime("%Y/%m/%d")
+    return registration.name, round(result.total_score), date_text
 
 
-def generate_certificate(registration, result):
+def certificate_relative_path(kind, name, score, date_text):
     """
-    Generate an adult certificate with proper Arabic text handling
+    Path under MEDIA_ROOT of the certificate with these contents. Files are
+    named by a hash of the template version, name, score and date, so an
+    identical certificate is reused instead of rendered again.
     """
-    from arabic_reshaper import reshape
-    from bidi.algorithm import get_display
+    renderer, directory, prefix, _ = CERTIFICATE_LAYOUTS[kind]
+    encoding = certificate_encoding(kind)
+    extension, _, _ = CERTIFICATE_ENCODINGS[encoding]
+    # The default encoding keeps the key it had before modes existed, so its files stay valid
+    parts = [name, score, date_text] + ([encoding] if encoding != 'png' else [])
+    key = renderer.content_key(*parts)
+    return os.path.join(*directory, f'{prefix}{key}.{extension}')
 
-    template_path = os.path.join(settings.BASE_DIR, 'static', 'images', 'Frame 2 Gold.png')
 
-    if not os.path.exists(template_path):
-        raise FileNotFoundError(f"Certificate template not found at {template_path}")
+def draw_certificate(kind, name, score, date_text):
+    """The certificate image with these contents, before encoding"""
+    renderer, _, _, date_position = CERTIFICATE_LAYOUTS[kind]
+    img, draw, fonts = renderer.canvas()
 
-    # Load and prepare image
-    img = Image.open(template_path).convert('RGBA')
-    overlay = Image.new('RGBA', img.size, (255, 255, 255, 0))
-    draw = ImageDraw.Draw(overlay)
+    renderer.draw_text(draw, name, score)
 
-    width, height = img.size
+    # Draw issue date (junior: start date, when known)
+    if date_text:
+        draw.text(date_position, date_text, fill=(0, 0, 0, 255), font=fonts['date'])
+    return img
+
+
+def render_certificate_file(kind, name, score, date_text, overwrite=False):
+    """Render the certificate with these contents unless the file already exists; returns its relative path"""
+    relative_path = certificate_relative_path(kind, name, score, date_text)
+    filepath = os.path.join(settings.MEDIA_ROOT, relative_path)
+
+    reused = not overwrite and os.path.exists(filepath)
+    record_cache('certificate_file', reused)
+    if reused:
+        return relative_path
+
+    started = time.perf_counter()
+    img = draw_certificate(kind, name, score, date_text)
+    os.makedirs(os.path.dirname(filepath), exist_ok=True)
+    _save_certificate(img, filepath, CERTIFICATE_ENCODINGS[certificate_encoding(kind)][2])
+    _record_render(kind, started, filepath)
+    _save_certificate_thumbnail(img, relative_path)
 
-    # Load fonts with error handling
-    try:
-        font_path = os.path.join(settings.BASE_DIR, 'static', 'fonts', 'IBMPlexSansArabic-Regular.ttf')
-        font_name = ImageFont.truetype(font_path, 70)
-        font_label = ImageFont.truetype(font_path, 24)
-        font_score = ImageFont.truetype(font_path, 40)
-        font_date = ImageFont.truetype(font_path, 22)
-    except Exception as e:
-        print(f"Font loading error: {e}")
-        font_name = font_label = font_score = font_date = ImageFont.load_default()
-
-    # Colors
-    black = (0, 0, 0, 255)
-    gold = (255, 192, 0, 255)
-    white = (255, 255, 255, 255)
-
-    # Cover existing content areas with white
-    draw.rectangle([(80, 310), (width - 80, 430)], fill=white)
-    draw.rectangle([(width // 2 - 220, 430), (width // 2 + 220, 520)], fill=white)
-    draw.rectangle([(100, 680), (370, 750)], fill=white)
-
-    # Process Arabic text helper
-    def prepare_arabic_text(text):
-        reshaped_text = reshape(text)
-        return get_display(reshaped_text)
-
-    # Draw participant name
-    name_text = prepare_arabic_text(registration.name)
-    name_bbox = draw.textbbox((0, 0), name_text, font=font_name)
-    name_width = name_bbox[2] - name_bbox[0]
-    name_x = (width - name_width) // 2
-    draw.text((name_x, 310), name_text, fill=black, font=font_name)
-
-    # Arabic text strings - stored correctly in source code
-    participation_label = "على المشاركة في اختبار السمات الريادية"
-    score_label_text = "والحصول على درجة"
-
-    # Draw participation label
-    participation_text = prepare_arabic_text(participation_label)
-    label_bbox = draw.textbbox((0, 0), participation_text, font=font_label)
-    label_width = label_bbox[2] - label_bbox[0]
-    label_x = (width - label_width) // 2
-    draw.text((label_x, 430), participation_text, fill=black, font=font_label)
-
-    # Draw score label
-    score_label = prepare_arabic_text(score_label_text)
-    label2_bbox = draw.textbbox((0, 0), score_label, font=font_label)
-    label2_width = label2_bbox[2] - label2_bbox[0]
-    label2_x = (width - label2_width) // 2
-    draw.text((label2_x, 460), score_label, fill=black, font=font_label)
-
-    # Draw percentage score (gold color)
-    score_text = f"{round(result.total_score)}%"
-    score_bbox = draw.textbbox((0, 0), score_text, font=font_score)
-    score_width = score_bbox[2] - score_bbox[0]
-    score_x = (width - score_width) // 2
-    draw.text((score_x, 490), score_text, fill=gold, font=font_score)
-
-    # Draw issue date
-    date_text = result.created_at.strftime("%Y/%m/%d")
-    draw.text((160, 695), date_text, fill=black, font=font_date)
-
-    # Composite and save
-    img = Image.alpha_composite(img, overlay)
-    img = img.convert('RGB')
-
-    certificates_dir = os.path.join(settings.MEDIA_ROOT, 'certificates')
-    os.makedirs(certificates_dir, exist_ok=True)
-
-    filename = f'certificate_{registration.id}_{datetime.now().strftime("%Y%m%d_%H%M%S")}.png'
-    filepath = os.path.join(certificates_dir, filename)
-    img.save(filepath, 'PNG', quality=95)
-
-    relative_path = os.path.join('certificates', filename)
     return relative_path
 
 
-def generate_junior_certificate(registration, result):
+def certificate_thumbnail_path(certificate_path):
+    """Path under MEDIA_ROOT of the preview thumbnail of a certificate file"""
+    directory, filename = os.path.split(certificate_path)
+    return os.path.join(directory, 'thumbnails', f'{os.path.splitext(filename)[0]}.webp')
+
+
+def _save_certificate_thumbnail(img, certificate_path):
+    filepath = os.path.join(settings.MEDIA_ROOT, certificate_thumbnail_path(certificate_path))
+    os.makedirs(os.path.dirname(filepath), exist_ok=True)
+    _save_certificate(
+        img.reduce(CERTIFICATE_THUMBNAIL_REDUCE), filepath,
+        lambda thumbnail, fp: thumbnail.save(fp, 'WEBP', quality=CERTIFICATE_THUMBNAIL_QUALITY)
+    )
+
+
+def certificate_thumbnail_file(certificate_path):
     """
-    Generate a junior certificate with proper Arabic text handling
+    Path under MEDIA_ROOT of the thumbnail of a certificate file, made from
+    the file first if it predates thumbnails
     """
-    from arabic_reshaper import reshape
-    from bidi.algorithm import get_display
+    thumbnail_path = certificate_thumbnail_path(certificate_path)
+    if not os.path.exists(os.path.join(settings.MEDIA_ROOT, thumbnail_path)):
+        with Image.open(os.path.join(settings.MEDIA_ROOT, certificate_path)) as img:
+            _save_certificate_thumbnail(img.convert('RGB'), certificate_path)
+    return thumbnail_path
+
+
+def certificate_placeholder_thumbnail(kind):
+    """WebP bytes of the empty certificate template of a test type, at thumbnail size"""
+    return CERTIFICATE_LAYOUTS[kind][0].placeholder_thumbnail()
+
+
+def certificate_pdf_relative_path(kind, name, score, date_text):
+    """Path under MEDIA_ROOT of the PDF certificate with these contents, next to the images"""
+    renderer, directory, prefix, _ = CERTIFICATE_LAYOUTS[kind]
+    key = renderer.content_key(name, score, date_text, 'pdf', CERTIFICATE_PDF_VERSION)
+    return os.path.join(*directory, f'{prefix}{key}.pdf')
+
+
+def render_certificate_pdf_file(kind, name, score, date_text):
+    """Write the PDF certificate with these contents unless it already exists; returns its relative path"""
+    renderer, _, _, date_position = CERTIFICATE_LAYOUTS[kind]
+    relative_path = certificate_pdf_relative_path(kind, name, score, date_text)
+    filepath = os.path.join(settings.MEDIA_ROOT, relative_path)
+
+    reused = os.path.exists(filepath)
+    record_cache('certificate_pdf', reused)
+    if reused:
+        return relative_path
+
+    data = renderer.pdf(name, score, (date_text, date_position) if date_text else None)
+    os.makedirs(os.path.dirname(filepath), exist_ok=True)
+    tmp_path = f'{filepath}.{os.getpid()}.{threading.get_ident()}.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+    os.replace(tmp_path, filepath)
+    return relative_path
 
-    template_path = os.path.join(settings.BASE_DIR, 'static', 'images', 'image.png')
 
-    if not os.path.exists(template_path):
-        raise FileNotFoundError(f"Junior certificate template not found at {template_path}")
+def generate_certificate(registration, result):
+    """Generate an adult certificate with proper Arabic text handling"""
+    return render_certificate_file('adult', *certificate_fields('adult', registration, result))
 
-    # Load and prepare image
-    img = Image.open(template_path).convert('RGBA')
-    overlay = Image.new('RGBA', img.size, (255, 255, 255, 0))
-    draw = ImageDraw.Draw(overlay)
 
-    width, height = img.size
+def generate_junior_certificate(registration, result):
+    """Generate a junior certificate with proper Arabic text handling"""
+    return render_certificate_file('junior', *certificate_fields('junior', registration, result))
 
-    # Load fonts
-    try:
-        font_path = os.path.join(settings.BASE_DIR, 'static', 'fonts', 'IBMPlexSansArabic-Regular.ttf')
-        font_name = ImageFont.truetype(font_path, 70)
-        font_label = ImageFont.truetype(font_path, 24)
-        font_score = ImageFont.truetype(font_path, 40)
-        font_date = ImageFont.truetype(font_path, 20)
-    except Exception as e:
-        print(f"Font loading error: {e}")
-        font_name = font_label = font_score = font_date = ImageFont.load_default()
-
-    # Colors
-    black = (0, 0, 0, 255)
-    gold = (255, 192, 0, 255)
-    white = (255, 255, 255, 255)
-
-    # Cover existing content with white rectangles
-    draw.rectangle([(80, 310), (width - 80, 430)], fill=white)
-    draw.rectangle([(width // 2 - 260, 430), (width // 2 + 260, 550)], fill=white)
-    draw.rectangle([(100, 680), (370, 750)], fill=white)
-
-    # Process Arabic text helper
-    def prepare_arabic_text(text):
-        reshaped_text = reshape(text)
-        return get_display(reshaped_text)
-
-    # Draw participant name
-    name_text = prepare_arabic_text(registration.name)
-    name_bbox = draw.textbbox((0, 0), name_text, font=font_name)
-    name_width = name_bbox[2] - name_bbox[0]
-    name_x = (width - name_width) // 2
-    draw.text((name_x, 310), name_text, fill=black, font=font_name)
-
-    # Arabic text strings - stored correctly in source code
-    participation_label = "على المشاركة في اختبار السمات الريادية"
-    score_label_text = "والحصول على درجة"
-
-    # Draw participation label
-    participation_text = prepare_arabic_text(participation_label)
-    label_bbox = draw.textbbox((0, 0), participation_text, font=font_label)
-    label_width = label_bbox[2] - label_bbox[0]
-    label_x = (width - label_width) // 2
-    draw.text((label_x, 430), participation_text, fill=black, font=font_label)
-
-    # Draw score label
-    score_label = prepare_arabic_text(score_label_text)
-    label2_bbox = draw.textbbox((0, 0), score_label, font=font_label)
-    label2_width = label2_bbox[2] - label2_bbox[0]
-    label2_x = (width - label2_width) // 2
-    draw.text((label2_x, 460), score_label, fill=black, font=font_label)
-
-    # Draw percentage score (gold color)
-    score_text = f"{round(result.total_score)}%"
-    score_bbox = draw.textbbox((0, 0), score_text, font=font_score)
-    score_width = score_bbox[2] - score_bbox[0]
-    score_x = (width - score_width) // 2
-    draw.text((score_x, 490), score_text, fill=gold, font=font_score)
-
-    # Draw start date
-    if hasattr(result.session, 'started_at') and result.session.started_at:
-        start_date = result.session.started_at.strftime("%Y/%m/%d")
-        draw.text((160, 680), start_date, fill=black, font=font_date)
-
-    # Composite and save
-    img = Image.alpha_composite(img, overlay)
-    img = img.convert('RGB')
-
-    certificates_dir = os.path.join(settings.MEDIA_ROOT, 'certificates', 'junior')
-    os.makedirs(certificates_dir, exist_ok=True)
-
-    filename = f'junior_certificate_{registration.id}_{datetime.now().strftime("%Y%m%d_%H%M%S")}.png'
-    filepath = os.path.join(certificates_dir, filename)
-    img.save(filepath, 'PNG', quality=95)
-
-    relative_path = os.path.join('certificates', 'junior', filename)
-    return relative_path
+
+def generate_certificate_pdf(registration, result):
+    """Generate an adult certificate as PDF, with the text in the embedded font"""
+    return render_certificate_pdf_file('adult', *certificate_fields('adult', registration, result))
+
+
+def generate_junior_certificate_pdf(registration, result):
+    """Generate a junior certificate as PDF, with the text in the embedded font"""
+    return render_certificate_pdf_file('junior', *certificate_fields('junior', registration, result))
 
 
 def get_trait_recommendations(trait_scores, total_score):
@@ -362,3 +524,73 @@ def get_overall_level(score):
             'description': 'ننصح بالعمل على تطوير السمات الريادية',
             'color': '#e74c3c'
         }
+
+
+def _encode_cursor(values):
+    return base64.urlsafe_b64encode(json.dumps(values).encode()).decode().rstrip('=')
+
+
+def _decode_cursor(cursor):
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        field_value, pk = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        pk = int(pk)
+    except (ValueError, TypeError):
+        return None
+    # Beyond the range of the id column the database would reject the query
+    if not 0 < pk < 2 ** 63:
+        return None
+    return field_value, pk
+
+
+def keyset_paginate(queryset, sort, after=None, before=None, page_size=50):
+    """
+    Keyset (seek) pagination on (sort field, id).
+
+    `sort` is a field name, optionally prefixed with '-'. `after`/`before` are
+    opaque cursors taken from a previous page. Returns (rows, next_cursor,
+    prev_cursor); a cursor is None when there is no page in that direction.
+    Every page is a single indexed range query, however deep it is. A cursor
+    that does not decode to a valid value of the sort field gives the first page.
+    """
+    descending = sort.startswith('-')
+    field = sort.lstrip('-')
+    cursor = _decode_cursor(before or after or '')
+    if cursor is not None:
+        try:
+            cursor = queryset.model._meta.get_field(field).to_python(cursor[0]), cursor[1]
+        except (ValidationError, TypeError, ValueError):
+            cursor = None
+    backwards = bool(before) and cursor is not None
+
+    # Walking backwards reverses the order, then the page is flipped back
+    forward_desc = descending != backwards
+    order = [f'-{field}', '-id'] if forward_desc else [field, 'id']
+
+    if cursor is not None:
+        field_value, pk = cursor
+        lookup = 'lt' if forward_desc else 'gt'
+        queryset = queryset.filter(
+            Q(**{f'{field}__{lookup}': field_value}) | Q(**{field: field_value, f'id__{lookup}': pk})
+        )
+
+    rows = list(queryset.order_by(*order)[:page_size + 1])
+    has_more = len(rows) > page_size
+    rows = rows[:page_size]
+    if backwards:
+        rows.reverse()
+
+    def cursor_for(row):
+        value = getattr(row, field)
+        return _encode_cursor([value.isoformat() if hasattr(value, 'isoformat') else str(value), row.pk])
+
+    if not rows:
+        return rows, None, None
+
+    if backwards:
+        next_cursor = cursor_for(rows[-1])
+        prev_cursor = cursor_for(rows[0]) if has_more else None
+    else:
+        next_cursor = cursor_for(rows[-1]) if has_more else None
+        prev_cursor = cursor_for(rows[0]) if cursor is not None else None
+    return rows, next_cursor, prev_cursor
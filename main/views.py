@@ -71,11 +71,21 @@ from django.utils import timezone
 from django.db import transaction
 from datetime import timedelta
 from decimal import Decimal
+import hmac
 import json
 
 from .forms import TestRegistrationForm
 from .models import TestRegistration, Question, Trait, TestSession, TestResult
-from .utils import generate_certificate, calculate_test_results
+from .utils import generate_certificate
+from .certificates import certificate_response, certificate_thumbnail_url, thumbnail_response
+from .exports import EXPORT_MODELS, export_csv_response
+from .instrumentation import route_report, route_stats
+from .metrics import render_metrics
+from .stats import get_dashboard_stats
+from .scoring import get_scoring_plan
+from .services import InvalidAnswer, SessionAlreadySubmitted, start_session_clock, submit_test
+from .services import AUTOSAVE_MIN_INTERVAL, AutosaveRateLimited, autosave_answers
+from django.views.decorators.http import require_POST
 
 class TestRegistrationView(View):
     """View for test registration"""
@@ -135,6 +145,15 @@ class TestRegistrationView(View):
         return render(request, self.template_name, context)
 
 
+ANSWER_CHOICES = [
+    (2, 'ينطبق تماما'),
+    (1.5, 'ينطبق نوعا ما'),
+    (1, 'محايد (لست متأكدا)'),
+    (0.5, 'لا ينطبق نوعا ما'),
+    (0, 'لا ينطبق إطلاقا'),
+]
+
+
 def take_test(request):
     """View for taking the test"""
     # Get session from cookie
@@ -147,150 +166,80 @@ def take_test(request):
     except TestSession.DoesNotExist:
         return redirect('test_registration')
 
-    # Get all active questions
-    questions = Question.objects.filter(is_active=True).select_related('trait').order_by('order')
-
     if request.method == 'POST':
-        # Save answers - automatically assign 0 to unanswered questions
-        answers = {}
-        for question in questions:
-            answer_key = f'question_{question.id}'
-            if answer_key in request.POST:
-                raw_answer = float(request.POST[answer_key])
-
-                # Handle reverse scoring
-                if question.is_reverse_scored:
-                    # Reverse the score: 2->0, 1.5->0.5, 1->1, 0.5->1.5, 0->2
-                    raw_answer = 2.0 - raw_answer
-
-                answers[str(question.id)] = raw_answer
-            else:
-                # Assign 0 points to unanswered questions
-                answers[str(question.id)] = 0.0
-
-        # Save answers to session
-        session.set_answers(answers)
-        session.completed_at = timezone.now()
-        session.is_completed = True
-        session.save()
-
-        # Mark registration as completed
-        session.registration.has_taken_test = True
-        session.registration.save()
-
-        # Calculate results using the exact formula from documentation
-        result = calculate_test_results_exact(session)
-
-        # Generate certificate
-        certificate_path = generate_certificate(session.registration, result)
-        result.certificate_path = certificate_path
-        result.save()
+        # Score and save the submission in one transaction (unanswered questions get 0)
+        try:
+            submit_test('adult', session, request.POST)
+        except InvalidAnswer:
+            return HttpResponse('إجابات غير صالحة', status=400)
+        except SessionAlreadySubmitted:
+            pass
 
         # Redirect to results
         response = redirect('test_result')
         return response
 
-    # Get current answers if any
-    current_answers = session.get_answers()
+    # Time ran out without a submission: finalize with the autosaved answers
+    if session.is_expired():
+        try:
+            submit_test('adult', session, {})
+        except SessionAlreadySubmitted:
+            pass
+        return redirect('test_result')
+
+    # The clock starts the first time the test page is served
+    start_session_clock('adult', session)
+
+    # The question markup is cached per bank version, so this query only runs on a cache miss
+    questions = Question.objects.filter(is_active=True).select_related('trait').order_by('order', 'id')
+    plan = get_scoring_plan('adult')
+
+    # Answers saved so far are re-checked client-side
+    current_answers = plan.form_answers(session.get_answers())
 
     context = {
         'page_title': 'اختبار ILFEN - تقييم السمات الريادية',
         'questions': questions,
-        'total_questions': questions.count(),
+        'total_questions': len(plan),
+        'bank_version': plan.version,
+        'seconds_left': int(session.time_left().total_seconds()),
         'current_answers': current_answers,
         'session': session,
-        'answer_choices': [
-            (2, 'ينطبق تماما'),
-            (1.5, 'ينطبق نوعا ما'),
-            (1, 'محايد (لست متأكدا)'),
-            (0.5, 'لا ينطبق نوعا ما'),
-            (0, 'لا ينطبق إطلاقا'),
-        ]
+        'answer_choices': ANSWER_CHOICES,
     }
     return render(request, 'main/take_test.html', context)
 
 
-def calculate_test_results_exact(session):
-    """
-    Calculate test results following the EXACT methodology from documentation:
-    1. For each trait: percentage = score / totalScore (where totalScore = questions × 2)
-    2. weightedScore = percentage × relativeWeight
-    3. Sum all weightedScores
-    4. finalScore = (Σ weightedScores / Σ relativeWeights) × 100
-    """
-    from decimal import Decimal
+def autosave_response(request, kind, cookie_name):
+    """Shared body of the autosave endpoints: JSON {"question_<id>": value, ...} in, JSON out"""
+    session_id = request.COOKIES.get(cookie_name)
+    if not session_id or not session_id.isdigit():
+        return JsonResponse({'error': 'no_session'}, status=409)
 
-    answers = session.get_answers()
-    traits = Trait.objects.filter(is_active=True).prefetch_related('questions')
-
-    total_weighted_score = Decimal('0')
-    total_weights = Decimal('0')
-    trait_results = {}
-
-    for trait in traits:
-        # Get questions for this trait
-        trait_questions = trait.questions.filter(is_active=True)
-
-        if not trait_questions.exists():
-            continue
-
-        # Calculate score for this trait
-        trait_score = Decimal('0')
-        questions_count = 0
-
-        for question in trait_questions:
-            questions_count += 1
-            # Get the answer value (already reversed if needed during form submission)
-            answer_value = answers.get(str(question.id), 0.0)
-            trait_score += Decimal(str(answer_value))
-
-        # Calculate total possible score (questions_count × 2)
-        total_score = Decimal(str(questions_count * 2))
-
-        # Calculate percentage (score / totalScore)
-        if total_score > 0:
-            percentage = trait_score / total_score
-        else:
-            percentage = Decimal('0')
-
-        # Get relative weight
-        relative_weight = Decimal(str(trait.weight))
-
-        # Calculate weighted score (percentage × relativeWeight)
-        weighted_score = percentage * relative_weight
-
-        # Accumulate totals
-        total_weighted_score += weighted_score
-        total_weights += relative_weight
-
-        # Store trait result for display
-        trait_results[trait.name] = {
-            'percentage': float(percentage * 100),  # Display as 0-100%
-            'weighted_score': float(weighted_score),
-            'weight': float(relative_weight),
-            'score': float(trait_score),
-            'total_score': float(total_score),
-            'questions_count': questions_count
-        }
-
-    # Calculate final score: (totalWeightedScore / totalWeights) × 100
-    if total_weights > 0:
-        final_score = (total_weighted_score / total_weights) * Decimal('100')
-    else:
-        final_score = Decimal('0')
+    try:
+        data = json.loads(request.body or b'{}')
+    except ValueError:
+        data = None
+    if not isinstance(data, dict):
+        return JsonResponse({'error': 'invalid_json'}, status=400)
 
-    # Calculate time taken
-    time_taken = (session.completed_at - session.started_at).total_seconds() / 60
+    try:
+        saved = autosave_answers(kind, int(session_id), data)
+    except InvalidAnswer as e:
+        return JsonResponse({'error': 'invalid_answer', 'question': str(e)}, status=400)
+    except AutosaveRateLimited:
+        response = JsonResponse({'error': 'rate_limited'}, status=429)
+        response['Retry-After'] = str(AUTOSAVE_MIN_INTERVAL)
+        return response
+    except SessionAlreadySubmitted:
+        return JsonResponse({'error': 'completed'}, status=409)
+    return JsonResponse({'saved': saved})
 
-    # Create test result
-    result = TestResult.objects.create(
-        session=session,
-        total_score=final_score,
-        time_taken_minutes=int(time_taken)
-    )
 
-    result.set_trait_scores(trait_results)
-    return result
+@require_POST
+def take_test_autosave(request):
+    """Save answers of an in-progress test while the candidate is still answering"""
+    return autosave_response(request, 'adult', 'test_session_id')
 
 
 def test_result(request):
@@ -326,6 +275,7 @@ def test_result(request):
         'time_taken_minutes': time_taken_minutes,
         'time_taken_seconds': time_taken_remaining_seconds,
         'date': session.completed_at.strftime('%Y-%m-%d'),
+        'certificate_thumbnail_url': certificate_thumbnail_url('adult', result),
     }
     return render(request, 'main/test_result.html', context)
 
@@ -343,16 +293,32 @@ def download_certificate(request):
     except (TestSession.DoesNotExist, TestResult.DoesNotExist):
         return HttpResponse('لم يتم العثور على النتيجة', status=404)
 
-    # Return certificate file
-    if result.certificate_path:
-        certificate_full_path = os.path.join(settings.MEDIA_ROOT, result.certificate_path)
-        if os.path.exists(certificate_full_path):
-            with open(certificate_full_path, 'rb') as f:
-                response = HttpResponse(f.read(), content_type='image/png')
-                response['Content-Disposition'] = f'attachment; filename="ILEFN_Certificate_{session.registration.name}.png"'
-                return response
+    # Stream certificate file, rendering it now if the background job has not finished
+    try:
+        return certificate_response(
+            request, 'adult', result, f'ILEFN_Certificate_{session.registration.name}.png',
+            pdf=request.GET.get('format') == 'pdf'
+        )
+    except FileNotFoundError:
+        return HttpResponse('الشهادة غير متوفرة', status=404)
 
-    return HttpResponse('الشهادة غير متوفرة', status=404)
+
+def certificate_thumbnail(request):
+    """Small preview of the certificate shown on the result page"""
+    session_id = request.COOKIES.get('test_session_id')
+    if not session_id:
+        return HttpResponse('غير مصرح', status=403)
+
+    try:
+        session = TestSession.objects.get(id=session_id, is_completed=True)
+        result = session.result
+    except (TestSession.DoesNotExist, TestResult.DoesNotExist):
+        return HttpResponse('لم يتم العثور على النتيجة', status=404)
+
+    try:
+        return thumbnail_response(request, 'adult', result)
+    except FileNotFoundError:
+        return HttpResponse('الشهادة غير متوفرة', status=404)
 
 
 from django.shortcuts import render, redirect, get_object_or_404
@@ -365,60 +331,37 @@ from django.utils import timezone
 from datetime import timedelta
 from .models import Question, Trait, TestRegistration, TestSession, TestResult, DirectorProfile
 from .forms import DirectorLoginForm, TraitForm, QuestionForm
+from .utils import keyset_paginate
+from django.db.models import Q
 
 
 def director_login(request):
     """Director login view"""
-    print(f"=== DIRECTOR LOGIN VIEW ===")
-    print(f"Method: {request.method}")
-    print(f"User authenticated: {request.user.is_authenticated}")
-
     if request.user.is_authenticated:
         if hasattr(request.user, 'directorprofile'):
-            print("User has director profile, redirecting to dashboard")
             return redirect('director_dashboard')
         else:
-            print("User authenticated but no director profile, logging out")
             logout(request)
 
     if request.method == 'POST':
-        print("POST request received")
-        print(f"POST data: {request.POST}")
-
         form = DirectorLoginForm(request.POST)
-        print(f"Form is valid: {form.is_valid()}")
 
         if form.is_valid():
             username = form.cleaned_data['username']
             password = form.cleaned_data['password']
-            print(f"Attempting to authenticate user: {username}")
 
             user = authenticate(request, username=username, password=password)
-            print(f"Authentication result - User: {user}")
 
             if user is not None:
-                print(f"User found: {user.username}")
-                print(f"User is staff: {user.is_staff}")
-                print(f"User is superuser: {user.is_superuser}")
-                print(f"Has directorprofile: {hasattr(user, 'directorprofile')}")
-
                 # Allow staff/superusers or users with director profile
                 if hasattr(user, 'directorprofile') or user.is_staff or user.is_superuser:
                     login(request, user)
-                    print("Login successful, redirecting to dashboard")
                     return redirect('director_dashboard')
                 else:
-                    error_msg = 'ليس لديك صلاحية للوصول إلى لوحة المدير'
-                    print(f"Error: {error_msg}")
-                    form.add_error(None, error_msg)
+                    form.add_error(None, 'ليس لديك صلاحية للوصول إلى لوحة المدير')
             else:
-                error_msg = 'بيانات الدخول غير صحيحة'
-                print(f"Error: {error_msg}")
-                form.add_error(None, error_msg)
-        else:
-            print("Form errors:", form.errors)
+                form.add_error(None, 'بيانات الدخول غير صحيحة')
     else:
-        print("GET request, showing empty form")
         form = DirectorLoginForm()
 
     context = {
@@ -441,45 +384,8 @@ def director_dashboard(request):
     if not hasattr(request.user, 'directorprofile'):
         return redirect('director_login')
 
-    # Regular statistics
-    total_questions = Question.objects.count()
-    active_questions = Question.objects.filter(is_active=True).count()
-    total_traits = Trait.objects.count()
-    total_registrations = TestRegistration.objects.count()
-    completed_tests = TestSession.objects.filter(is_completed=True).count()
-
-    # Junior statistics
-    junior_total_questions = JuniorQuestion.objects.count()
-    junior_active_questions = JuniorQuestion.objects.filter(is_active=True).count()
-    junior_total_traits = JuniorTrait.objects.count()
-    junior_total_registrations = JuniorTestRegistration.objects.count()
-    junior_completed_tests = JuniorTestSession.objects.filter(is_completed=True).count()
-
-    # Recent activity
-    recent_registrations = TestRegistration.objects.order_by('-created_at')[:5]
-    recent_sessions = TestSession.objects.filter(is_completed=True).select_related('registration', 'result').order_by('-completed_at')[:5]
-
-    # Trait statistics
-    trait_stats = Trait.objects.annotate(question_count=Count('questions'))
-    junior_trait_stats = JuniorTrait.objects.annotate(question_count=Count('questions'))
-
-    context = {
-        'page_title': 'لوحة التحكم - المدير',
-        'total_questions': total_questions,
-        'active_questions': active_questions,
-        'total_traits': total_traits,
-        'total_registrations': total_registrations,
-        'completed_tests': completed_tests,
-        'junior_total_questions': junior_total_questions,
-        'junior_active_questions': junior_active_questions,
-        'junior_total_traits': junior_total_traits,
-        'junior_total_registrations': junior_total_registrations,
-        'junior_completed_tests': junior_completed_tests,
-        'recent_registrations': recent_registrations,
-        'recent_sessions': recent_sessions,
-        'trait_stats': trait_stats,
-        'junior_trait_stats': junior_trait_stats,
-    }
+    context = {'page_title': 'لوحة التحكم - المدير'}
+    context.update(get_dashboard_stats())
     return render(request, 'director/dashboard.html', context)
 
 
@@ -641,21 +547,106 @@ def trait_delete(request, pk):
     return render(request, 'director/trait_confirm_delete.html', context)
 
 
+RESULTS_PAGE_SIZE = 50
+RESULTS_SORTS = ['-created_at', 'created_at', '-total_score', 'total_score']
+
+
+def filter_results(queryset, params):
+    """Apply the director search / score filters from the query string"""
+    search = params.get('search', '').strip()
+    if search:
+        queryset = queryset.filter(
+            Q(session__registration__name__icontains=search) |
+            Q(session__registration__email__icontains=search)
+        )
+    for param, lookup in (('min_score', 'total_score__gte'), ('max_score', 'total_score__lte')):
+        try:
+            queryset = queryset.filter(**{lookup: Decimal(params[param])})
+        except (KeyError, ArithmeticError, ValueError):
+            pass
+    return queryset
+
+
+def score_distribution(queryset):
+    """Total and score-band counts in one conditional aggregate query"""
+    return queryset.aggregate(
+        total_count=Count('id'),
+        excellent_count=Count('id', filter=Q(total_score__gte=80)),
+        good_count=Count('id', filter=Q(total_score__gte=60, total_score__lt=80)),
+        average_count=Count('id', filter=Q(total_score__gte=40, total_score__lt=60)),
+        poor_count=Count('id', filter=Q(total_score__lt=40)),
+    )
+
+
 @login_required
 def test_results(request):
     """View all test results"""
     if not hasattr(request.user, 'directorprofile'):
         return redirect('director_login')
 
-    results = TestResult.objects.select_related('session__registration').order_by('-created_at')
+    results = filter_results(TestResult.objects.all(), request.GET)
+
+    sort = request.GET.get('sort')
+    if sort not in RESULTS_SORTS:
+        sort = '-created_at'
+
+    page, next_cursor, prev_cursor = keyset_paginate(
+        results.select_related('session__registration').defer('trait_scores_json', 'session__answers_json'),
+        sort,
+        after=request.GET.get('after'),
+        before=request.GET.get('before'),
+        page_size=RESULTS_PAGE_SIZE,
+    )
+
+    def page_query(**cursor):
+        params = request.GET.copy()
+        params.pop('after', None)
+        params.pop('before', None)
+        params.update(cursor)
+        return params.urlencode()
 
     context = {
         'page_title': 'نتائج الاختبارات',
-        'results': results,
+        'results': page,
+        'next_query': page_query(after=next_cursor) if next_cursor else None,
+        'prev_query': page_query(before=prev_cursor) if prev_cursor else None,
+        'first_query': page_query() if prev_cursor else None,
     }
+    context.update(score_distribution(results))
     return render(request, 'director/test_results.html', context)
 
 
+@login_required
+def export_results(request):
+    """Stream adult (?type=adult) or junior (?type=junior) results as CSV, honouring the list filters"""
+    if not hasattr(request.user, 'directorprofile'):
+        return redirect('director_login')
+
+    kind = request.GET.get('type', 'adult')
+    if kind not in EXPORT_MODELS:
+        return HttpResponse('نوع الاختبار غير معروف', status=400)
+
+    model, _ = EXPORT_MODELS[kind]
+    return export_csv_response(kind, filter_results(model.objects.all(), request.GET))
+
+
+def metrics(request):
+    """Prometheus scrape endpoint, for the METRICS_TOKEN bearer token (when one is set) or staff users"""
+    token = settings.METRICS_TOKEN
+    has_token = bool(token) and hmac.compare_digest(
+        request.headers.get('Authorization', '').encode(), f'Bearer {token}'.encode()
+    )
+    if not (has_token or request.user.is_staff):
+        return HttpResponse('غير مصرح', status=401)
+    return HttpResponse(render_metrics(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+@staff_member_required
+def director_metrics(request):
+    """Per-route latency histogram, query counts and DB time of all worker processes (JSON)"""
+    return JsonResponse(route_report(route_stats.snapshot()), json_dumps_params={'ensure_ascii': False})
+
+
 from django.shortcuts import render, redirect, get_object_or_404
 from django.http import HttpResponse, JsonResponse
 from django.views import View
@@ -742,135 +733,54 @@ def junior_take_test(request):
     except JuniorTestSession.DoesNotExist:
         return redirect('junior_test_registration')
 
-    # Get all active questions
-    questions = JuniorQuestion.objects.filter(is_active=True).select_related('trait').order_by('order')
-
     if request.method == 'POST':
-        # Save answers - handle reverse scoring
-        answers = {}
-        for question in questions:
-            answer_key = f'question_{question.id}'
-            if answer_key in request.POST:
-                raw_answer = float(request.POST[answer_key])
-
-                # Handle reverse scoring for junior questions
-                if question.is_reverse_scored:
-                    # Reverse the score: 2->0, 1.5->0.5, 1->1, 0.5->1.5, 0->2
-                    raw_answer = 2.0 - raw_answer
-
-                answers[str(question.id)] = raw_answer
-            else:
-                # Assign 0 points to unanswered questions
-                answers[str(question.id)] = 0.0
-
-        # Save answers to session
-        session.set_answers(answers)
-        session.completed_at = timezone.now()
-        session.is_completed = True
-        session.save()
-
-        # Mark registration as completed
-        session.registration.has_taken_test = True
-        session.registration.save()
-
-        # Calculate results
-        result = calculate_junior_test_results(session)
-
-        # Generate certificate
-        from .utils import generate_junior_certificate
-        certificate_path = generate_junior_certificate(session.registration, result)
-        result.certificate_path = certificate_path
-        result.save()
+        # Score and save the submission in one transaction (unanswered questions get 0)
+        try:
+            submit_test('junior', session, request.POST)
+        except InvalidAnswer:
+            return HttpResponse('إجابات غير صالحة', status=400)
+        except SessionAlreadySubmitted:
+            pass
 
         # Redirect to results
         response = redirect('junior_test_result')
         return response
 
-    # Get current answers if any
-    current_answers = session.get_answers()
+    # Time ran out without a submission: finalize with the autosaved answers
+    if session.is_expired():
+        try:
+            submit_test('junior', session, {})
+        except SessionAlreadySubmitted:
+            pass
+        return redirect('junior_test_result')
+
+    # The clock starts the first time the test page is served
+    start_session_clock('junior', session)
+
+    # The question markup is cached per bank version, so this query only runs on a cache miss
+    questions = JuniorQuestion.objects.filter(is_active=True).select_related('trait').order_by('order', 'id')
+    plan = get_scoring_plan('junior')
+
+    # Answers saved so far are re-checked client-side
+    current_answers = plan.form_answers(session.get_answers())
 
     context = {
         'page_title': 'اختبار ILFEN للناشئين - تقييم السمات الريادية',
         'questions': questions,
-        'total_questions': questions.count(),
+        'total_questions': len(plan),
+        'bank_version': plan.version,
+        'seconds_left': int(session.time_left().total_seconds()),
         'current_answers': current_answers,
         'session': session,
-        'answer_choices': [
-            (2, 'ينطبق تماما'),
-            (1.5, 'ينطبق نوعا ما'),
-            (1, 'محايد (لست متأكدا)'),
-            (0.5, 'لا ينطبق نوعا ما'),
-            (0, 'لا ينطبق إطلاقا'),
-        ]
+        'answer_choices': ANSWER_CHOICES,
     }
     return render(request, 'main/junior_take_test.html', context)
 
 
-def calculate_junior_test_results(session):
-    """Calculate test results based on the scoring logic"""
-    answers = session.get_answers()
-    questions = JuniorQuestion.objects.filter(is_active=True).select_related('trait')
-
-    # Group answers by trait
-    trait_scores = {}
-    trait_max_scores = {}
-
-    for question in questions:
-        trait_id = question.trait.id
-        trait_weight = question.trait.weight
-
-        if trait_id not in trait_scores:
-            trait_scores[trait_id] = 0
-            trait_max_scores[trait_id] = 0
-
-        # Get user's score for this question
-        user_score = answers.get(str(question.id), 0.0)
-        max_score = 2.0  # Maximum score per question
-
-        trait_scores[trait_id] += float(user_score)
-        trait_max_scores[trait_id] += max_score
-
-    # Calculate percentage for each trait
-    trait_results = {}
-    total_weighted_score = Decimal('0')
-    total_weight = Decimal('0')
-
-    for trait_id, user_score in trait_scores.items():
-        trait = JuniorTrait.objects.get(id=trait_id)
-        max_score = trait_max_scores[trait_id]
-
-        if max_score > 0:
-            trait_percentage = Decimal(str(user_score / max_score * 100))
-            trait_weight_decimal = Decimal(str(trait.weight))
-            weighted_score = (trait_percentage * trait_weight_decimal) / Decimal('100')
-
-            trait_results[trait.name] = {
-                'percentage': float(trait_percentage),
-                'weighted_score': float(weighted_score),
-                'weight': float(trait_weight_decimal)
-            }
-
-            total_weighted_score += weighted_score
-            total_weight += trait_weight_decimal
-
-    # Calculate total score
-    if total_weight > 0:
-        total_score = (total_weighted_score / total_weight) * Decimal('100')
-    else:
-        total_score = Decimal('0')
-
-    # Calculate time taken
-    time_taken = (session.completed_at - session.started_at).total_seconds() / 60
-
-    # Create test result
-    result = JuniorTestResult.objects.create(
-        session=session,
-        total_score=float(total_score),  # Convert to float for storage
-        time_taken_minutes=int(time_taken)
-    )
-
-    result.set_trait_scores(trait_results)
-    return result
+@require_POST
+def junior_take_test_autosave(request):
+    """Save answers of an in-progress junior test while the candidate is still answering"""
+    return autosave_response(request, 'junior', 'junior_test_session_id')
 
 
 def junior_test_result(request):
@@ -910,6 +820,7 @@ def junior_test_result(request):
         'time_taken_minutes': time_taken_minutes,
         'time_taken_seconds': time_taken_seconds,
         'date': session.completed_at.strftime('%Y-%m-%d'),
+        'certificate_thumbnail_url': certificate_thumbnail_url('junior', result),
     }
     return render(request, 'main/junior_test_result.html', context)
 
@@ -926,46 +837,32 @@ def junior_download_certificate(request):
     except (JuniorTestSession.DoesNotExist, JuniorTestResult.DoesNotExist):
         return HttpResponse('لم يتم العثور على النتيجة', status=404)
 
-    # Generate certificate if not exists
-    if not result.certificate_path:
-        from .utils import generate_junior_certificate
-        certificate_path = generate_junior_certificate(session.registration, result)
-        result.certificate_path = certificate_path
-        result.save()
+    # Stream certificate file, rendering it now if the background job has not finished
+    try:
+        return certificate_response(
+            request, 'junior', result, f'ILEFN_Junior_Certificate_{session.registration.name}.png',
+            pdf=request.GET.get('format') == 'pdf'
+        )
+    except FileNotFoundError:
+        return HttpResponse('الشهادة غير متوفرة', status=404)
 
-    # Return certificate file - construct full path
-    if result.certificate_path:
-        try:
-            # Construct the full file path
-            certificate_full_path = os.path.join(settings.MEDIA_ROOT, result.certificate_path)
-
-            if os.path.exists(certificate_full_path):
-                with open(certificate_full_path, 'rb') as f:
-                    response = HttpResponse(f.read(), content_type='image/png')
-                    response[
-                        'Content-Disposition'] = f'attachment; filename="ILEFN_Junior_Certificate_{session.registration.name}.png"'
-                    return response
-            else:
-                # If file doesn't exist, regenerate it
-                from .utils import generate_junior_certificate
-                certificate_path = generate_junior_certificate(session.registration, result)
-                result.certificate_path = certificate_path
-                result.save()
-
-                certificate_full_path = os.path.join(settings.MEDIA_ROOT, certificate_path)
-                if os.path.exists(certificate_full_path):
-                    with open(certificate_full_path, 'rb') as f:
-                        response = HttpResponse(f.read(), content_type='image/png')
-                        response[
-                            'Content-Disposition'] = f'attachment; filename="ILEFN_Junior_Certificate_{session.registration.name}.png"'
-                        return response
-                else:
-                    return HttpResponse('الشهادة غير متوفرة', status=404)
 
-        except FileNotFoundError:
-            return HttpResponse('الشهادة غير متوفرة', status=404)
+def junior_certificate_thumbnail(request):
+    """Small preview of the junior certificate shown on the result page"""
+    session_id = request.COOKIES.get('junior_test_session_id')
+    if not session_id:
+        return HttpResponse('غير مصرح', status=403)
+
+    try:
+        session = JuniorTestSession.objects.get(id=session_id, is_completed=True)
+        result = session.result
+    except (JuniorTestSession.DoesNotExist, JuniorTestResult.DoesNotExist):
+        return HttpResponse('لم يتم العثور على النتيجة', status=404)
 
-    return HttpResponse('الشهادة غير متوفرة', status=404)
+    try:
+        return thumbnail_response(request, 'junior', result)
+    except FileNotFoundError:
+        return HttpResponse('الشهادة غير متوفرة', status=404)
 
 
 from .forms import JuniorQuestionForm,JuniorTraitForm
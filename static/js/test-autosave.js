@@ -0,0 +1,76 @@
+// Test answers autosave
+// Changed answers are sent to the server in small batches while the candidate
+// answers, so a reload or a crashed browser does not lose them. The final submit
+// then only posts the answers the server does not have yet.
+function setupTestAutosave(form, url, savedAnswers) {
+    const csrfToken = form.querySelector('input[name="csrfmiddlewaretoken"]').value;
+    const saved = Object.assign({}, savedAnswers);
+    let pending = {};
+    let inFlight = false;
+    let timer = null;
+
+    function schedule(delay) {
+        if (!timer) {
+            timer = setTimeout(flush, delay);
+        }
+    }
+
+    function flush() {
+        timer = null;
+        if (inFlight || Object.keys(pending).length === 0) {
+            return;
+        }
+
+        const batch = pending;
+        pending = {};
+        inFlight = true;
+
+        fetch(url, {
+            method: 'POST',
+            credentials: 'same-origin',
+            headers: {
+                'Content-Type': 'application/json',
+                'X-CSRFToken': csrfToken
+            },
+            body: JSON.stringify(batch)
+        }).then(response => {
+            if (response.ok) {
+                Object.assign(saved, batch);
+            } else if (response.status === 429) {
+                // Too soon: retry later, newer answers win over the batch
+                pending = Object.assign(batch, pending);
+                const retryAfter = parseInt(response.headers.get('Retry-After'), 10) || 2;
+                schedule(retryAfter * 1000);
+            }
+            // Other errors are left to the final submit, which posts unsaved answers
+        }).catch(() => {
+            pending = Object.assign(batch, pending);
+            schedule(5000);
+        }).finally(() => {
+            inFlight = false;
+            if (Object.keys(pending).length) {
+                schedule(2000);
+            }
+        });
+    }
+
+    form.querySelectorAll('input[type="radio"]').forEach(radio => {
+        radio.addEventListener('change', function() {
+            if (this.checked) {
+                pending[this.name] = this.value;
+                schedule(2000);
+            }
+        });
+    });
+
+    return {
+        // Leave out answers the server already has so the final POST stays small
+        prepareSubmit() {
+            form.querySelectorAll('input[type="radio"]:checked').forEach(radio => {
+                if (saved[radio.name] === radio.value && !(radio.name in pending)) {
+                    radio.disabled = true;
+                }
+            });
+        }
+    };
+}